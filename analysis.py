@@ -0,0 +1,254 @@
+#!/usr/bin/python3
+"""
+     This file is part of Gutenberg Graphalyzer
+     Gutenberg Graphalyzer is free software: you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     Gutenberg Graphalyzer is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU General Public License for more details.
+
+     You should have received a copy of the GNU General Public License
+     along with Gutenberg Graphalyzer.  If not, see <http://www.gnu.org/licenses/>.
+
+Grouped statistics of the experiment metrics.
+
+grouped_stats loads every (group, experiment) pair with a single query and
+computes the count, mean, standard deviation and quantiles of each group
+in one vectorized pass: the values are sorted by group and value once, the
+sums are reduceat calls over the group boundaries and the quantiles are
+read off the sorted values. Groups are
+
+    decade -- birth decade of the book's authors, from the bookdecades
+              table of migrate-db.py when it exists. A book with authors
+              born in several decades counts in each of them.
+    lcc    -- LCC subject.
+    lcsh   -- LCSH subject.
+
+Run it as a script to print the statistics, e.g.
+
+    analysis.py -d results/catalog.db -m ivdnorm,sinorm -b decade
+"""
+
+import argparse
+import sqlite3
+import sys
+import numpy as np
+
+import metrics
+
+GROUPINGS = ["decade", "lcc", "lcsh"]
+
+DEFAULT_QUANTILES = [0.25, 0.5, 0.75]
+
+# Every pair of a group and an experiment row, with the metrics appended.
+# DISTINCT drops the repeats of books listed twice under a group.
+_DECADE_QUERY = """SELECT DISTINCT bd.decade, exp.runID%(metrics)s
+        FROM bookdecades bd, experiments exp
+        WHERE exp.etextID = bd.etextID%(where)s"""
+
+# Without migrate-db.py the decade is computed from the birth text, like
+# result-analysis.r used to
+_DECADE_FALLBACK_QUERY = """SELECT DISTINCT (CAST(ad.birth AS INTEGER) / 10) * 10, exp.runID%(metrics)s
+        FROM authordetails ad, bookauthors ba, experiments exp
+        WHERE ad.authorID = ba.%(author)s AND exp.etextID = ba.etextID
+        AND CAST(ad.birth AS INTEGER) > 0%(where)s"""
+
+_SUBJECT_QUERY = """SELECT DISTINCT s.subject, exp.runID%(metrics)s
+        FROM %(table)smap m, %(table)ssubjects s, experiments exp
+        WHERE s.subjectID = m.subjectID AND exp.etextID = m.etextID%(where)s"""
+
+
+def columns(dbconn, table):
+    return [row[1] for row in dbconn.execute("PRAGMA table_info(%s)" % table)]
+
+"""
+Name of the author column of bookauthors. Older experiment databases
+call it authorname, see results/clean-experiment.db.
+"""
+def author_column(dbconn):
+
+    if "authorID" in columns(dbconn, "bookauthors"):
+        return "authorID"
+
+    return "authorname"
+
+#END author_column
+
+"""
+Runs the query of a grouping and returns the group keys and a dictionary
+of metric name to a float array, one entry per row. NULL metrics are NaN.
+"""
+def load_groups(dbconn, metric_names, by="decade", version=None):
+
+    for name in metric_names:
+        if name not in metrics.METRIC_NAMES + metrics.DISTANCE_METRIC_NAMES:
+            raise ValueError("unknown metric %r" % name)
+    #END for
+
+    if by not in GROUPINGS:
+        raise ValueError("unknown grouping %r, expected one of %s" % (by, ", ".join(GROUPINGS)))
+
+    params = {"metrics": "".join(", exp.%s" % name for name in metric_names), "where": ""}
+    args = []
+    if version is not None:
+        params["where"] = " AND exp.versionnumber = ?"
+        args.append(version)
+    #END if
+
+    if by == "decade":
+        tables = set(row[0] for row in dbconn.execute("SELECT name FROM sqlite_master WHERE type='table'"))
+        if "bookdecades" in tables:
+            query = _DECADE_QUERY
+        else:
+            params["author"] = author_column(dbconn)
+            query = _DECADE_FALLBACK_QUERY
+        #END if
+    else:
+        params["table"] = by
+        query = _SUBJECT_QUERY
+    #END if
+
+    rows = dbconn.execute(query % params, args).fetchall()
+
+    keys = [row[0] for row in rows]
+    values = {}
+    for i, name in enumerate(metric_names):
+        values[name] = np.array([row[i + 2] for row in rows], dtype=np.float64)
+    #END for
+
+    return keys, values
+
+#END load_groups
+
+"""
+Statistics of values per group. keys and values are parallel; NaN values
+are left out. Returns a dictionary of parallel arrays sorted by group:
+
+    group     -- the group key
+    count     -- number of values
+    mean, sd  -- mean and sample standard deviation (NaN below 2 values)
+    q<p>      -- the quantiles, e.g. q0.5 for the median, interpolated
+                 linearly between the order statistics like numpy and R do
+"""
+def summarize(keys, values, quantiles=DEFAULT_QUANTILES):
+
+    keys = np.asarray(keys, dtype=object)
+    values = np.asarray(values, dtype=np.float64)
+    keep = ~np.isnan(values) & np.array([key is not None for key in keys], dtype=bool)
+    keys = keys[keep]
+    values = values[keep]
+
+    result = {"group": np.empty(0, dtype=object), "count": np.empty(0, dtype=np.int64),
+            "mean": np.empty(0), "sd": np.empty(0)}
+    for q in quantiles:
+        result["q%g" % q] = np.empty(0)
+
+    if len(values) == 0:
+        return result
+
+    # Group codes in key order, then one sort by code and value
+    groups, codes = np.unique(keys, return_inverse=True)
+    order = np.lexsort((values, codes))
+    codes = codes[order]
+    values = values[order]
+
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    counts = np.diff(np.r_[starts, len(values)])
+
+    sums = np.add.reduceat(values, starts)
+    means = sums / counts
+
+    deviations = values - np.repeat(means, counts)
+    squares = np.add.reduceat(deviations * deviations, starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sds = np.where(counts > 1, np.sqrt(squares / (counts - 1)), np.nan)
+
+    result["group"] = groups[codes[starts]]
+    result["count"] = counts
+    result["mean"] = means
+    result["sd"] = sds
+
+    for q in quantiles:
+        position = starts + q * (counts - 1)
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        result["q%g" % q] = values[low] + (position - low) * (values[high] - values[low])
+    #END for
+
+    return result
+
+#END summarize
+
+"""
+Grouped statistics of one or more experiment metrics. Returns a
+dictionary of metric name to the summarize result of that metric.
+"""
+def grouped_stats(database, metric_names, by="decade", quantiles=DEFAULT_QUANTILES, version=None):
+
+    if isinstance(metric_names, str):
+        metric_names = [metric_names]
+
+    dbconn = sqlite3.connect(database)
+    try:
+        keys, values = load_groups(dbconn, metric_names, by, version)
+    finally:
+        dbconn.close()
+
+    return dict((name, summarize(keys, values[name], quantiles)) for name in metric_names)
+
+#END grouped_stats
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Print grouped statistics of the experiment metrics.")
+    parser.add_argument('-d', '--database',
+            dest="DATABASE_FILE",
+            default="results/catalog.db",
+            help="Database holding the catalog and experiments tables.")
+    parser.add_argument('-m', '--metrics',
+            dest="METRICS",
+            default="ivdnorm,sinorm",
+            help="Comma separated metrics, any of: %s." % ", ".join(metrics.METRIC_NAMES + metrics.DISTANCE_METRIC_NAMES))
+    parser.add_argument('-b', '--by',
+            dest="BY",
+            default="decade",
+            choices=GROUPINGS,
+            help="Group by author birth decade, LCC subject or LCSH subject.")
+    parser.add_argument('-q', '--quantiles',
+            dest="QUANTILES",
+            default=",".join("%g" % q for q in DEFAULT_QUANTILES),
+            help="Comma separated quantiles between 0 and 1.")
+    parser.add_argument('-v', '--version',
+            dest="VERSION",
+            type=float,
+            default=None,
+            help="Only use experiments of this graphalyzer.py VERSION.")
+
+    args = parser.parse_args()
+    metric_names = [name.strip() for name in args.METRICS.split(",") if name.strip()]
+    quantiles = [float(q) for q in args.QUANTILES.split(",") if q.strip()]
+
+    try:
+        stats = grouped_stats(args.DATABASE_FILE, metric_names, args.BY, quantiles, args.VERSION)
+    except ValueError as error:
+        parser.error(str(error))
+
+    # One tab separated table, a row per metric and group
+    columns = ["count", "mean", "sd"] + ["q%g" % q for q in quantiles]
+    print("\t".join(["metric", args.BY] + columns))
+    for name in metric_names:
+        result = stats[name]
+        for i in range(len(result["group"])):
+            print("\t".join([name, str(result["group"][i])] + ["%g" % result[column][i] for column in columns]))
+    #END for
+
+    return 0
+
+#END main
+
+if __name__ == "__main__":
+    sys.exit(main())
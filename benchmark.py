@@ -0,0 +1,471 @@
+#!/usr/bin/python3
+"""
+*     This file is part of Gutenberg Graphalyzer
+*     Gutenberg Graphalyzer is free software: you can redistribute it and/or modify
+*     it under the terms of the GNU General Public License as published by
+*     the Free Software Foundation, either version 3 of the License, or
+*     (at your option) any later version.
+*
+*     Gutenberg Graphalyzer is distributed in the hope that it will be useful,
+*     but WITHOUT ANY WARRANTY; without even the implied warranty of
+*     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+*     GNU General Public License for more details.
+*
+*     You should have received a copy of the GNU General Public License
+*     along with Gutenberg Graphalyzer.  If not, see <http://www.gnu.org/licenses/>.
+
+Benchmarks of the parsing and metric hot paths.
+
+Every benchmark is timed and its peak memory measured on
+
+    testfiles/test.txt         -- a real book
+    zipf-<N>                   -- synthetic texts of N words drawn from a
+                                  Zipf distribution, generated with a
+                                  fixed seed for every run
+    testfiles/catalogsample*.rdf -- catalog records, through make-db-py3.py
+
+The benchmarks of a text are nltk_parse with the fast and (when its
+models are installed) the NLTK tokenizer, regexp_parse, and on the parsed
+graph vector_degree_mag_info, shannon_graph_entropy,
+normalized_edge_complexity, degree_assortativity, compute_metrics and,
+up to --distance-max-nodes words, complexity_index_B.
+
+Times are the best of --repeat runs, each run looping a benchmark until
+it takes long enough to time. Peak memory comes from tracemalloc in one
+extra run, since tracing slows everything down. The Zipf sizes give a
+scaling curve per benchmark, summarized by the exponent of a power law
+fit: 1 is linear in the number of words.
+
+--save FILE writes the results as a baseline. --baseline FILE compares
+with one and exits with 1 when a benchmark got slower or bigger than
+--threshold allows, e.g.
+
+    benchmark.py --save results/benchmark.json
+    benchmark.py --baseline results/benchmark.json --threshold 0.25
+"""
+
+import argparse
+import glob
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+import graphalyzer
+import metrics
+
+BENCHMARK_VERSION = 1
+
+# Words of the synthetic texts
+DEFAULT_SIZES = [10000, 40000, 160000]
+
+DEFAULT_REPEAT = 3
+
+# Allowed relative slowdown before a benchmark counts as a regression
+DEFAULT_THRESHOLD = 0.25
+
+# Differences below these are noise, however large relative to the baseline
+MIN_TIME_DIFFERENCE = 0.002
+MIN_MEMORY_DIFFERENCE = 1 << 20
+
+# A run of a benchmark is looped until it takes at least this long
+MIN_RUN_TIME = 0.05
+
+# complexity_index_B searches from every word, so it is only run on small
+# vocabularies
+DEFAULT_DISTANCE_MAX_NODES = 10000
+
+# Zipf exponent and vocabulary of the synthetic texts. Real English is
+# close to 1.
+ZIPF_EXPONENT = 1.1
+ZIPF_VOCABULARY = 50000
+ZIPF_SEED = 1
+
+START_LINE = "*** START OF THIS PROJECT GUTENBERG EBOOK SYNTHETIC ***"
+END_LINE = "*** END OF THIS PROJECT GUTENBERG EBOOK SYNTHETIC ***"
+
+
+"""
+The lower case letter word of a vocabulary rank: a, b, ..., z, ba, bb, ...
+"""
+def rank_word(rank):
+
+    letters = []
+    while True:
+        rank, digit = divmod(rank, 26)
+        letters.append(chr(ord("a") + digit))
+        if rank == 0:
+            break
+    #END while
+
+    return "".join(reversed(letters))
+
+#END rank_word
+
+"""
+Writes a Project Gutenberg style text of about words words whose
+frequencies follow a Zipf distribution. Sentences are 1 to about 40 words
+long and start with a capital letter, so both tokenizers find them.
+"""
+def write_zipf_text(path, words, seed=ZIPF_SEED):
+
+    random = np.random.RandomState(seed)
+
+    vocabulary = min(ZIPF_VOCABULARY, words)
+    weights = 1.0 / np.arange(1, vocabulary + 1) ** ZIPF_EXPONENT
+    ranks = random.choice(vocabulary, size=words, p=weights / weights.sum())
+    lengths = random.poisson(15, size=words) + 1
+    names = [rank_word(rank) for rank in range(vocabulary)]
+
+    with open(path, 'w') as output:
+        output.write("Synthetic text\n\n%s\n\n" % START_LINE)
+
+        position = 0
+        sentence = 0
+        line = []
+        while position < words:
+            count = min(lengths[sentence], words - position)
+            sentence_words = [names[rank] for rank in ranks[position:position + count]]
+            sentence_words[0] = sentence_words[0].capitalize()
+            sentence_words[-1] = sentence_words[-1] + "."
+            position = position + count
+            sentence = sentence + 1
+
+            line.extend(sentence_words)
+            if len(line) > 10:
+                output.write(" ".join(line) + "\n")
+                line = []
+        #END while
+
+        output.write(" ".join(line) + "\n\n%s\n" % END_LINE)
+    #END with
+
+    return path
+
+#END write_zipf_text
+
+"""
+Seconds one call of function takes: the best of repeat runs, each run
+calling it as often as it takes to last MIN_RUN_TIME.
+"""
+def time_call(function, repeat=DEFAULT_REPEAT):
+
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(number):
+            function()
+        elapsed = time.perf_counter() - start
+
+        if elapsed >= MIN_RUN_TIME:
+            break
+        number = number * 2
+    #END while
+
+    best = elapsed / number
+    for i in range(repeat - 1):
+        start = time.perf_counter()
+        for i in range(number):
+            function()
+        best = min(best, (time.perf_counter() - start) / number)
+    #END for
+
+    return best
+
+#END time_call
+
+"""
+Peak bytes allocated by one call of function, from tracemalloc.
+"""
+def peak_memory(function):
+
+    tracemalloc.start()
+    try:
+        function()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak
+
+#END peak_memory
+
+def load_make_db():
+
+    spec = importlib.util.spec_from_file_location("make_db", os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "make-db-py3.py"))
+    make_db = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(make_db)
+
+    return make_db
+
+#END load_make_db
+
+"""
+An ebook list naming a text for every record of a catalog file, so none
+of them is skipped.
+"""
+def catalog_ebook_list(make_db, catalog_file):
+
+    return dict((child.get(make_db.RDF + "ID").replace("etext", ""), "benchmark.txt")
+            for child in make_db.iter_rdf_records(catalog_file) if child.tag == make_db.PGTERMS + "etext")
+
+#END catalog_ebook_list
+
+"""
+Parses every record of a catalog file without writing it anywhere.
+"""
+def parse_catalog(make_db, catalog_file, ebook_list):
+
+    records = 0
+    for child in make_db.iter_rdf_records(catalog_file):
+        if child.tag == make_db.PGTERMS + "etext" and make_db.parse_etext(child, ebook_list) is not None:
+            records = records + 1
+    #END for
+
+    return records
+
+#END parse_catalog
+
+"""
+True when the NLTK tokenizer models can be loaded.
+"""
+def nltk_available():
+
+    try:
+        graphalyzer.load_tokenizer_models()
+    except Exception as error:
+        sys.stderr.write("Skipping the NLTK tokenizer: %s\n" % error)
+        return False
+
+    return True
+
+#END nltk_available
+
+"""
+The (name, function) benchmarks of one text.
+"""
+def text_benchmarks(input_file, use_nltk, distance_max_nodes):
+
+    graph = graphalyzer.nltk_parse(input_file, tokenizer="fast")
+
+    benchmarks = [("parse_fast", lambda: graphalyzer.nltk_parse(input_file, tokenizer="fast"))]
+    if use_nltk:
+        benchmarks.append(("parse_nltk", lambda: graphalyzer.nltk_parse(input_file, tokenizer="nltk")))
+
+    benchmarks.extend([
+        ("regexp_parse", lambda: graphalyzer.regexp_parse(input_file)),
+        ("ivd", lambda: graphalyzer.vector_degree_mag_info(graph)),
+        ("si", lambda: graphalyzer.shannon_graph_entropy(graph)),
+        ("nec", lambda: graphalyzer.normalized_edge_complexity(graph)),
+        ("da", lambda: graphalyzer.degree_assortativity(graph)),
+        ("compute_metrics", lambda: metrics.compute_metrics(graph)),
+    ])
+
+    if graph.number_of_nodes() <= distance_max_nodes:
+        benchmarks.append(("bcomplex", lambda: graphalyzer.complexity_index_B(graph, jobs=1)))
+
+    return graph, benchmarks
+
+#END text_benchmarks
+
+"""
+Runs every benchmark. Returns a dictionary of '<input>/<benchmark>' to
+its time, peak memory and input size (words or catalog records), and the
+Zipf scaling exponents.
+"""
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=DEFAULT_REPEAT, use_nltk=True,
+        distance_max_nodes=DEFAULT_DISTANCE_MAX_NODES, only=None, output=sys.stdout):
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    testfiles = os.path.join(here, "testfiles")
+    results = {}
+
+    def run(input_name, name, function, size):
+        key = "%s/%s" % (input_name, name)
+        if only is not None and not any(pattern in key for pattern in only):
+            return
+
+        seconds = time_call(function, repeat)
+        memory = peak_memory(function)
+        results[key] = {"time": seconds, "memory": memory, "size": size}
+        output.write("%-36s %10d %12.6f %10.2f\n" % (key, size, seconds, memory / float(1 << 20)))
+        output.flush()
+    #END run
+
+    use_nltk = use_nltk and nltk_available()
+
+    # Size is the words of a text and the records of a catalog
+    output.write("%-36s %10s %12s %10s\n" % ("benchmark", "size", "seconds", "peak MB"))
+
+    scratch = tempfile.mkdtemp(prefix="graphalyzer-benchmark-")
+    try:
+        inputs = [("test.txt", os.path.join(testfiles, "test.txt"), None)]
+        for size in sizes:
+            inputs.append(("zipf-%d" % size, write_zipf_text(os.path.join(scratch, "zipf-%d.txt" % size), size), size))
+
+        for input_name, input_file, size in inputs:
+            graph, benchmarks = text_benchmarks(input_file, use_nltk, distance_max_nodes)
+            if size is None:
+                size = sum(len(word_list) for word_list in graphalyzer.parse_sentences(input_file, "fast"))
+
+            for name, function in benchmarks:
+                run(input_name, name, function, size)
+        #END for
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    #END try
+
+    make_db = load_make_db()
+    for catalog_file in sorted(glob.glob(os.path.join(testfiles, "catalogsample*.rdf"))):
+        ebook_list = catalog_ebook_list(make_db, catalog_file)
+        records = parse_catalog(make_db, catalog_file, ebook_list)
+        run(os.path.basename(catalog_file), "catalog_parse",
+                lambda: parse_catalog(make_db, catalog_file, ebook_list), records)
+    #END for
+
+    return results, scaling(results, sizes)
+
+#END run_benchmarks
+
+"""
+Power law exponent of time and memory over the Zipf sizes of every
+benchmark, from a least squares fit of the logarithms.
+"""
+def scaling(results, sizes):
+
+    curves = {}
+    if len(sizes) < 2:
+        return curves
+
+    names = set(key.split("/", 1)[1] for key in results if key.startswith("zipf-"))
+    for name in sorted(names):
+        points = [results["zipf-%d/%s" % (size, name)] for size in sizes
+                if "zipf-%d/%s" % (size, name) in results]
+        if len(points) < 2:
+            continue
+
+        x = np.log([point["size"] for point in points])
+        curves[name] = {
+            "time": float(np.polyfit(x, np.log([point["time"] for point in points]), 1)[0]),
+            "memory": float(np.polyfit(x, np.log([max(point["memory"], 1) for point in points]), 1)[0]),
+        }
+    #END for
+
+    return curves
+
+#END scaling
+
+"""
+Benchmarks that are slower or use more memory than in the baseline by
+more than threshold, as (key, measure, baseline, current) tuples.
+"""
+def regressions(baseline, results, threshold=DEFAULT_THRESHOLD):
+
+    found = []
+    for key, current in sorted(results.items()):
+        reference = baseline.get(key)
+        if reference is None:
+            continue
+
+        if (current["time"] > reference["time"] * (1 + threshold) and
+                current["time"] - reference["time"] > MIN_TIME_DIFFERENCE):
+            found.append((key, "time", reference["time"], current["time"]))
+
+        if (current["memory"] > reference["memory"] * (1 + threshold) and
+                current["memory"] - reference["memory"] > MIN_MEMORY_DIFFERENCE):
+            found.append((key, "memory", reference["memory"], current["memory"]))
+    #END for
+
+    return found
+
+#END regressions
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmark the parsing and metric hot paths.")
+    parser.add_argument('-s', '--sizes',
+            dest="SIZES",
+            default=",".join(str(size) for size in DEFAULT_SIZES),
+            help="Comma separated word counts of the synthetic Zipf texts.")
+    parser.add_argument('-r', '--repeat',
+            dest="REPEAT",
+            type=int,
+            default=DEFAULT_REPEAT,
+            help="Timed runs of every benchmark; the best one counts.")
+    parser.add_argument('-k', '--only',
+            dest="ONLY",
+            action="append",
+            default=None,
+            help="Only run benchmarks whose '<input>/<benchmark>' name contains this, e.g. -k zipf -k parse_fast.")
+    parser.add_argument('-F', '--fast-only',
+            dest="NLTK",
+            default=True,
+            action="store_false",
+            help="Skip the NLTK tokenizer.")
+    parser.add_argument('--distance-max-nodes',
+            dest="DISTANCE_MAX_NODES",
+            type=int,
+            default=DEFAULT_DISTANCE_MAX_NODES,
+            help="Largest vocabulary complexity_index_B is benchmarked on.")
+    parser.add_argument('--save',
+            dest="SAVE",
+            default=False,
+            help="Write the results to this JSON file as a baseline.")
+    parser.add_argument('-b', '--baseline',
+            dest="BASELINE",
+            default=False,
+            help="Compare with the baseline in this JSON file and exit with 1 on a regression.")
+    parser.add_argument('-t', '--threshold',
+            dest="THRESHOLD",
+            type=float,
+            default=DEFAULT_THRESHOLD,
+            help="Relative increase in time or memory that counts as a regression.")
+
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.SIZES.split(",") if size.strip()]
+
+    results, curves = run_benchmarks(sizes, args.REPEAT, args.NLTK, args.DISTANCE_MAX_NODES, args.ONLY)
+
+    if curves:
+        print("Scaling exponents over %s words:" % ", ".join(str(size) for size in sizes))
+        print("%-20s %8s %8s" % ("benchmark", "time", "memory"))
+        for name, curve in sorted(curves.items()):
+            print("%-20s %8.2f %8.2f" % (name, curve["time"], curve["memory"]))
+    #END if
+
+    if(args.SAVE):
+        with open(args.SAVE, 'w') as output:
+            json.dump({"version": BENCHMARK_VERSION, "python": platform.python_version(),
+                "machine": platform.platform(), "sizes": sizes, "results": results,
+                "scaling": curves}, output, indent=1, sort_keys=True)
+        sys.stderr.write("Saved %d results to %s.\n" % (len(results), args.SAVE))
+    #END if
+
+    if(args.BASELINE):
+        with open(args.BASELINE, 'r') as input:
+            baseline = json.load(input)
+
+        found = regressions(baseline["results"], results, args.THRESHOLD)
+        for key, measure, reference, current in found:
+            print("REGRESSION %s %s: %.6g -> %.6g (%+.0f%%)" % (key, measure, reference, current,
+                100.0 * (current - reference) / reference if reference else float("inf")))
+        #END for
+
+        if found:
+            return 1
+        print("No regressions over %d benchmarks." % len(set(results) & set(baseline["results"])))
+    #END if
+
+    return 0
+
+#END main
+
+if __name__ == "__main__":
+    sys.exit(main())
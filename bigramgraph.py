@@ -0,0 +1,470 @@
+"""
+     This file is part of Gutenberg Graphalyzer
+     Gutenberg Graphalyzer is free software: you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     Gutenberg Graphalyzer is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU General Public License for more details.
+
+     You should have received a copy of the GNU General Public License
+     along with Gutenberg Graphalyzer.  If not, see <http://www.gnu.org/licenses/>.
+
+Compact bigram graph used by the parsers in graphalyzer.py.
+
+Words are interned to dense integer IDs in the order they are first seen.
+Every bigram is packed in to a single 64 bit key, (src << 32) | dst, and
+appended to a flat buffer. When the buffer fills up it is folded in to a
+sorted array of unique keys with their counts. The final graph is exposed
+as CSR arrays (indptr, indices, weights) and a networkx DiGraph is only
+built when something explicitly asks for one, e.g. the DOT export.
+
+With max_edges set the sorted table never holds more than that many keys
+while the graph is built. Once it fills up it is written to a temporary
+file as a sorted run and emptied, and the runs are merged block by block
+when the edges are first read (external aggregation), so building the
+graph of a text of any size takes a fixed amount of memory beyond its
+vocabulary and the final edge list. finish(prune_hapax=True) shrinks
+that final edge list by dropping the bigrams seen only once.
+"""
+
+from array import array
+import os
+import tempfile
+import numpy as np
+
+# Number of pending bigrams held before they are folded in to the counts
+DEFAULT_FLUSH_SIZE = 1 << 20
+
+# Peak bytes taken per table entry while pending bigrams are folded in to
+# a full table: the keys and counts themselves plus the temporaries of
+# the sort and the count summing. Converts a memory budget to max_edges.
+EDGE_TABLE_BYTES = 160
+
+# Keys taken from all runs together per step of a merge
+MERGE_BLOCK_SIZE = 1 << 18
+
+# Smallest table max_edges_for_memory allows, about 2.5MB
+MIN_MAX_EDGES = 1 << 14
+
+# Fewest keys taken from one run per merge step, however small max_edges
+MIN_RUN_BLOCK_SIZE = 1 << 10
+
+# Spilled runs kept before they are merged in to one
+MERGE_FAN_IN = 64
+
+# Packed keys hold the source ID in the upper 32 bits
+KEY_SHIFT = 32
+KEY_MASK = (1 << KEY_SHIFT) - 1
+
+
+"""
+Weighted, directed word graph. Nodes are word IDs, edges are bigrams and
+the weight of an edge is the bigram count.
+"""
+class BigramGraph(object):
+
+    def __init__(self, flush_size=DEFAULT_FLUSH_SIZE, max_edges=None, spill_dir=None):
+        self.max_edges = max_edges
+        self.flush_size = flush_size if max_edges is None else max(1, min(flush_size, max_edges))
+
+        # Sorted runs spilled to spill_dir (the system temporary directory
+        # when None), merged back in by _merge_runs
+        self.spill_dir = spill_dir
+        self._runs = []
+        self._run_dir = None
+        self._spilled = 0
+
+        # Vocabulary. word_to_id maps a word to its ID and words maps back.
+        self.word_to_id = {}
+        self.words = []
+
+        # Bigrams that have not been folded in to the counts yet
+        self._pending = array('q')
+
+        # Sorted unique packed keys and the bigram count of each
+        self._keys = np.empty(0, dtype=np.int64)
+        self._counts = np.empty(0, dtype=np.int64)
+
+        # CSR arrays are rebuilt lazily after the graph changes
+        self._csr = None
+    #END __init__
+
+    """
+    Interns a word and returns its ID. Adding a word that already exists
+    just returns the existing ID.
+    """
+    def add_node(self, word):
+        word_id = self.word_to_id.get(word)
+
+        if word_id is None:
+            word_id = len(self.words)
+            self.word_to_id[word] = word_id
+            self.words.append(word)
+            self._csr = None
+        #END if
+
+        return word_id
+    #END add_node
+
+    """
+    Increments the count of the bigram src -> dst. Both arguments are
+    word IDs as returned by add_node.
+    """
+    def add_edge(self, src, dst, count=1):
+        if count == 1:
+            self._pending.append((src << KEY_SHIFT) | dst)
+        else:
+            self._pending.extend([(src << KEY_SHIFT) | dst] * count)
+        #END if
+
+        if len(self._pending) >= self.flush_size:
+            self._flush()
+        #END if
+
+        self._csr = None
+    #END add_edge
+
+    """
+    Folds the pending bigram buffer in to the sorted key/count arrays.
+    """
+    def _flush(self):
+        if len(self._pending) == 0:
+            return
+
+        pending = np.frombuffer(self._pending, dtype=np.int64)
+        new_keys, new_counts = np.unique(pending, return_counts=True)
+        self._pending = array('q')
+
+        self._fold(new_keys, new_counts.astype(np.int64))
+    #END _flush
+
+    """
+    Adds keys with their counts to the sorted key/count arrays, summing
+    the counts of keys already there, and spills the arrays when they
+    reach max_edges.
+    """
+    def _fold(self, new_keys, new_counts):
+        if len(self._keys) == 0:
+            self._keys = new_keys
+            self._counts = new_counts
+        else:
+            keys = np.concatenate((self._keys, new_keys))
+            counts = np.concatenate((self._counts, new_counts))
+            self._keys, inverse = np.unique(keys, return_inverse=True)
+            self._counts = np.bincount(inverse, weights=counts).astype(np.int64)
+        #END if
+
+        if self.max_edges is not None and len(self._keys) >= self.max_edges:
+            self._spill()
+    #END _fold
+
+    """
+    Writes the sorted key/count arrays to a temporary file as one run and
+    empties them. Past MERGE_FAN_IN runs they are merged in to one, so a
+    final merge never maps more than that many files.
+    """
+    def _spill(self):
+        self._write_run([(self._keys, self._counts)])
+        self._keys = np.empty(0, dtype=np.int64)
+        self._counts = np.empty(0, dtype=np.int64)
+
+        if len(self._runs) >= MERGE_FAN_IN:
+            runs = self._runs
+            self._runs = []
+            self._write_run(self._merge_blocks(runs))
+            for path in runs:
+                os.remove(path + "-keys")
+                os.remove(path + "-counts")
+        #END if
+    #END _spill
+
+    """
+    Writes the (keys, counts) blocks of a sorted run to a pair of raw
+    int64 files, which the merge maps instead of reading them in whole.
+    """
+    def _write_run(self, blocks):
+        if self._run_dir is None:
+            self._run_dir = tempfile.TemporaryDirectory(prefix="bigrams-", dir=self.spill_dir)
+
+        self._spilled = self._spilled + 1
+        path = os.path.join(self._run_dir.name, "run-%d" % self._spilled)
+        with open(path + "-keys", 'wb') as keys_file, open(path + "-counts", 'wb') as counts_file:
+            for keys, counts in blocks:
+                keys_file.write(np.ascontiguousarray(keys, dtype=np.int64).tobytes())
+                counts_file.write(np.ascontiguousarray(counts, dtype=np.int64).tobytes())
+        #END with
+
+        self._runs.append(path)
+    #END _write_run
+
+    """
+    Yields the merged (keys, counts) of the runs at paths and the given in
+    memory arrays, in order, MERGE_BLOCK_SIZE keys of all runs at a time,
+    or max_edges when smaller, so a merge stays within the same memory as
+    building the graph.
+    Each step takes the keys up to the smallest last key of the runs'
+    next blocks, so no run contributes more than its share to it and a
+    key is never split across steps. With prune_hapax keys counted once
+    are left out.
+    """
+    def _merge_blocks(self, paths, arrays=(), prune_hapax=False):
+        runs = [(np.memmap(path + "-keys", dtype=np.int64, mode="r"),
+                np.memmap(path + "-counts", dtype=np.int64, mode="r")) for path in paths]
+        runs.extend((keys, counts) for keys, counts in arrays if len(keys) > 0)
+
+        positions = [0] * len(runs)
+        block_size = MERGE_BLOCK_SIZE if self.max_edges is None else min(MERGE_BLOCK_SIZE, self.max_edges)
+        block_size = max(MIN_RUN_BLOCK_SIZE, block_size // max(1, len(runs)))
+
+        while True:
+            live = [i for i in range(len(runs)) if positions[i] < len(runs[i][0])]
+            if not live:
+                break
+
+            bound = min(runs[i][0][min(positions[i] + block_size, len(runs[i][0])) - 1] for i in live)
+
+            block_keys = []
+            block_counts = []
+            for i in live:
+                keys, counts = runs[i]
+                end = int(np.searchsorted(keys, bound, side="right"))
+                block_keys.append(keys[positions[i]:end])
+                block_counts.append(counts[positions[i]:end])
+                positions[i] = end
+            #END for
+
+            keys, inverse = np.unique(np.concatenate(block_keys), return_inverse=True)
+            counts = np.bincount(inverse, weights=np.concatenate(block_counts)).astype(np.int64)
+            if prune_hapax:
+                keep = counts > 1
+                keys = keys[keep]
+                counts = counts[keep]
+            #END if
+
+            yield keys, counts
+        #END while
+    #END _merge_blocks
+
+    """
+    Merges the spilled runs and the in memory arrays in to the final
+    sorted key/count arrays and removes the runs.
+    """
+    def _merge_runs(self, prune_hapax=False):
+        merged_keys = []
+        merged_counts = []
+        for keys, counts in self._merge_blocks(self._runs, [(self._keys, self._counts)], prune_hapax):
+            merged_keys.append(keys)
+            merged_counts.append(counts)
+        #END for
+
+        self._keys = np.concatenate(merged_keys) if merged_keys else np.empty(0, dtype=np.int64)
+        self._counts = np.concatenate(merged_counts) if merged_counts else np.empty(0, dtype=np.int64)
+
+        self._runs = []
+        if self._run_dir is not None:
+            self._run_dir.cleanup()
+            self._run_dir = None
+        #END if
+    #END _merge_runs
+
+    """
+    Folds in the pending bigrams and merges back any spilled runs, leaving
+    every count in the sorted key/count arrays.
+    """
+    def _collect(self):
+        self._flush()
+        if self._runs:
+            self._merge_runs()
+    #END _collect
+
+    """
+    Completes the counts once the last bigram is added. With prune_hapax
+    every bigram seen only once is dropped from the graph; its words stay
+    in the vocabulary, so the node count is unchanged. On the metrics:
+
+        da       correlation over the recurring bigrams only, with the
+                 degrees they leave; not comparable to unpruned values
+        ivd      lower, every out degree loses the word's one off successors
+        ivdnorm  lower, ivd over the unchanged node count
+        si       computed from out strengths that each lose one per pruned
+                 bigram, W by their number; normally lower
+        sinorm   follows si
+        nec      lower, in proportion to the edges left (V is unchanged,
+                 the V^2 form only applies while a self loop survives)
+        aec      lower, in proportion to the edges left
+
+    Since most bigram types of a text are hapaxes, pruning keeps the
+    final edge list of a huge text to a fraction of its size.
+    """
+    def finish(self, prune_hapax=False):
+        self._flush()
+        if self._runs or prune_hapax:
+            self._merge_runs(prune_hapax)
+
+        self._csr = None
+    #END finish
+
+    """
+    Adds every word and bigram count of another graph to this one, e.g. to
+    build the graph of a whole corpus from the graphs of its books. The
+    other graph's words are interned here and its edges remapped to the
+    new IDs, so the two vocabularies need not agree. With max_edges the
+    edges are folded in max_edges at a time, spilling like add_edge does.
+    """
+    def add_graph(self, other):
+        ids = np.array([self.add_node(word) for word in other.words], dtype=np.int64)
+        src, dst, weight = other.edges()
+
+        self._flush()
+        keys = (ids[src] << KEY_SHIFT) | ids[dst]
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        weight = weight[order]
+
+        step = len(keys) if self.max_edges is None else self.max_edges
+        for start in range(0, len(keys), max(step, 1)):
+            self._fold(keys[start:start + step], weight[start:start + step])
+        #END for
+
+        self._csr = None
+    #END add_graph
+
+    def number_of_nodes(self):
+        return len(self.words)
+
+    def number_of_edges(self):
+        self._collect()
+        return len(self._keys)
+
+    def number_of_selfloops(self):
+        src, dst, weight = self.edges()
+        return int(np.count_nonzero(src == dst))
+
+    """
+    Returns the edge list as three parallel arrays: source IDs,
+    destination IDs and bigram counts. Edges are sorted by source and
+    then destination.
+    """
+    def edges(self):
+        self._collect()
+        src = (self._keys >> KEY_SHIFT).astype(np.int64)
+        dst = (self._keys & KEY_MASK).astype(np.int64)
+        return src, dst, self._counts
+    #END edges
+
+    """
+    Returns the CSR form of the graph as (indptr, indices, weights). Row i
+    holds the out edges of word i.
+    """
+    def csr(self):
+        if self._csr is None:
+            src, dst, weight = self.edges()
+            indptr = np.zeros(self.number_of_nodes() + 1, dtype=np.int64)
+            np.cumsum(np.bincount(src, minlength=self.number_of_nodes()), out=indptr[1:])
+            self._csr = (indptr, dst, weight)
+        #END if
+
+        return self._csr
+    #END csr
+
+    def out_degree(self):
+        indptr, indices, weights = self.csr()
+        return np.diff(indptr)
+
+    def in_degree(self):
+        indptr, indices, weights = self.csr()
+        return np.bincount(indices, minlength=self.number_of_nodes())
+
+    """
+    Sum of the out edge weights of every node, i.e. how many bigrams start
+    with each word.
+    """
+    def out_strength(self):
+        src, dst, weight = self.edges()
+        return np.bincount(src, weights=weight, minlength=self.number_of_nodes())
+    #END out_strength
+
+    """
+    Writes the graph as a compressed NumPy archive holding the CSR arrays
+    and the vocabulary, UTF-8 encoded and joined with newlines (words
+    never hold whitespace). Returns the path written, which gains a .npz
+    suffix if it has none. Temporary files that are read back right away
+    can skip the compression.
+    """
+    def save_npz(self, path, compressed=True):
+        indptr, indices, weights = self.csr()
+        vocab = "\n".join(self.words).encode("utf-8")
+
+        if not path.endswith(".npz"):
+            path = path + ".npz"
+
+        save = np.savez_compressed if compressed else np.savez
+        with open(path, 'wb') as output:
+            save(output,
+                    vocab=np.frombuffer(vocab, dtype=np.uint8),
+                    indptr=indptr.astype(np.int64),
+                    indices=indices.astype(np.int32),
+                    weights=weights.astype(np.int64))
+        #END with
+
+        return path
+    #END save_npz
+
+    """
+    Reads a graph written by save_npz.
+    """
+    @staticmethod
+    def load_npz(path):
+        with np.load(path) as archive:
+            vocab = archive["vocab"].tobytes().decode("utf-8")
+            indptr = archive["indptr"].astype(np.int64)
+            indices = archive["indices"].astype(np.int64)
+            weights = archive["weights"].astype(np.int64)
+        #END with
+
+        graph = BigramGraph()
+        if len(indptr) > 1:
+            graph.words = vocab.split("\n")
+        graph.word_to_id = dict((word, i) for i, word in enumerate(graph.words))
+
+        src = np.repeat(np.arange(len(indptr) - 1, dtype=np.int64), np.diff(indptr))
+        graph._keys = (src << KEY_SHIFT) | indices
+        graph._counts = weights
+
+        return graph
+    #END load_npz
+
+    """
+    Builds the equivalent networkx DiGraph with bigram counts stored in the
+    'weight' edge attribute. Only used for exports that need networkx.
+    """
+    def to_networkx(self):
+        import networkx as nx
+
+        graph = nx.DiGraph()
+        graph.add_nodes_from(self.words)
+
+        src, dst, weight = self.edges()
+        words = self.words
+        graph.add_weighted_edges_from(
+                (words[s], words[d], int(w)) for s, d, w in zip(src.tolist(), dst.tolist(), weight.tolist()))
+
+        return graph
+    #END to_networkx
+
+#END BigramGraph
+
+"""
+The max_edges that keeps the edge table of a BigramGraph within megabytes
+of memory while it is built. It is never below MIN_MAX_EDGES, since a
+smaller table spends all its time spilling.
+"""
+def max_edges_for_memory(megabytes):
+
+    return max(MIN_MAX_EDGES, int(megabytes * (1 << 20)) // EDGE_TABLE_BYTES)
+
+#END max_edges_for_memory
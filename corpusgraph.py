@@ -0,0 +1,200 @@
+"""
+     This file is part of Gutenberg Graphalyzer
+     Gutenberg Graphalyzer is free software: you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     Gutenberg Graphalyzer is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU General Public License for more details.
+
+     You should have received a copy of the GNU General Public License
+     along with Gutenberg Graphalyzer.  If not, see <http://www.gnu.org/licenses/>.
+
+Merged bigram graphs of groups of books: the whole corpus, an author, an
+author birth decade or an LCC or LCSH subject.
+
+The groups come from the catalog tables. graphalyzer.py corpus builds the
+graph of every book once in a worker pool and spills it to a scratch
+directory as a BigramGraph archive. tree_reduce then merges each group's
+archives fan_in at a time, level by level, with every merge a pool task
+that writes its result back to disk. A task only ever holds the graph it
+is building and one input, and with max_edges (--graph-memory) the graph
+it is building spills its bigram table like the graph of a single text
+does, so beyond the vocabulary the merges take the memory of the largest
+input and of the merged edge list that is written out. The metrics need
+the whole merged graph, which bounds what a group can hold. Finally the metrics of every
+merged graph are computed and stored in the groupexperiments table.
+"""
+
+import collections
+import os
+import re
+
+from analysis import author_column
+from bigramgraph import BigramGraph
+from metrics import METRIC_NAMES
+
+GROUPINGS = ["corpus", "author", "decade", "lcc", "lcsh"]
+
+# Name of the group key of every grouping in the printed metrics
+GROUP_LABELS = {"corpus": "Corpus", "author": "AuthorID", "decade": "Decade", "lcc": "LCC", "lcsh": "LCSH"}
+
+# Every (group key, etextID, filename) of a grouping. The author column is
+# resolved by analysis.author_column.
+GROUP_QUERIES = {
+    "corpus": "SELECT 'corpus', etextID, filename FROM ebooks",
+    "author": """SELECT ba.%(author)s, eb.etextID, eb.filename FROM bookauthors ba, ebooks eb
+            WHERE eb.etextID = ba.etextID""",
+    "decade": """SELECT bd.decade, eb.etextID, eb.filename FROM bookdecades bd, ebooks eb
+            WHERE eb.etextID = bd.etextID""",
+    "lcc": """SELECT s.subject, eb.etextID, eb.filename FROM lccmap m, lccsubjects s, ebooks eb
+            WHERE s.subjectID = m.subjectID AND eb.etextID = m.etextID""",
+    "lcsh": """SELECT s.subject, eb.etextID, eb.filename FROM lcshmap m, lcshsubjects s, ebooks eb
+            WHERE s.subjectID = m.subjectID AND eb.etextID = m.etextID""",
+}
+
+GROUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS groupexperiments(
+    runID INTEGER PRIMARY KEY ASC,
+    versionnumber INTEGER, -- Version of the software used for the experiments
+    grouping TEXT,         -- corpus, author, decade, lcc or lcsh
+    groupkey TEXT,         -- authorID, decade or subject of the group
+    books INTEGER,         -- Books merged in to the group's graph
+    nodes INTEGER,
+    edges INTEGER,
+    %s
+);
+CREATE INDEX IF NOT EXISTS groupexperiments_group ON groupexperiments(grouping, groupkey);
+""" % ",\n    ".join("%s REAL" % name for name in METRIC_NAMES)
+
+GROUP_COLUMNS = ["versionnumber", "grouping", "groupkey", "books", "nodes", "edges"] + METRIC_NAMES
+
+# Archives merged by one reduce task
+DEFAULT_FAN_IN = 8
+
+
+"""
+Returns an ordered dictionary of group key to the (etextID, filename)
+pairs of its books. keys restricts the result to those groups.
+"""
+def group_books(dbconn, by, keys=None):
+
+    if by not in GROUP_QUERIES:
+        raise ValueError("unknown grouping %r, expected one of %s" % (by, ", ".join(GROUPINGS)))
+
+    wanted = None if keys is None else set(str(key) for key in keys)
+
+    query = GROUP_QUERIES[by]
+    if by == "author":
+        query = query % {"author": author_column(dbconn)}
+
+    groups = collections.OrderedDict()
+    for key, etextid, filename in dbconn.execute(query + " ORDER BY 1, 2"):
+        if wanted is not None and str(key) not in wanted:
+            continue
+
+        books = groups.setdefault(key, [])
+        if not books or books[-1][0] != etextid:
+            books.append((etextid, filename))
+    #END for
+
+    return groups
+
+#END group_books
+
+"""
+Pool task: merges the archives in paths in to one and writes it to
+output uncompressed, since it is read back by the next level. The bigram
+table holds at most max_edges keys, past which it spills to the
+directory of output. Returns output.
+"""
+def merge_task(task):
+
+    paths, output, max_edges = task
+
+    graph = BigramGraph(max_edges=max_edges, spill_dir=os.path.dirname(output))
+    for path in paths:
+        graph.add_graph(BigramGraph.load_npz(path))
+
+    return graph.save_npz(output, compressed=False)
+
+#END merge_task
+
+"""
+Merges the archives of every group down to one per group. groups maps a
+group key to its list of archive paths; the result maps it to the path
+of its merged archive, which is the book's own archive for one book
+groups. Every level runs the merges of all groups as one batch of pool
+tasks. Archives created here are removed once merged; the inputs are
+left alone, since one book can belong to several groups. max_edges
+bounds the bigram table of every merge, see merge_task.
+"""
+def tree_reduce(pool, groups, spill_dir, fan_in=DEFAULT_FAN_IN, max_edges=None):
+
+    current = dict((key, list(paths)) for key, paths in groups.items() if paths)
+    inputs = set(path for paths in current.values() for path in paths)
+    created = 0
+
+    while any(len(paths) > 1 for paths in current.values()):
+        tasks = []
+        owners = []
+        merged = {}
+
+        for key, paths in current.items():
+            merged[key] = []
+            for i in range(0, len(paths), fan_in):
+                chunk = paths[i:i + fan_in]
+                if len(chunk) == 1:
+                    merged[key].append(chunk[0])
+                    continue
+                #END if
+
+                created = created + 1
+                tasks.append((chunk, os.path.join(spill_dir, "merge-%d.npz" % created), max_edges))
+                owners.append(key)
+            #END for
+        #END for
+
+        for key, output in zip(owners, pool.map(merge_task, tasks)):
+            merged[key].append(output)
+
+        # Intermediate archives of the previous level are no longer needed
+        for task in tasks:
+            for path in task[0]:
+                if path not in inputs:
+                    os.remove(path)
+        #END for
+
+        current = merged
+    #END while
+
+    return dict((key, paths[0]) for key, paths in current.items())
+
+#END tree_reduce
+
+"""
+File name of a group's graph, e.g. lcc-PS.npz
+"""
+def group_filename(by, key):
+
+    return "%s-%s.npz" % (by, re.sub(r"[^\w.-]+", "_", str(key)))
+
+#END group_filename
+
+def create_schema(dbconn):
+
+    dbconn.executescript(GROUP_SCHEMA)
+    dbconn.commit()
+
+#END create_schema
+
+def store_group_metrics(dbconn, rows):
+
+    dbconn.executemany("INSERT INTO groupexperiments(%s) VALUES (%s)" %
+            (", ".join(GROUP_COLUMNS), ", ".join("?" * len(GROUP_COLUMNS))), rows)
+    dbconn.commit()
+
+#END store_group_metrics
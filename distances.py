@@ -0,0 +1,474 @@
+"""
+     This file is part of Gutenberg Graphalyzer
+     Gutenberg Graphalyzer is free software: you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     Gutenberg Graphalyzer is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU General Public License for more details.
+
+     You should have received a copy of the GNU General Public License
+     along with Gutenberg Graphalyzer.  If not, see <http://www.gnu.org/licenses/>.
+
+Exact distance based complexity metrics.
+
+The distance degree d_i of a node is the sum of its shortest path lengths
+to every other node. Instead of one shortest path search per pair, the
+DistanceEngine runs breadth first searches from 64 sources at once: every
+node holds a 64 bit mask of the sources that have reached it, and one BFS
+level is a single gather of the frontier masks along every edge followed
+by an OR reduction per target node. The distance sums of all 64 sources
+are accumulated from the bits that are new at each level, so every source
+costs one sweep of O(E) per level. Blocks of sources can be spread over
+worker processes.
+
+Word graphs are rarely strongly connected, so the unreachable argument of
+the functions below decides what an unreachable pair contributes:
+
+    "ignore"  -- nothing; d_i sums the distances to the nodes i reaches and
+                 the average distance is taken over reachable pairs only.
+    "raise"   -- a ValueError, like networkx's shortest path functions.
+    a number  -- that distance, e.g. V as a penalty longer than any path.
+
+For very large vocabularies sampled_distance_metrics estimates the same
+metrics from a sample of BFS sources, with confidence intervals, and
+stops once a sample size, time or accuracy budget is met.
+"""
+
+import multiprocessing
+import statistics
+import time
+import numpy as np
+
+# Sources searched together, one per bit of a mask
+BLOCK_SIZE = 64
+
+UNREACHABLE_IGNORE = "ignore"
+UNREACHABLE_RAISE = "raise"
+
+# Engine of a worker process, set up by _init_worker
+_WORKER_ENGINE = None
+
+
+"""
+Bit parallel breadth first search over the CSR arrays of a graph.
+"""
+class DistanceEngine(object):
+
+    def __init__(self, indptr, indices):
+        self.num_nodes = len(indptr) - 1
+
+        # Edges sorted by target so the OR of each node's incoming masks is
+        # one reduceat over contiguous runs
+        src = np.repeat(np.arange(self.num_nodes, dtype=np.int64), np.diff(indptr))
+        order = np.argsort(indices, kind="stable")
+        self.edge_src = src[order]
+        targets = np.asarray(indices, dtype=np.int64)[order]
+        self.targets, self.starts = np.unique(targets, return_index=True)
+    #END __init__
+
+    """
+    Runs the searches for up to 64 sources. Returns two arrays with one
+    entry per source: the sum of the distances to every node it reaches
+    and the number of nodes it reaches, itself excluded.
+    """
+    def search_block(self, sources):
+        sources = np.asarray(sources, dtype=np.int64)
+        k = len(sources)
+        bits = np.left_shift(np.uint64(1), np.arange(k, dtype=np.uint64))
+
+        frontier = np.zeros(self.num_nodes, dtype=np.uint64)
+        np.bitwise_or.at(frontier, sources, bits)
+        visited = frontier.copy()
+
+        sums = np.zeros(k, dtype=np.float64)
+        reached = np.zeros(k, dtype=np.int64)
+        level = 0
+
+        while len(self.edge_src) > 0:
+            level = level + 1
+
+            incoming = np.zeros(self.num_nodes, dtype=np.uint64)
+            incoming[self.targets] = np.bitwise_or.reduceat(frontier[self.edge_src], self.starts)
+            frontier = incoming & ~visited
+
+            active = frontier[frontier != 0]
+            if len(active) == 0:
+                break
+            visited |= frontier
+
+            # Per source count of the nodes first reached at this level
+            counts = np.unpackbits(active.astype("<u8").view(np.uint8),
+                    bitorder="little").reshape(-1, 64)[:, :k].sum(axis=0, dtype=np.int64)
+            sums += level * counts
+            reached += counts
+        #END while
+
+        return sums, reached
+    #END search_block
+
+    """
+    Returns a boolean array marking the nodes reachable from source,
+    source included.
+    """
+    def reachable(self, source):
+        frontier = np.zeros(self.num_nodes, dtype=bool)
+        frontier[source] = True
+        visited = frontier.copy()
+
+        while len(self.edge_src) > 0:
+            incoming = np.zeros(self.num_nodes, dtype=bool)
+            incoming[self.targets] = np.logical_or.reduceat(frontier[self.edge_src], self.starts)
+            frontier = incoming & ~visited
+            if not frontier.any():
+                break
+            visited |= frontier
+        #END while
+
+        return visited
+    #END reachable
+
+    """
+    Starts a pool of jobs worker processes that each hold a copy of this
+    engine, for search calls that share one. The caller closes it.
+    """
+    def start_pool(self, jobs):
+        return multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(self,))
+    #END start_pool
+
+    """
+    Runs search_block over every source, in blocks of 64, optionally
+    spread over a pool of jobs worker processes. A pool from start_pool
+    is used as it is; otherwise one is started and stopped for this call.
+    """
+    def search(self, sources=None, jobs=1, pool=None):
+        if sources is None:
+            sources = np.arange(self.num_nodes, dtype=np.int64)
+        sources = np.asarray(sources, dtype=np.int64)
+
+        blocks = [sources[i:i + BLOCK_SIZE] for i in range(0, len(sources), BLOCK_SIZE)]
+        if len(blocks) == 0:
+            return np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.int64)
+
+        if pool is not None and len(blocks) > 1:
+            results = pool.map(_search_worker, blocks)
+        elif jobs > 1 and len(blocks) > 1:
+            pool = self.start_pool(min(jobs, len(blocks)))
+            try:
+                results = pool.map(_search_worker, blocks)
+                pool.close()
+            finally:
+                pool.terminate()
+                pool.join()
+            #END try
+        else:
+            results = [self.search_block(block) for block in blocks]
+        #END if
+
+        return (np.concatenate([sums for sums, reached in results]),
+                np.concatenate([reached for sums, reached in results]))
+    #END search
+
+#END DistanceEngine
+
+def _init_worker(engine):
+    global _WORKER_ENGINE
+    _WORKER_ENGINE = engine
+
+def _search_worker(block):
+    return _WORKER_ENGINE.search_block(block)
+
+"""
+Turns distance sums and reach counts in to distance degrees following the
+unreachable policy described at the top of this file.
+"""
+def _apply_policy(sums, reached, num_nodes, unreachable):
+
+    missing = (num_nodes - 1) - reached
+
+    if unreachable == UNREACHABLE_IGNORE:
+        return sums
+
+    if unreachable == UNREACHABLE_RAISE:
+        if np.any(missing > 0):
+            raise ValueError("%d source nodes can not reach every node in the graph" %
+                    int(np.count_nonzero(missing > 0)))
+        return sums
+    #END if
+
+    return sums + missing * float(unreachable)
+
+#END _apply_policy
+
+"""
+Distance degree of every node, or of the given source nodes.
+"""
+def distance_degrees(graph, sources=None, unreachable=UNREACHABLE_IGNORE, jobs=1):
+
+    indptr, indices, weights = graph.csr()
+    sums, reached = DistanceEngine(indptr, indices).search(sources, jobs)
+
+    return _apply_policy(sums, reached, graph.number_of_nodes(), unreachable)
+
+#END distance_degrees
+
+"""
+Computes the distance based metrics main() used to skip for taking too
+long and returns them keyed by their experiments column names:
+
+    bcomplex -- Complexity Index B = \sum{i=1}{V}{a_i / d_i}. A node that
+                reaches no other node has d_i = 0 and adds nothing.
+    avgdist  -- Average shortest path length over the counted pairs.
+    ad       -- <A_i> / <D_i>, the average adjacency over the average
+                distance.
+
+The *_ci entries are the confidence interval half widths of sampled
+estimates, 0 here, and distsamples is the number of BFS sources used.
+"""
+def distance_metrics(graph, unreachable=UNREACHABLE_IGNORE, jobs=1):
+
+    num_nodes = graph.number_of_nodes()
+    sources = np.arange(num_nodes, dtype=np.int64)
+
+    indptr, indices, weights = graph.csr()
+    sums, reached = DistanceEngine(indptr, indices).search(sources, jobs)
+
+    return _estimate(graph.out_degree(), unreachable, 0.0, [((sources, sums, reached), num_nodes)])
+
+#END distance_metrics
+
+"""
+Nodes that can reach target, found with one BFS over the reversed edges.
+"""
+def _reaching(indptr, indices, target):
+
+    num_nodes = len(indptr) - 1
+    src = np.repeat(np.arange(num_nodes, dtype=np.int64), np.diff(indptr))
+
+    reverse_indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(indices, minlength=num_nodes), out=reverse_indptr[1:])
+    reverse_indices = src[np.argsort(indices, kind="stable")]
+
+    return DistanceEngine(reverse_indptr, reverse_indices).reachable(target)
+
+#END _reaching
+
+"""
+Combines the searched sources of strata of the nodes. strata is a list of
+(searched, population) pairs, searched a (sources, sums, reached) tuple of
+a uniform sample, drawn without replacement, of a stratum of population
+nodes. A stratum searched in full is exact.
+
+    B       -- sum over the strata of population times the sample mean
+               of a_i/d_i.
+    avgdist -- estimated distance total over estimated pair total.
+    A/D     -- average adjacency (known exactly) over avgdist.
+
+Half widths are z times the standard error, whose variance adds up over
+the strata, each with the finite population correction (1 - n/N), so a
+census has zero width. The ratio's standard error is the usual
+linearization over the residuals d_i - avgdist * p_i, and A/D's follows
+from it by the delta method.
+"""
+def _estimate(out_degree, unreachable, z, strata):
+
+    num_nodes = len(out_degree)
+
+    def terms(sources, sums, reached):
+        degrees = _apply_policy(sums, reached, num_nodes, unreachable)
+        a = out_degree[sources].astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ratios = np.where(degrees > 0, a / degrees, 0.0)
+
+        if unreachable == UNREACHABLE_IGNORE:
+            pairs = reached.astype(np.float64)
+        else:
+            pairs = np.full(len(sources), num_nodes - 1, dtype=np.float64)
+
+        return ratios, degrees, pairs
+    #END terms
+
+    # (population, ratios, degrees, pairs) of every stratum searched at all
+    searched = []
+    unsampled = False
+    bcomplex = total_distance = total_pairs = 0.0
+    for (sources, sums, reached), population in strata:
+        if population == 0:
+            continue
+
+        if len(sources) == 0:
+            unsampled = True
+            continue
+        #END if
+
+        ratios, degrees, pairs = terms(sources, sums, reached)
+        scale = float(population) / len(sources)
+        bcomplex = bcomplex + scale * float(np.sum(ratios))
+        total_distance = total_distance + scale * float(np.sum(degrees))
+        total_pairs = total_pairs + scale * float(np.sum(pairs))
+        searched.append((population, ratios, degrees, pairs))
+    #END for
+
+    nan = float("nan")
+    avgdist = total_distance / total_pairs if total_pairs > 0 else nan
+    adjacency = float(np.sum(out_degree)) / num_nodes if num_nodes > 0 else nan
+    ad = adjacency / avgdist if avgdist > 0 else nan
+
+    bcomplex_var = avgdist_var = 0.0
+    partial = False
+    for population, ratios, degrees, pairs in searched:
+        n = len(ratios)
+        fpc = 1.0 - float(n) / population
+        if fpc <= 0:
+            continue
+
+        partial = True
+        if n < 2:
+            unsampled = True
+            continue
+        #END if
+
+        bcomplex_var = bcomplex_var + population ** 2 * float(np.var(ratios, ddof=1)) / n * fpc
+        if avgdist > 0:
+            residuals = degrees - avgdist * pairs
+            avgdist_var = avgdist_var + population ** 2 * float(np.var(residuals, ddof=1)) / n * fpc
+    #END for
+
+    bcomplex_ci = avgdist_ci = ad_ci = 0.0
+    if unsampled:
+        bcomplex_ci = avgdist_ci = ad_ci = float("inf")
+    elif partial:
+        bcomplex_ci = z * float(np.sqrt(bcomplex_var))
+        if avgdist > 0:
+            avgdist_se = float(np.sqrt(avgdist_var)) / total_pairs
+            avgdist_ci = z * avgdist_se
+            ad_ci = z * ad * avgdist_se / avgdist
+        else:
+            avgdist_ci = ad_ci = nan
+    #END if
+
+    return {
+        "bcomplex": bcomplex,
+        "avgdist": avgdist,
+        "ad": ad,
+        "bcomplex_ci": bcomplex_ci,
+        "avgdist_ci": avgdist_ci,
+        "ad_ci": ad_ci,
+        "distsamples": sum(len(sources) for (sources, sums, reached), population in strata),
+    }
+
+#END _estimate
+
+"""
+Approximate distance_metrics from sampled BFS sources.
+
+B is dominated by the few nodes with a tiny distance degree, usually the
+ends of chains that reach one or two other words, and a uniform sample
+would mostly miss them. Those nodes are exactly the ones that cannot
+reach the hub, the node with the most in edges, which one reverse BFS
+from the hub finds. The nodes are split in to two strata, this tail and
+the rest, that reach the hub and everything it reaches, and each is
+searched in a random order fixed by seed, one block of 64 per worker at a
+time. The tail goes first, leaving one block of the budget, or half of a
+budget smaller than two blocks, for the rest, so it is searched in full
+whenever the budget allows; the estimates are
+refreshed after every block. The tail and then the rest stop at the
+first budget met:
+
+    samples        -- at most this many sources in all, tail included.
+    time_budget    -- seconds spent searching, checked after every block.
+    relative_error -- the B and average distance half widths are both
+                      within this fraction of their estimates, checked
+                      while searching the rest.
+
+A time budget still lets the first block of each stratum run, so it can
+be overrun by two blocks. With no budget, or a budget larger than the graph,
+every node is searched and the result is exact. confidence sets the
+interval level, 0.95 by default.
+"""
+def sampled_distance_metrics(graph, unreachable=UNREACHABLE_IGNORE, samples=None,
+        time_budget=None, relative_error=None, confidence=0.95, seed=0, jobs=1):
+
+    num_nodes = graph.number_of_nodes()
+    out_degree = graph.out_degree()
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2.0)
+    started = time.time()
+
+    indptr, indices, weights = graph.csr()
+    engine = DistanceEngine(indptr, indices)
+    if num_nodes == 0:
+        return distance_metrics(graph, unreachable, jobs)
+
+    # One pool for every block of both strata
+    pool = engine.start_pool(jobs) if jobs > 1 else None
+    try:
+        hub = int(np.argmax(graph.in_degree()))
+        reaching = _reaching(indptr, indices, hub)
+        random = np.random.RandomState(seed)
+        tail = np.flatnonzero(~reaching)
+        tail = tail[random.permutation(len(tail))]
+        rest = np.flatnonzero(reaching)
+        rest = rest[random.permutation(len(rest))]
+
+        limit = num_nodes if samples is None else min(samples, num_nodes)
+        step = BLOCK_SIZE * max(jobs, 1)
+
+        # Searched (sources, sums, reached) blocks of the tail and the rest
+        blocks = [[], []]
+
+        def search(stratum, order, end):
+            taken = sum(len(block[0]) for block in blocks[stratum])
+            sources = order[taken:min(taken + step, end)]
+            blocks[stratum].append((sources,) + engine.search(sources, jobs, pool))
+
+            searched = []
+            for stratum_blocks, population in zip(blocks, [len(tail), len(rest)]):
+                parts = list(zip(*stratum_blocks)) or [[np.zeros(0, dtype=np.int64)], [np.zeros(0)],
+                        [np.zeros(0, dtype=np.int64)]]
+                searched.append((tuple(np.concatenate(part) for part in parts), population))
+            #END for
+
+            return taken + len(sources), _estimate(out_degree, unreachable, z, searched)
+        #END search
+
+        def out_of_time():
+            return time_budget is not None and time.time() - started >= time_budget
+        #END out_of_time
+
+        tail_limit = min(len(tail), max(limit - min(len(rest), step), limit // 2))
+        taken = 0
+        while taken < tail_limit:
+            taken, result = search(0, tail, tail_limit)
+            if out_of_time():
+                break
+        #END while
+
+        rest_limit = min(len(rest), max(limit - taken, 1))
+        taken = 0
+        while taken < rest_limit:
+            taken, result = search(1, rest, rest_limit)
+
+            if out_of_time():
+                break
+
+            if relative_error is not None and result["distsamples"] > 1:
+                if (result["bcomplex_ci"] <= relative_error * abs(result["bcomplex"]) and
+                        result["avgdist_ci"] <= relative_error * abs(result["avgdist"])):
+                    break
+            #END if
+        #END while
+
+        if pool is not None:
+            pool.close()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    #END try
+
+    return result
+
+#END sampled_distance_metrics
@@ -0,0 +1,198 @@
+#!/usr/bin/python3
+"""
+     This file is part of Gutenberg Graphalyzer
+     Gutenberg Graphalyzer is free software: you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     Gutenberg Graphalyzer is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU General Public License for more details.
+
+     You should have received a copy of the GNU General Public License
+     along with Gutenberg Graphalyzer.  If not, see <http://www.gnu.org/licenses/>.
+
+Columnar export of the experiments table.
+
+The table is read in one query and written column by column, so reading
+it back is a handful of array loads instead of a row per book. The format
+follows the output file's extension:
+
+    .parquet  -- Apache Parquet, needs pyarrow
+    .arrow    -- Arrow IPC (Feather v2), needs pyarrow
+    .npz      -- one NumPy array per column, no extra dependencies
+
+Every experiments column is exported, with the author birth decade of
+each book from migrate-db.py's bookdecades table added when it exists
+(one row per decade for books with authors from several). Graphs are
+exported per book by graphalyzer.py --graph-format npz or batch
+--graph-dir as BigramGraph.save_npz CSR archives.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORMATS = ["parquet", "arrow", "npz"]
+
+
+"""
+Reads the experiments table in to a dictionary of column name to NumPy
+array. Integer columns stay integers; REAL columns are float64 with NULL
+as NaN. Columns holding any text, such as the etextID of a batch file
+named after something else than its number, are kept as text with NULL
+as ''. version restricts the rows to one graphalyzer.py VERSION.
+"""
+def load_experiments(dbconn, version=None):
+
+    names = [row[1] for row in dbconn.execute("PRAGMA table_info(experiments)")]
+    tables = set(row[0] for row in dbconn.execute("SELECT name FROM sqlite_master WHERE type='table'"))
+
+    columns = ", ".join("exp.%s" % name for name in names)
+    query = "SELECT %s FROM experiments exp" % columns
+    if "bookdecades" in tables:
+        names = names + ["decade"]
+        query = "SELECT %s, bd.decade FROM experiments exp LEFT JOIN bookdecades bd ON bd.etextID = exp.etextID" % columns
+    #END if
+
+    args = []
+    if version is not None:
+        query = query + " WHERE exp.versionnumber = ?"
+        args.append(version)
+    #END if
+
+    rows = dbconn.execute(query + " ORDER BY exp.etextID", args).fetchall()
+    data = list(zip(*rows)) if rows else [() for name in names]
+
+    table = {}
+    for name, values in zip(names, data):
+        if all(isinstance(value, int) for value in values) and len(values) > 0:
+            table[name] = np.array(values, dtype=np.int64)
+        elif any(isinstance(value, str) for value in values):
+            table[name] = np.array(["" if value is None else str(value) for value in values], dtype=str)
+        else:
+            table[name] = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    #END for
+
+    return table
+
+#END load_experiments
+
+def output_format(path):
+
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    if extension == "feather":
+        extension = "arrow"
+
+    if extension not in FORMATS:
+        raise ValueError("unknown format of %s, expected one of: .%s" % (path, ", .".join(FORMATS)))
+
+    return extension
+
+#END output_format
+
+"""
+Writes a dictionary of columns to path in the format of its extension.
+"""
+def write_table(table, path):
+
+    format = output_format(path)
+
+    if format == "npz":
+        with open(path, 'wb') as output:
+            np.savez_compressed(output, **table)
+        return
+    #END if
+
+    if pyarrow is None:
+        raise ImportError("writing .%s files needs pyarrow; install it or export to .npz" % format)
+
+    arrow_table = pyarrow.table(dict((name, pyarrow.array(values, from_pandas=True))
+        for name, values in table.items()))
+
+    if format == "parquet":
+        pyarrow.parquet.write_table(arrow_table, path)
+    else:
+        pyarrow.feather.write_feather(arrow_table, path)
+
+#END write_table
+
+"""
+Reads a file written by write_table back in to a dictionary of columns.
+"""
+def read_table(path):
+
+    format = output_format(path)
+
+    if format == "npz":
+        with np.load(path, allow_pickle=False) as archive:
+            return dict((name, archive[name]) for name in archive.files)
+    #END if
+
+    if pyarrow is None:
+        raise ImportError("reading .%s files needs pyarrow" % format)
+
+    if format == "parquet":
+        arrow_table = pyarrow.parquet.read_table(path)
+    else:
+        arrow_table = pyarrow.feather.read_table(path)
+
+    return dict((name, arrow_table.column(name).to_numpy()) for name in arrow_table.column_names)
+
+#END read_table
+
+def export_experiments(database, path, version=None):
+
+    dbconn = sqlite3.connect(database)
+    try:
+        table = load_experiments(dbconn, version)
+    finally:
+        dbconn.close()
+
+    write_table(table, path)
+
+    return len(table["etextID"]) if "etextID" in table else 0
+
+#END export_experiments
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Export the experiments table to a columnar file.")
+    parser.add_argument('output',
+            help="Output file: .parquet, .arrow or .npz.")
+    parser.add_argument('-d', '--database',
+            dest="DATABASE_FILE",
+            default="results/catalog.db",
+            help="Database holding the experiments table.")
+    parser.add_argument('-v', '--version',
+            dest="VERSION",
+            type=float,
+            default=None,
+            help="Only export experiments of this graphalyzer.py VERSION.")
+
+    args = parser.parse_args()
+
+    try:
+        count = export_experiments(args.DATABASE_FILE, args.output, args.VERSION)
+    except (ValueError, ImportError) as error:
+        parser.error(str(error))
+
+    sys.stderr.write("Exported %d rows to %s.\n" % (count, args.output))
+
+    return 0
+
+#END main
+
+if __name__ == "__main__":
+    sys.exit(main())
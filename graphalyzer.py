@@ -17,18 +17,89 @@ from __future__ import division
      along with Gutenberg Graphalyzer.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from nltk.tokenize import *
-import nltk
+import time
+
+# Only what every run needs, argument parsing included, is imported here.
+# The modules built on numpy are registered with lazy_import and only run,
+# importing numpy, when one of their names is first used after the
+# arguments are parsed. NLTK is imported by load_tokenizer_models and
+# networkx only for the DOT export, so 'graphalyzer.py -h' loads none of
+# them. See --profile-startup.
+STARTUP = time.perf_counter()
+
+import profiler
+bigramgraph = profiler.lazy_import("bigramgraph")
+corpusgraph = profiler.lazy_import("corpusgraph")
+distances = profiler.lazy_import("distances")
+graphcache = profiler.lazy_import("graphcache")
+metrics = profiler.lazy_import("metrics")
+resultsink = profiler.lazy_import("resultsink")
+trajectory = profiler.lazy_import("trajectory")
+
+# Only the batch and corpus worker pools need it
+multiprocessing = profiler.lazy_import("multiprocessing")
+
+from manifest import RunManifest
+import manifest
+import nltkmodels
+import textpipeline
 import re
-import networkx as nx
 import argparse
-import math
-import sys
+import atexit
+import os
+import shutil
 import sqlite3
+import sys
+import tempfile
+
+IMPORT_TIME = time.perf_counter() - STARTUP
 
 # GLOBALS
 VERSION = 1.0
 
+# Version of the tokenizers and the graph builder, part of the graph cache
+# key. Bump it with every change that parses the same text to a different
+# graph, so graphs cached by older versions are parsed again.
+PARSER_VERSION = 2
+
+# Sentence and word tokenizers, loaded once per process by
+# load_tokenizer_models
+SENTENCE_TOKENIZER = None
+WORD_TOKENIZE = None
+
+# Graph cache and graph output directory of a batch worker process, set up
+# by batch_worker_init
+WORKER_CACHE = None
+WORKER_GRAPH_DIR = None
+WORKER_PROFILE = False
+WORKER_MAX_EDGES = None
+
+# Results between cache size checks in a batch run
+CACHE_EVICT_INTERVAL = 500
+
+# The --unreachable policies, the strings of distances.UNREACHABLE_IGNORE
+# and UNREACHABLE_RAISE. Kept here so that distances is only imported
+# when the distance metrics are computed.
+UNREACHABLE_IGNORE = "ignore"
+UNREACHABLE_RAISE = "raise"
+
+# Options that change how a text is parsed or which metrics are computed.
+# They are recorded in the run manifest, so changing any of them makes a
+# batch run reprocess every text.
+DEFAULT_PARSE_OPTIONS = {"tokenizer": "nltk", "gutenberg": True, "distances": False,
+        "unreachable": UNREACHABLE_IGNORE}
+
+# The parse options that change the bigram graph itself, i.e. the graph
+# cache key, along with PARSER_VERSION. prune_hapax is only part of the
+# options when set.
+GRAPH_OPTIONS = ["tokenizer", "gutenberg", "prune_hapax"]
+
+# Options that switch the distance metrics to sampled estimates
+SAMPLING_OPTIONS = ["distance_samples", "distance_time", "distance_error"]
+
+# Formats graphalyzer.py -g can save a graph in
+GRAPH_FORMATS = ["dot", "npz"]
+
 """
 Average Edge Complexity
 < a_i > = \frac{A}{V} = \frac{E_g}{V} = E_a
@@ -40,7 +111,7 @@ Implemented based on Bonchev and Buck's "Quantitative measure of network complex
 """
 def average_edge_complexity(graph):
 
-    return graph.number_of_edges() / graph.number_of_nodes()
+    return metrics.average_edge_complexity(graph.number_of_nodes(), graph.number_of_edges())
 
 #END average_edge_complexity
 
@@ -56,12 +127,8 @@ Implemented based on Bonchev and Buck's "Quantitative measure of network complex
 """
 def normalized_edge_complexity(graph):
 
-    if(graph.number_of_selfloops() > 0):
-        return graph.number_of_edges() / (graph.number_of_nodes() * graph.number_of_nodes())
-
-    else:
-        return graph.number_of_edges() / (graph.number_of_nodes() * (graph.number_of_nodes() - 1.0))
-    #END if
+    return metrics.normalized_edge_complexity(graph.number_of_nodes(), graph.number_of_edges(),
+            graph.number_of_selfloops())
 
 #End normalized_edge_complexity
 
@@ -77,16 +144,7 @@ I_{vd} = \sum{V}{i=1}{a_i log_2 a_i}
 """
 def vector_degree_mag_info(graph):
 
-    information_content = 0.0
-
-    for n in graph.nodes():
-        degree = graph.out_degree(n)
-        if degree > 0:
-            information_content = information_content + (degree * (math.log(degree,2)))
-    #END for
-
-
-    return information_content
+    return metrics.vector_degree_mag_info(graph.out_degree())
 
 #End vertex_degree_mag_info
 
@@ -107,34 +165,7 @@ In the case of these graphs, the "weight" of an edge is he bigram count.
 """
 def shannon_graph_entropy(graph):
 
-    information_content = 0.0
-    total_edge_weight = 0.0
-
-    # Loop through each node
-    for n in graph.nodes():
-        
-        node_weight = 0.0
-
-        # Add up edge weights for each node
-        for n0, n1, edata in graph.out_edges_iter(n, data=True):
-
-            node_weight = node_weight + edata['weight']
-            
-            # Continue calculating the total edge weight for H_max
-            total_edge_weight = total_edge_weight + edata['weight']
-        #END for
-        if node_weight > 0:
-            information_content = information_content + (node_weight * math.log(node_weight,2))
-        
-    #END for
-
-    if(total_edge_weight > 0):
-        information_content = (total_edge_weight * math.log(total_edge_weight,2)) - information_content
-    else:
-        information_content = 0
-    #END if
-
-    return information_content
+    return metrics.shannon_graph_entropy(graph.out_strength())
 
 #End shannon_graph_entropy
 
@@ -145,28 +176,21 @@ Calcualtes the Average number of out_edges for the graph.
 \sum{i=1}{V}{a_i} / V
 """
 def average_adjacency(graph):
-    adj = 0.0
 
-    for n in graph.nodes_iter():
-        adj = adj + graph.out_degree(n)
-    #END For
-
-    return adj / graph.number_of_nodes()
+    return metrics.average_adjacency(graph.out_degree())
 #END average_adjacency
 
 """
 Calculates the distance degree of a specific node. The Distance degree is the 
 sum of the node's shortest paths to all other nodes in the graph.
+
+Like the networkx shortest path functions it raises an error when some
+node can not be reached. See distances.py for the other policies.
 """
 def distance_degree(graph, node):
-    
-    dist_degree = 0.0
 
-    for n in graph.nodes_iter():
-        dist_degree = dist_degree + nx.shortest_path_length(graph, source=node, target=n)
-    #END for
+    return distances.distance_degrees(graph, [node], unreachable=UNREACHABLE_RAISE)[0]
 
-    return dist_degree
 #END distance_degree
 
 """
@@ -175,46 +199,412 @@ Complexity Index B
 B = \sum{i=1}{V}{a_i / d_i}
 
 Implemented based on Bonchev and Buck's "Quantitative measure of network complexity" paper.
+
+Computed for every node at once by the bit parallel search in distances.py.
+Unreachable pairs are left out of d_i by default; see distances.py.
 """
-def complexity_index_B(graph):
+def complexity_index_B(graph, unreachable=UNREACHABLE_IGNORE, jobs=1):
+
+    return distances.distance_metrics(graph, unreachable, jobs)["bcomplex"]
+
+#End complexity_index_B
+
+"""
+Degree assortativity of the graph. Pearson correlation, over every edge,
+between the out degree of the source word and the in degree of the target
+word. Matches networkx's degree_assortativity_coefficient defaults for
+directed graphs (x='out', y='in', unweighted).
+"""
+def degree_assortativity(graph):
+
+    src, dst, weight = graph.edges()
+
+    return metrics.degree_assortativity(src, dst, graph.out_degree(), graph.in_degree())
 
-    B = 0.0
+#END degree_assortativity
 
-    for n in graph.nodes_iter():
-        B = B + (graph.out_degree(n) / distance_degree(graph, n))
+"""
+Adds the options every mode takes: the tokenizer, its model directory,
+the gutenberg marker handling and --profile-startup.
+"""
+def add_common_arguments(parser):
+
+    parser.add_argument('-n', '--nltk',
+            dest="NLTK",
+            default=True,
+            action="store_true",
+            help="Tokenize with NLTK's Punkt sentence tokenizer and word_tokenize. This is the default.")
+    parser.add_argument('-F', '--fast',
+            dest="NLTK",
+            action="store_false",
+            help="Tokenize with the compiled regular expression tokenizer instead of NLTK. Much faster; run tokenizer-agreement.py to see how its output differs.")
+    parser.add_argument('--models-dir',
+            dest="MODELS_DIR",
+            default=None,
+            help="Directory of the NLTK Punkt models, installed with nltkmodels.py --install. Defaults to $%s or nltk_data/ next to graphalyzer.py." % nltkmodels.MODEL_DIR_VARIABLE)
+    parser.add_argument('-U', '--gutenberg',
+            dest="GUTENBERG",
+            default=True,
+            action="store_true",
+            help="Skip header and footer material in project gutenberg books. This is the default.")
+    parser.add_argument('-N', '--no-gutenberg',
+            dest="GUTENBERG",
+            action="store_false",
+            help="Parse whole files, e.g. texts without project gutenberg START and END markers.")
+    parser.add_argument('--profile-startup',
+            dest="PROFILE_STARTUP",
+            default=False,
+            action="store_true",
+            help="Print the interpreter start up, import and run time to stderr on exit. See python -X importtime for the imports in detail.")
+
+#END add_common_arguments
+
+"""
+Adds the options of the distance based metrics.
+"""
+def add_distance_arguments(parser):
+
+    parser.add_argument('-D', '--distances',
+            dest="DISTANCES",
+            default=False,
+            action="store_true",
+            help="Also compute the distance based metrics: Complexity Index B, the average distance and A/D.")
+    parser.add_argument('--unreachable',
+            dest="UNREACHABLE",
+            type=unreachable_policy,
+            default=UNREACHABLE_IGNORE,
+            help="How distance metrics treat unreachable pairs: 'ignore' them (default), 'raise' an error or count them as the given distance.")
+    parser.add_argument('--distance-samples',
+            dest="DISTANCE_SAMPLES",
+            type=int,
+            default=None,
+            help="Estimate the distance metrics from at most this many sampled source words instead of all of them.")
+    parser.add_argument('--distance-time',
+            dest="DISTANCE_TIME",
+            type=float,
+            default=None,
+            help="Estimate the distance metrics from as many sampled source words as can be searched in this many seconds.")
+    parser.add_argument('--distance-error',
+            dest="DISTANCE_ERROR",
+            type=float,
+            default=None,
+            help="Sample source words until the 95%% confidence intervals of B and the average distance are within this fraction of the estimates, e.g. 0.01.")
+
+#END add_distance_arguments
+
+"""
+Adds the options of how graphs are built and cached. Without prune the
+graphs are never pruned, see corpus_main.
+"""
+def add_graph_arguments(parser, prune=True):
+
+    parser.add_argument('-C', '--cache-dir',
+            dest="CACHE_DIR",
+            default=False,
+            help="Directory of cached bigram graphs, shared by every mode. Texts parsed before with the same options are loaded from it instead of tokenized.")
+    parser.add_argument('--cache-size',
+            dest="CACHE_SIZE",
+            type=int,
+            default=None,
+            help="Size limit of the graph cache in megabytes, 10240 by default. Least recently used graphs are removed past it.")
+    parser.add_argument('--graph-memory',
+            dest="GRAPH_MEMORY",
+            type=float,
+            default=None,
+            help="Memory ceiling in megabytes of the bigram table while a graph is built or, by corpus, merged, in every worker process. Past it sorted partial counts are spilled to temporary files ($TMPDIR) and merged at the end, so huge texts take a predictable amount of memory beyond their vocabulary and final edge list.")
+
+    if prune:
+        parser.add_argument('--prune-hapax',
+                dest="PRUNE_HAPAX",
+                default=False,
+                action="store_true",
+                help="Drop the bigrams seen only once from the graph before computing the metrics. Normally lowers every metric but da, whose meaning changes; see BigramGraph.finish.")
+    else:
+        parser.set_defaults(PRUNE_HAPAX=False)
+    #END if
+
+#END add_graph_arguments
+
+"""
+Adds the worker pool size of the modes that run one.
+"""
+def add_jobs_argument(parser):
+
+    parser.add_argument('-j', '--jobs',
+            dest="JOBS",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of worker processes. Defaults to the number of CPUs.")
+
+#END add_jobs_argument
+
+"""
+Acts on the options of add_common_arguments once they are parsed. Points
+nltkmodels.py at --models-dir, through the environment so pool workers
+inherit it, and stops with a usage error before any work starts when the
+NLTK tokenizer is asked for but its models are not installed. With
+--profile-startup the startup report is printed when the process exits.
+"""
+def check_common_arguments(parser, args):
+
+    if args.PROFILE_STARTUP:
+        atexit.register(profiler.startup_report, STARTUP, IMPORT_TIME)
+
+    if args.MODELS_DIR:
+        os.environ[nltkmodels.MODEL_DIR_VARIABLE] = os.path.abspath(args.MODELS_DIR)
+
+    if args.NLTK and nltkmodels.find_models() is None:
+        parser.error(nltkmodels.MISSING_MESSAGE % (nltkmodels.model_dir(), nltkmodels.MODEL_DIR_VARIABLE))
+
+#END check_common_arguments
+
+"""
+Builds the parse options dictionary from parsed command line arguments.
+"""
+def parse_options(args):
+
+    options = dict(DEFAULT_PARSE_OPTIONS)
+    if not args.NLTK:
+        options["tokenizer"] = "fast"
+    options["gutenberg"] = args.GUTENBERG
+    options["distances"] = args.DISTANCES
+    options["unreachable"] = args.UNREACHABLE
+
+    # Like the sampling budgets, only recorded when used, so the graphs
+    # and run manifest entries of unpruned runs stay as they were
+    if args.PRUNE_HAPAX:
+        options["prune_hapax"] = True
+
+    # Sampling budgets are only part of the options when given, so runs
+    # with exact distances keep their run manifest entries
+    for name, value in [("distance_samples", args.DISTANCE_SAMPLES),
+            ("distance_time", args.DISTANCE_TIME), ("distance_error", args.DISTANCE_ERROR)]:
+        if value is not None:
+            options[name] = value
     #END for
 
-    return B
+    return options
 
-#End complexity_index_B
+#END parse_options
+
+"""
+The max_edges of the graph builder for the --graph-memory argument, None
+when it is not given.
+"""
+def graph_max_edges(args):
+
+    if args.GRAPH_MEMORY is None:
+        return None
+
+    return bigramgraph.max_edges_for_memory(args.GRAPH_MEMORY)
+
+#END graph_max_edges
+
+"""
+The graph cache size in bytes for the --cache-size argument.
+"""
+def cache_bytes(args):
+
+    if args.CACHE_SIZE is None:
+        return graphcache.DEFAULT_CACHE_SIZE
+
+    return args.CACHE_SIZE * (1 << 20)
+
+#END cache_bytes
+
+"""
+Parses the --unreachable argument: "ignore", "raise" or a distance.
+"""
+def unreachable_policy(value):
+
+    if value in (UNREACHABLE_IGNORE, UNREACHABLE_RAISE):
+        return value
+
+    try:
+        return float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected 'ignore', 'raise' or a number, got %r" % value)
+
+#END unreachable_policy
+
+"""
+Parses the etext ID out of a corpus filename, e.g. TEXTS/1342-0.txt -> 1342
+"""
+def etext_id(input_file):
+
+    path = input_file.split('/')
+    etextid = path[len(path)-1]
+    for postfix in ["-0.txt", "-8.txt", ".txt"]:
+        etextid = etextid.replace(postfix, "")
+
+    return etextid
+
+#END etext_id
+
+"""
+Returns the bigram graph of a text. With a GraphCache the graph is loaded
+from the cache when the same contents were parsed with the same options
+before, and stored in it otherwise. max_edges bounds the memory of the
+graph builder, see nltk_parse.
+"""
+def load_graph(input_file, options=DEFAULT_PARSE_OPTIONS, cache=None, content_hash=None,
+        max_edges=None):
+
+    graph = None
+    if cache is not None:
+        with profiler.stage("cache"):
+            graph_options = dict((k, options[k]) for k in GRAPH_OPTIONS if k in options)
+            graph_options["parser"] = PARSER_VERSION
+            key = cache.key(input_file, graph_options, content_hash)
+            graph = cache.get(key)
+    #END if
+
+    if graph is None:
+        graph = nltk_parse(input_file, tokenizer=options["tokenizer"], gutenberg=options["gutenberg"],
+                prune_hapax=options.get("prune_hapax", False), max_edges=max_edges)
+        if cache is not None:
+            with profiler.stage("cache"):
+                cache.put(key, graph)
+    #END if
+
+    return graph
+
+#END load_graph
+
+"""
+Parses a single text and computes its metrics. Returns the etext ID, the
+dictionary of metric results and the parsed graph.
+"""
+def analyze(input_file, options=DEFAULT_PARSE_OPTIONS, cache=None, content_hash=None,
+        distance_jobs=1, max_edges=None):
+
+    graph = load_graph(input_file, options, cache, content_hash, max_edges)
+
+    # All metrics are computed in one pass over the degree and
+    # edge weight arrays of the graph
+    results = metrics.compute_metrics(graph)
+    profiler.count(nodes=graph.number_of_nodes(), edges=graph.number_of_edges())
+
+    # Complexity Index B, the average distance and A / D need every
+    # shortest path length so they are only computed on request, and
+    # estimated from sampled sources when a sampling budget is given
+    if options["distances"]:
+        unreachable = options.get("unreachable", UNREACHABLE_IGNORE)
+        with profiler.stage("distances"):
+            if any(name in options for name in SAMPLING_OPTIONS):
+                results.update(distances.sampled_distance_metrics(graph, unreachable,
+                        samples=options.get("distance_samples"), time_budget=options.get("distance_time"),
+                        relative_error=options.get("distance_error"), jobs=distance_jobs))
+            else:
+                results.update(distances.distance_metrics(graph, unreachable, distance_jobs))
+        #END with
+    #END if
+
+    return etext_id(input_file), results, graph
+
+#END analyze
+
+"""
+Prints the metrics of a book, or of a group with label naming its key.
+"""
+def print_metrics(etextid, results, label="EbookID"):
+
+    print("%s:%s" % (label, etextid))
+    # Print out metrics
+    # Degree assortativity
+    print("DA:" + str(results["da"]))
+    # Information content of vector degree magnitudes
+    print("Ivd:" + str(results["ivd"]))
+    # Normalized Ivd over the number of nodes in the graph
+    print("Ivdnorm:" + str(results["ivdnorm"]))
+    # Shannon Graph Information based on edge weights, i.e., bigram counts
+    print("SI:" + str(results["si"]))
+    print("SInorm:" + str(results["sinorm"]))
+    # Normalized Edge Complexity
+    print("NEC:" + str(results["nec"]))
+    # Average Edge Complexity
+    print("AEC:" + str(results["aec"]))
+
+    if "bcomplex" in results:
+        # Complexity Index B
+        print("B:" + str(results["bcomplex"]))
+        # Average shortest path length
+        print("AvgDist:" + str(results["avgdist"]))
+        # Average adjacency over average distance
+        print("A/D:" + str(results["ad"]))
+    #END if
+
+    if results.get("distsamples") is not None and results["bcomplex_ci"] != 0:
+        # Sampled estimates, with the half widths of their 95% confidence intervals
+        print("DistSamples:" + str(results["distsamples"]))
+        print("B_CI:" + str(results["bcomplex_ci"]))
+        print("AvgDist_CI:" + str(results["avgdist_ci"]))
+        print("A/D_CI:" + str(results["ad_ci"]))
+    #END if
+
+#END print_metrics
+
+"""
+Hands one experiment row, and optionally its run manifest entry, to a
+ResultSink.
+"""
+def store_metrics(sink, etextid, results, entry=None):
+
+    sink.add([VERSION, etextid] + [results.get(name) for name in metrics.METRIC_NAMES +
+            metrics.DISTANCE_METRIC_NAMES], entry)
+
+#END store_metrics
 
 def main():
 
+    # The batch sub command runs a whole corpus in one process
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        return batch_main(sys.argv[2:])
+
+    # The corpus sub command merges the graphs of groups of books
+    if len(sys.argv) > 1 and sys.argv[1] == "corpus":
+        return corpus_main(sys.argv[2:])
+
+    # The trajectory sub command follows the metrics through one book
+    if len(sys.argv) > 1 and sys.argv[1] == "trajectory":
+        return trajectory_main(sys.argv[2:])
+
     # Parse command line arguments
-    parser = argparse.ArgumentParser()
+    parser = argparse.ArgumentParser(epilog="Run '%(prog)s batch -h' to analyze a whole corpus with a worker pool "
+            "and '%(prog)s corpus -h' for the metrics of merged corpus, author or subject graphs. "
+            "'%(prog)s trajectory -h' follows the metrics through the course of a book.")
     parser.add_argument('-i', '--input',
             dest="INPUT_FILE",
             default="test.txt")
     parser.add_argument('-g', '--graph',
             dest="GRAPH_FILE",
             default=False,
-            help="Filename to save the GraphViz Graph to. Automatically appends .dot")
+            help="Filename to save the graph to. Automatically appends .dot or .npz, see --graph-format.")
+    parser.add_argument('--graph-format',
+            dest="GRAPH_FORMAT",
+            default="dot",
+            choices=GRAPH_FORMATS,
+            help="Format of the saved graph: GraphViz 'dot' (the default) or 'npz', the compressed CSR arrays and vocabulary BigramGraph.load_npz reads back. npz is a small fraction of the DOT size and much faster to write and read.")
     parser.add_argument('-o', '--output-db',
             dest="OUTPUTDB",
             default=False,
             help="The database file to store experiment results.")
-    parser.add_argument('-n', '--nltk',
-            dest="NLTK",
-            default=True,
-            action="store_true",
-            help="Disable Regexp parsing and enable NLTK parsing. (No longer has an affect as Regexp is disabled by default.")
-    parser.add_argument('-U', '--gutenberg',
-            dest="GUTENBERG",
-            default=True,
-            action="store_true",
-            help="Enables support to skip header and footer material in project gutenberg books.")
+    parser.add_argument('--distance-jobs',
+            dest="DISTANCE_JOBS",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Worker processes for the distance metrics. Defaults to the number of CPUs.")
+    add_common_arguments(parser)
+    add_distance_arguments(parser)
+    add_graph_arguments(parser)
+    parser.add_argument('--profile',
+            dest="PROFILE",
+            default=False,
+            help="Record the wall and CPU time, peak RSS, tokens, words and bigrams of every stage, as a JSON line in this file ('-' for stderr) or in its timings table when it ends in .db, and print a summary.")
 
     args = parser.parse_args()
+    check_common_arguments(parser, args)
+    options = parse_options(args)
     INPUT_FILE = args.INPUT_FILE
     GRAPH_FILE = args.GRAPH_FILE
     NLTK = args.NLTK
@@ -224,180 +614,731 @@ def main():
     graph = None
 
     if(INPUT_FILE):
-        graph = nltk_parse(INPUT_FILE)
-
-        # Parse the etext ID out of the INPUT_FILE name
-        path = INPUT_FILE.split('/')
-        etextid = path[len(path)-1]
-        for postfix in ["-0.txt", "-8.txt", ".txt"]:
-            etextid = etextid.replace(postfix, "")
-       
-
-        # Pre-Computed Values Saved for Other Metrics
-        ivd = vector_degree_mag_info(graph)
-        si = shannon_graph_entropy(graph)
-
-        # Compute all other metrics
-        da = nx.degree_assortativity_coefficient(graph)
-        ivdnorm = ivd/graph.number_of_nodes()
-        sinorm = si / graph.number_of_nodes()
-        nec = normalized_edge_complexity(graph)
-        aec = average_edge_complexity(graph)
-        
-        # Metrics that take too long
-        # average_distance = nx.average_shortest_path_length(graph)
-        # <A_i> / <D_i> = A / D
-        # ad = average_adjacency(graph) / average_distance)
-        # Complexity Index B
-        # bcomplex = complexity_index_B(graph)
-       
-        print("EbookID:%s" % etextid)
-        # Print out metrics
-        # Degree assortativity
-        print("DA:" + str(da))
-        # Information content of vector degree magnitudes
-        print("Ivd:" + str(ivd))
-        # Normalized Ivd over the number of nodes in the graph
-        print("Ivdnorm:" + str(ivdnorm))
-        # Shannon Graph Information based on edge weights, i.e., bigram counts
-        print("SI:" + str(si))
-        print("SInorm:" + str(sinorm))
-        # Normalized Edge Complexity
-        print("NEC:" + str(nec))
-        # Average Edge Complexity
-        print("AEC:" + str(aec))
-        
-        # Takes too long
+        if(args.PROFILE):
+            rollup = profiler.Rollup()
+            profiler.start()
+        #END if
+
+        cache = None
+        if(args.CACHE_DIR):
+            cache = graphcache.GraphCache(args.CACHE_DIR, cache_bytes(args))
+
+        etextid, results, graph = analyze(INPUT_FILE, options, cache, distance_jobs=args.DISTANCE_JOBS,
+                max_edges=graph_max_edges(args))
+
+        print_metrics(etextid, results)
 
        # The database connection is optional for testing
        # purposes
         if(OUTPUTDB):
-            # Connect to the output database
-            dbconn = sqlite3.connect(OUTPUTDB)
-
-            dbconn.execute('''INSERT INTO experiments(
-                versionnumber, etextID, da,
-                ivd, ivdnorm, si, sinorm,
-                nec, AEC) VALUES (?,?,?,?,?,?,?,?,?);''', (VERSION, etextid, da, ivd, ivdnorm, si, sinorm, nec, aec))
-            dbconn.commit()
-            dbconn.close()
+            # The sink creates the experiments table if it is missing
+            with profiler.stage("db_insert"):
+                sink = resultsink.ResultSink(OUTPUTDB)
+                store_metrics(sink, etextid, results)
+                sink.close()
         # END if
 
         # Export the graph
         if(GRAPH_FILE):
-            nx.write_dot(graph, GRAPH_FILE + ".dot")
+            save_graph(graph, GRAPH_FILE, args.GRAPH_FORMAT)
+        #END if
+
+        if(args.PROFILE):
+            record = profiler.finish().record(etextid, INPUT_FILE)
+            timing_log = profiler.TimingLog(args.PROFILE, VERSION)
+            timing_log.write(record)
+            timing_log.close()
+
+            rollup.add(record)
+            rollup.report()
         #END if
     #END if
 #END main
 
-#END print_metrics
+"""
+Saves a graph as GRAPH_FILE.dot through networkx, which needs pydot, or
+as GRAPH_FILE.npz with BigramGraph.save_npz.
+"""
+def save_graph(graph, graph_file, graph_format="dot"):
+
+    with profiler.stage("write_graph"):
+        if graph_format == "npz":
+            return graph.save_npz(graph_file + ".npz")
+
+        nx = profiler.import_module("networkx")
+        nx.drawing.nx_pydot.write_dot(graph.to_networkx(), graph_file + ".dot")
+        return graph_file + ".dot"
+    #END with
+
+#END save_graph
+
+"""
+Lists the texts a batch run should process. The input is either a corpus
+directory, which is searched recursively for .txt files, or a file that
+lists one text path per line. Paths are made absolute so the run manifest
+matches them between runs.
+"""
+def batch_inputs(source):
+
+    file_list = []
+
+    if os.path.isdir(source):
+        for dirpath, dirnames, filenames in os.walk(source):
+            for filename in filenames:
+                if filename.endswith(".txt"):
+                    file_list.append(os.path.abspath(os.path.join(dirpath, filename)))
+        #END for
+        file_list.sort()
+    else:
+        with open(source, 'r') as listing:
+            for line in listing:
+                line = line.strip()
+                if line != "":
+                    file_list.append(os.path.abspath(line))
+        #END with
+    #END if
+
+    return file_list
+
+#END batch_inputs
+
+"""
+Pool initializer. Runs once in every worker process so the tokenizer
+models are loaded once per worker instead of once per book. Workers
+share the graph cache directory but leave eviction to the parent. With
+profile set the model loading is part of the worker's first profile.
+max_edges bounds the memory every graph the worker builds takes.
+"""
+def batch_worker_init(options, cache_dir, cache_size, graph_dir=None, profile=False, max_edges=None):
+    global WORKER_CACHE, WORKER_GRAPH_DIR, WORKER_PROFILE, WORKER_MAX_EDGES
+
+    WORKER_PROFILE = profile
+    WORKER_MAX_EDGES = max_edges
+    if profile:
+        profiler.start()
+
+    if options["tokenizer"] == "nltk":
+        load_tokenizer_models()
+
+    if cache_dir:
+        WORKER_CACHE = graphcache.GraphCache(cache_dir, cache_size, auto_evict=False)
+
+    WORKER_GRAPH_DIR = graph_dir
+
+#END batch_worker_init
+
+"""
+Pool task. Returns the text's metrics along with its run manifest entry
+and, when profiling, its timings. Errors are returned rather than raised
+so one bad text does not take down the whole run.
+"""
+def batch_worker(task):
+
+    input_file, options = task
+    etextid = etext_id(input_file)
+
+    if WORKER_PROFILE and profiler.ACTIVE is None:
+        profiler.start()
+
+    try:
+        # Hashed once for both the graph cache and the run manifest
+        with profiler.stage("hash"):
+            content_hash = manifest.file_hash(input_file)
+        etextid, results, graph = analyze(input_file, options, WORKER_CACHE, content_hash,
+                max_edges=WORKER_MAX_EDGES)
+        if WORKER_GRAPH_DIR:
+            save_graph(graph, os.path.join(WORKER_GRAPH_DIR, etextid), "npz")
+        entry = manifest.file_entry(input_file, etextid, VERSION, options, manifest.STATUS_DONE,
+                content_hash=content_hash)
+    except Exception as e:
+        error = "%s: %s" % (type(e).__name__, e)
+        try:
+            entry = manifest.file_entry(input_file, etextid, VERSION, options,
+                    manifest.STATUS_FAILED, error=error)
+        except (IOError, OSError):
+            entry = None
+
+        return input_file, etextid, None, entry, error, worker_profile(etextid, input_file)
+    #END try
+
+    return input_file, etextid, results, entry, None, worker_profile(etextid, input_file)
+
+#END batch_worker
+
+"""
+Ends the profile of the book a worker finished and returns its record,
+or None when not profiling.
+"""
+def worker_profile(etextid, input_file):
+
+    profile = profiler.finish()
+    if profile is None:
+        return None
+
+    return profile.record(etextid, input_file)
+
+#END worker_profile
+
+"""
+Entry point for 'graphalyzer.py batch'. Starts the worker pool once and
+streams metric rows back to a single ResultSink in this process.
+"""
+def batch_main(argv):
+
+    parser = argparse.ArgumentParser(prog="graphalyzer.py batch",
+            description="Analyze every text of a corpus with a pool of worker processes.")
+    parser.add_argument('source',
+            help="Corpus directory to search for .txt files, or a file listing one text path per line.")
+    parser.add_argument('-o', '--output-db',
+            dest="OUTPUTDB",
+            default=False,
+            help="The database file to store experiment results.")
+    add_jobs_argument(parser)
+    add_common_arguments(parser)
+    add_distance_arguments(parser)
+    add_graph_arguments(parser)
+    parser.add_argument('-g', '--graph-dir',
+            dest="GRAPH_DIR",
+            default=False,
+            help="Directory to save the graph of every text to, as <etextID>.npz CSR archives.")
+    parser.add_argument('-b', '--batch-size',
+            dest="BATCH_SIZE",
+            type=int,
+            default=None,
+            help="Number of result rows written per database transaction, 1000 by default.")
+    parser.add_argument('-f', '--force',
+            dest="FORCE",
+            default=False,
+            action="store_true",
+            help="Reprocess every text, even those the run manifest of the output database marks as done.")
+    parser.add_argument('-q', '--quiet',
+            dest="QUIET",
+            default=False,
+            action="store_true",
+            help="Don't print the metrics of every text.")
+    parser.add_argument('--profile',
+            dest="PROFILE",
+            default=False,
+            help="Record the wall and CPU time, peak RSS, tokens, words and bigrams of every stage of every text, as JSON lines in this file ('-' for stderr) or in its timings table when it ends in .db, and print the throughput and slowest texts at the end.")
+    parser.add_argument('--profile-top',
+            dest="PROFILE_TOP",
+            type=int,
+            default=profiler.DEFAULT_TOP,
+            help="Number of texts in the slowest texts report.")
+
+    args = parser.parse_args(argv)
+    check_common_arguments(parser, args)
+
+    options = parse_options(args)
+    file_list = batch_inputs(args.source)
+    total = len(file_list)
+
+    sink = None
+    if(args.OUTPUTDB):
+        # Skip texts that already have results for this VERSION and options
+        if not args.FORCE:
+            file_list = RunManifest(args.OUTPUTDB).pending(file_list, VERSION, options)
+            sys.stderr.write("%d of %d texts are new, changed or failed.\n" % (len(file_list), total))
+        #END if
+
+        batch_size = resultsink.DEFAULT_BATCH_SIZE if args.BATCH_SIZE is None else args.BATCH_SIZE
+        sink = resultsink.ResultSink(args.OUTPUTDB, batch_size=batch_size, track_manifest=True)
+    #END if
+
+    completed = 0
+    failed = 0
+
+    cache = None
+    cache_size = cache_bytes(args)
+    if(args.CACHE_DIR):
+        cache = graphcache.GraphCache(args.CACHE_DIR, cache_size)
+
+    if(args.GRAPH_DIR and not os.path.isdir(args.GRAPH_DIR)):
+        os.makedirs(args.GRAPH_DIR)
+
+    timing_log = None
+    rollup = None
+    if(args.PROFILE):
+        timing_log = profiler.TimingLog(args.PROFILE, VERSION)
+        rollup = profiler.Rollup(args.PROFILE_TOP)
+    #END if
+
+    pool = multiprocessing.Pool(args.JOBS, initializer=batch_worker_init,
+            initargs=(options, args.CACHE_DIR, cache_size, args.GRAPH_DIR, bool(args.PROFILE),
+                graph_max_edges(args)))
+    try:
+        tasks = [(input_file, options) for input_file in file_list]
+        for input_file, etextid, results, entry, error, record in pool.imap_unordered(batch_worker, tasks):
+            if error is not None:
+                failed = failed + 1
+                sys.stderr.write("Failed %s: %s\n" % (input_file, error))
+                if sink is not None and entry is not None:
+                    sink.add_entry(entry)
+            else:
+                completed = completed + 1
+                if cache is not None and completed % CACHE_EVICT_INTERVAL == 0:
+                    cache.evict()
+
+                if not args.QUIET:
+                    print_metrics(etextid, results)
+
+                if sink is not None:
+                    wall, cpu = time.perf_counter(), time.process_time()
+                    store_metrics(sink, etextid, results, entry)
+                    if record is not None:
+                        profiler.add_stage(record, "db_insert", time.perf_counter() - wall, time.process_time() - cpu)
+                #END if
+            #END if
+
+            if record is not None:
+                timing_log.write(record)
+                rollup.add(record)
+            #END if
+        #END for
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        if sink is not None:
+            sink.close()
+        if cache is not None:
+            cache.evict()
+        if timing_log is not None:
+            timing_log.close()
+    #END try
+
+    sys.stderr.write("Processed %d texts, %d failed.\n" % (completed, failed))
+
+    if rollup is not None:
+        rollup.report()
+        if sink is not None:
+            sys.stderr.write("Database writer: %d rows in %.3fs of transactions.\n" % (sink.rows_written, sink.write_time))
+    #END if
+
+    return 1 if failed > 0 else 0
+
+#END batch_main
+
+
+"""
+Pool task of the corpus sub command. Writes a book's graph to the spill
+directory and returns (etextID, archive path, error). A graph already
+saved by 'batch -g' is used as it is.
+"""
+def corpus_leaf_worker(task):
+
+    etextid, input_file, saved_graph, spill_file, options = task
+
+    if saved_graph is not None and os.path.exists(saved_graph):
+        return etextid, saved_graph, None
+
+    try:
+        graph = load_graph(input_file, options, WORKER_CACHE, max_edges=WORKER_MAX_EDGES)
+        return etextid, graph.save_npz(spill_file, compressed=False), None
+    except Exception as e:
+        return etextid, None, "%s: %s" % (type(e).__name__, e)
+
+#END corpus_leaf_worker
+
+"""
+Pool task of the corpus sub command. Computes the metrics of a merged
+graph and optionally saves it. Returns (group key, nodes, edges, results).
+"""
+def corpus_metrics_worker(task):
+
+    key, path, output_file = task
+
+    graph = bigramgraph.BigramGraph.load_npz(path)
+    if output_file:
+        graph.save_npz(output_file)
+
+    return key, graph.number_of_nodes(), graph.number_of_edges(), metrics.compute_metrics(graph)
+
+#END corpus_metrics_worker
+
+"""
+Entry point for 'graphalyzer.py corpus'. Merges the graphs of the books
+of every group, see corpusgraph.py, and computes the metrics of the
+merged graphs.
+"""
+def corpus_main(argv):
+
+    parser = argparse.ArgumentParser(prog="graphalyzer.py corpus",
+            description="Compute the metrics of the merged bigram graph of the whole corpus, or of every author, author birth decade or subject.")
+    parser.add_argument('catalog',
+            help="Catalog database made by make-db-py3.py, which lists the books and their groups.")
+    parser.add_argument('-b', '--by',
+            dest="BY",
+            default="corpus",
+            choices=corpusgraph.GROUPINGS,
+            help="Grouping of the books. decade needs migrate-db.py to have been run.")
+    parser.add_argument('-k', '--key',
+            dest="KEYS",
+            action="append",
+            default=None,
+            help="Only build this group, e.g. -b lcc -k PS. Can be given more than once.")
+    parser.add_argument('-t', '--texts',
+            dest="TEXTS_DIR",
+            default=".",
+            help="Directory of the text files named in the ebooks table.")
+    parser.add_argument('-g', '--graph-dir',
+            dest="GRAPH_DIR",
+            default=False,
+            help="Directory of <etextID>.npz graphs saved by 'batch -g'. Books found there are not parsed again.")
+    parser.add_argument('-o', '--output-db',
+            dest="OUTPUTDB",
+            default=False,
+            help="Database to store the group metrics in, in the groupexperiments table.")
+    parser.add_argument('--save-graphs',
+            dest="SAVE_GRAPHS",
+            default=False,
+            help="Directory to save the merged graph of every group to.")
+    parser.add_argument('-s', '--spill-dir',
+            dest="SPILL_DIR",
+            default=None,
+            help="Scratch directory for the per book and partially merged graphs. Defaults to the system temporary directory.")
+    parser.add_argument('--fan-in',
+            dest="FAN_IN",
+            type=int,
+            default=corpusgraph.DEFAULT_FAN_IN,
+            help="Graphs merged by one task.")
+    parser.add_argument('-q', '--quiet',
+            dest="QUIET",
+            default=False,
+            action="store_true",
+            help="Don't print the metrics of every group.")
+    add_jobs_argument(parser)
+    add_common_arguments(parser)
+
+    # The books are not pruned: a bigram seen once in each of two books
+    # is no hapax of their merged graph
+    add_graph_arguments(parser, prune=False)
+
+    # The distance metrics are not computed for merged graphs
+    parser.set_defaults(DISTANCES=False, UNREACHABLE=UNREACHABLE_IGNORE,
+            DISTANCE_SAMPLES=None, DISTANCE_TIME=None, DISTANCE_ERROR=None)
+
+    args = parser.parse_args(argv)
+    check_common_arguments(parser, args)
+    options = parse_options(args)
+
+    dbconn = sqlite3.connect(args.catalog)
+    try:
+        groups = corpusgraph.group_books(dbconn, args.BY, args.KEYS)
+    finally:
+        dbconn.close()
+
+    books = {}
+    for key, members in groups.items():
+        for etextid, filename in members:
+            books[etextid] = filename
+    #END for
+    sys.stderr.write("%d groups of %d books.\n" % (len(groups), len(books)))
+
+    if(args.SAVE_GRAPHS and not os.path.isdir(args.SAVE_GRAPHS)):
+        os.makedirs(args.SAVE_GRAPHS)
+
+    cache_size = cache_bytes(args)
+    spill_dir = tempfile.mkdtemp(prefix="graphalyzer-corpus-", dir=args.SPILL_DIR)
+
+    pool = multiprocessing.Pool(args.JOBS, initializer=batch_worker_init,
+            initargs=(options, args.CACHE_DIR, cache_size, None, False, graph_max_edges(args)))
+    try:
+        # Map: the graph of every book, once however many groups it is in
+        tasks = []
+        for etextid, filename in sorted(books.items()):
+            saved_graph = None
+            if(args.GRAPH_DIR):
+                saved_graph = os.path.join(args.GRAPH_DIR, "%s.npz" % etextid)
+            tasks.append((etextid, os.path.join(args.TEXTS_DIR, filename or ""), saved_graph,
+                os.path.join(spill_dir, "book-%s.npz" % etextid), options))
+        #END for
+
+        leaves = {}
+        for etextid, path, error in pool.imap_unordered(corpus_leaf_worker, tasks):
+            if error is not None:
+                sys.stderr.write("Failed %s: %s\n" % (etextid, error))
+            else:
+                leaves[etextid] = path
+        #END for
+
+        # Reduce: one merged graph per group
+        merged = corpusgraph.tree_reduce(pool, dict((key, [leaves[etextid] for etextid, filename in members
+            if etextid in leaves]) for key, members in groups.items()), spill_dir, args.FAN_IN,
+            graph_max_edges(args))
+
+        rows = []
+        tasks = [(key, path, os.path.join(args.SAVE_GRAPHS, corpusgraph.group_filename(args.BY, key))
+            if args.SAVE_GRAPHS else None) for key, path in merged.items()]
+        for key, nodes, edges, results in pool.imap(corpus_metrics_worker, tasks):
+            count = sum(1 for etextid, filename in groups[key] if etextid in leaves)
+            if not args.QUIET:
+                print("Group:%s (%d books, %d words, %d bigrams)" % (key, count, nodes, edges))
+                print_metrics(key, results, corpusgraph.GROUP_LABELS[args.BY])
+            #END if
+            rows.append([VERSION, args.BY, str(key), count, nodes, edges] +
+                    [results[name] for name in metrics.METRIC_NAMES])
+        #END for
+        pool.close()
+
+        # Groups none of whose books could be parsed have no graph
+        for key in groups:
+            if key not in merged:
+                sys.stderr.write("Group %s: none of its %d books could be parsed, no metrics.\n" %
+                        (key, len(groups[key])))
+        #END for
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    #END try
+
+    if(args.OUTPUTDB):
+        dbconn = sqlite3.connect(args.OUTPUTDB)
+        corpusgraph.create_schema(dbconn)
+        corpusgraph.store_group_metrics(dbconn, rows)
+        dbconn.close()
+    #END if
+
+    return 0
+
+#END corpus_main
+
+
+"""
+Entry point for 'graphalyzer.py trajectory'. Prints the metrics of a book
+after every N sentences, over a sliding window or per chapter, as a tab
+separated table, see trajectory.py.
+"""
+def trajectory_main(argv):
+
+    parser = argparse.ArgumentParser(prog="graphalyzer.py trajectory",
+            description="Follow the metrics through the course of a book, updating them incrementally as bigrams enter and leave the graph.")
+    parser.add_argument('-i', '--input',
+            dest="INPUT_FILE",
+            default="test.txt")
+    parser.add_argument('-e', '--every',
+            dest="EVERY",
+            type=int,
+            default=None,
+            help="Report the metrics after every this many sentences. Defaults to 100 unless --chapters is given.")
+    parser.add_argument('-w', '--window',
+            dest="WINDOW",
+            type=int,
+            default=None,
+            help="Only the last this many sentences make up the graph. Without it the graph holds everything read so far.")
+    parser.add_argument('-c', '--chapters',
+            dest="CHAPTERS",
+            default=False,
+            action="store_true",
+            help="Report the metrics of every chapter on its own. Chapters start at sentences beginning with 'chapter'.")
+    parser.add_argument('-A', '--assortativity',
+            dest="ASSORTATIVITY",
+            default=False,
+            action="store_true",
+            help="Also compute degree assortativity, which takes time proportional to the number of edges at every point.")
+    parser.add_argument('-o', '--output-db',
+            dest="OUTPUTDB",
+            default=False,
+            help="Database to store the trajectory in, in the trajectories table.")
+    add_common_arguments(parser)
+
+    args = parser.parse_args(argv)
+    check_common_arguments(parser, args)
+    every = args.EVERY
+    if every is None and not args.CHAPTERS:
+        every = 100
+
+    sentences = parse_sentences(args.INPUT_FILE, "nltk" if args.NLTK else "fast", args.GUTENBERG)
+    try:
+        points = trajectory.trajectory(sentences, every, args.WINDOW, args.CHAPTERS, args.ASSORTATIVITY)
+        etextid = etext_id(args.INPUT_FILE)
+
+        print("\t".join(["point", "sentences", "tokens", "nodes", "edges"] + metrics.METRIC_NAMES))
+        rows = []
+        for mode, point, read, tokens, nodes, edges, results in points:
+            print("\t".join([str(point), str(read), str(tokens), str(nodes), str(edges)] +
+                    ["%g" % results[name] for name in metrics.METRIC_NAMES]))
+            rows.append([VERSION, etextid, mode, point, read, tokens, nodes, edges] +
+                    [results[name] for name in metrics.METRIC_NAMES])
+        #END for
+    except ValueError as error:
+        parser.error(str(error))
+
+    if(args.OUTPUTDB):
+        dbconn = sqlite3.connect(args.OUTPUTDB)
+        trajectory.create_schema(dbconn)
+        trajectory.store_trajectory(dbconn, rows)
+        dbconn.close()
+    #END if
+
+    return 0
+
+#END trajectory_main
+
+
+"""
+Loads the Punkt sentence tokenizer from the model directory, see
+nltkmodels.py, and returns it. Only the first call in a process does any
+work, and nothing is ever downloaded.
+"""
+def load_tokenizer_models():
+    global SENTENCE_TOKENIZER, WORD_TOKENIZE
+
+    if SENTENCE_TOKENIZER is None:
+        with profiler.stage("model_load"):
+            WORD_TOKENIZE = profiler.import_module("nltk.tokenize").word_tokenize
+            SENTENCE_TOKENIZER = nltkmodels.load_sentence_tokenizer()
+    #END if
+
+    return SENTENCE_TOKENIZER
+
+#END load_tokenizer_models
 
 def is_ascii(word):
     check_val = True
     try:
-        word.decode('ascii')
-    except UnicodeDecodeError:
+        word.encode('ascii')
+    except (UnicodeEncodeError, UnicodeDecodeError):
         check_val = False
     
     return check_val
 # END is_ascii
 
-def nltk_parse(input_file):
-    # Open lit file...
-    input = open(input_file, 'r')
-    word_graph = nx.DiGraph()
-   
-    # Make sure the nltk related files are downloaded
-    nltk.download("punkt")
-    
-    # Collected count of each word
-    word_dictionary = {}
+"""
+    The \W+$ regexp will match all punctuation only word tokens.
+    The \W+ regexp will match word tokens that also include apsotraphe's for shortening.
 
-    """
-        The \W+$ regexp will match all punctuation only word tokens.
-        The \W+ regexp will match word tokens that also include apsotraphe's for shortening.
+    A research assumption should be what to do with conjunctions... best to leave them in.
+"""
+# Compile the regexp we use to detect punctuation
+PUNC_REGEXP = re.compile("\W+$")
+END_REGEXP = re.compile("\*\*\*\s{0,1}END\s*OF")
 
-        A research assumption should be what to do with conjunctions... best to leave them in.
-    """
-    # Compile the regexp we use to detect punctuation
-    punc_regexp = re.compile("\W+$")
-    start_regexp = re.compile("\*\*\*\s{0,1}START OF")
-    end_regexp = re.compile("\*\*\*\s{0,1}END\s*OF")
+"""
+Splits a sentence in to words with NLTK's word_tokenize and normalizes
+them: lowercase, '_' stripped, punctuation only and non-ASCII tokens
+dropped.
+"""
+def nltk_words(sentence):
 
-    total_words = 0
-    
-    # Always holds the previous word seene
-    previous_word = ""
+    words = []
 
-    # Skip lines until we pass gutenbergs start delimiter
-    start_str = input.readline()
-    while (start_regexp.search(start_str) == None):
-        start_str = input.readline()
+    # Split the line in to individual words
+    for word in WORD_TOKENIZE(sentence):
 
-   
-    lines = input.read()
+        # Convert to lowercase
+        word = word.lower()
 
-    # Tokenizing Sentences
-    sentences = sent_tokenize(lines)
-    for sentence in sentences:
-        if (end_regexp.search(sentence) != None):
-            break
+        # Strip out _ characters used for bolding...
+        word = word.strip('_')
 
-        # Split the line in to individual words
-        word_list = word_tokenize(sentence) 
+        # Skip tokens that are just punctuation characters.
+        if(re.match(PUNC_REGEXP, word) != None):
+            continue
 
-        # Loop through each word
-        for word in word_list:
+        if is_ascii(word):
+            words.append(word)
+    # END FOR
 
-            # Convert to lowercase
-            word = word.lower()
-            
-            # Strip out _ characters used for bolding...
-            word = word.strip('_')
-          
-            # Skip tokens that are just punctuation characters.
-            if(re.match(punc_regexp, word) != None):
-                continue
+    return words
 
-            if is_ascii(word):
-                word_graph.add_node(word)
+#END nltk_words
 
-                if (previous_word != ""):
-                    # Add an edge between our current word and our
-                    # previous word
-                    word_graph.add_edge(previous_word, word)
-        
-                    # Get current bigram count
-                    # Default value returned is 0 if it does not exist
-                    curr_count = word_graph[previous_word][word].get('weight', 0) 
+"""
+Yields the normalized word list of every sentence in the body of a
+gutenberg text. The tokenizer is either "nltk", NLTK's Punkt sentence
+tokenizer and word_tokenize, or "fast", the compiled regular expression
+tokenizer in textpipeline.py. With gutenberg set the header before the
+START marker and everything after the sentence holding the END marker are
+skipped; otherwise the whole file is parsed.
+"""
+def parse_sentences(input_file, tokenizer="nltk", gutenberg=True):
 
-                    # Increment Count
-                    curr_count = curr_count + 1
+    if tokenizer == "fast":
+        sentence_tokenizer = textpipeline.FastSentenceTokenizer()
+        sentence_words = textpipeline.fast_words
+    else:
+        # Make sure the nltk related files are downloaded
+        sentence_tokenizer = load_tokenizer_models()
+        sentence_words = nltk_words
+    #END if
 
-                    # Reset bigram count
-                    word_graph[previous_word][word]['weight'] = curr_count
+    # Only the body between gutenbergs start and end delimiters is read,
+    # chunk by chunk, split in to sentences and each sentence in to words
+    chunks = profiler.iterate("read", textpipeline.read_body_chunks(input_file, gutenberg))
+    sentences = profiler.iterate("sent_tokenize", textpipeline.stream_sentences(chunks, sentence_tokenizer))
+    end_regexp = END_REGEXP if gutenberg else None
+
+    for word_list in profiler.iterate("word_tokenize",
+            textpipeline.stream_sentence_words(sentences, sentence_words, end_regexp)):
+        yield word_list
+
+#END parse_sentences
+
+"""
+Parses a gutenberg text in to a BigramGraph. See parse_sentences for the
+tokenizer choices. With max_edges the graph's bigram table never holds
+more than that many bigrams while it is built; partial counts are spilled
+to temporary files and merged at the end. With prune_hapax the bigrams
+seen only once are dropped, see BigramGraph.finish for what that does to
+each metric.
+"""
+def nltk_parse(input_file, tokenizer="nltk", gutenberg=True, prune_hapax=False, max_edges=None):
+    word_graph = bigramgraph.BigramGraph(max_edges=max_edges)
+
+    # Collected count of each word
+    word_dictionary = {}
+
+    total_words = 0
+    
+    # Always holds the ID of the previous word seen, -1 if there is none
+    previous_word = -1
+
+    # Time in the loop itself, not in the tokenizers it pulls from, is
+    # the graph building stage of a profile
+    with profiler.stage("graph"):
+        for word_list in parse_sentences(input_file, tokenizer, gutenberg):
+
+            # Loop through each word
+            for word in word_list:
+
+                word_id = word_graph.add_node(word)
+
+                if (previous_word != -1):
+                    # Increment the bigram count between our previous
+                    # word and our current word
+                    word_graph.add_edge(previous_word, word_id)
                 # End if
 
                 # Now that we no longer need the previous_word
-                # set the current word to the previous word
-                previous_word = word
+                # set the current word to the previous word. An empty
+                # word, e.g. a lone '_' stripped, is a node but no
+                # bigram starts at it, as in the original parser.
+                previous_word = word_id if word != "" else -1
 
                 total_words = total_words + 1
-            #END if
 
-            # Dictionary output will be done later
-            # Is word in dictionary yet?
-                # Yes? Increment Count
-                # No? Set Count to 1
-        # END FOR
+                # Dictionary output will be done later
+                # Is word in dictionary yet?
+                    # Yes? Increment Count
+                    # No? Set Count to 1
+            # END FOR
 
-        # Don't save previous words between sentences
-        previous_word = ""
+            # Don't save previous words between sentences
+            previous_word = -1
 
-    #END FOR
+        #END FOR
 
+        word_graph.finish(prune_hapax)
+    #END with
+
+    profiler.count(tokens=total_words)
 
-    input.close()
     return word_graph
 """
 Regular expression parsing provides a very rudimentary set of parsing for the text file.
@@ -411,7 +1352,7 @@ from being recorded across sentence boundries is not possible.
 def regexp_parse(input_file):
     # Open lit file...
     input = open(input_file, 'r')
-    word_graph = nx.DiGraph()
+    word_graph = bigramgraph.BigramGraph()
 
     # Collected count of each word
     word_dictionary = {}
@@ -419,8 +1360,8 @@ def regexp_parse(input_file):
     # Word count of the text
     total_words = 0
 
-    # Always holds the previous word seen
-    previous_word = ""
+    # Always holds the ID of the previous word seen, -1 if there is none
+    previous_word = -1
 
     line = input.readline()
     while (line != ""):
@@ -442,27 +1383,19 @@ def regexp_parse(input_file):
             # Remove underline marks '_'
             word = word.strip('_')
 
-            word_graph.add_node(word)
-
-            if (previous_word != ""):
-                # Add an edge between our current word and our
-                # previous word
-                word_graph.add_edge(previous_word, word)
-    
-                # Get current bigram count
-                # Default value returned is 0 if it does not exist
-                curr_count = word_graph[previous_word][word].get('weight', 0) 
-
-                # Increment Count
-                curr_count = curr_count + 1
+            word_id = word_graph.add_node(word)
 
-                # Reset bigram count
-                word_graph[previous_word][word]['weight'] = curr_count
+            if (previous_word != -1):
+                # Increment the bigram count between our previous
+                # word and our current word
+                word_graph.add_edge(previous_word, word_id)
             # End if
 
             # Now that we no longer need the previous_word
-            # set the current word to the previous word
-            previous_word = word
+            # set the current word to the previous word. An empty
+            # word, e.g. a lone '_' stripped, is a node but no
+            # bigram starts at it, as in the original parser.
+            previous_word = word_id if word != "" else -1
 
             total_words = total_words + 1
 
@@ -481,4 +1414,4 @@ def regexp_parse(input_file):
 
 
 if __name__ == "__main__":
-    main();
+    sys.exit(main());
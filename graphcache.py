@@ -0,0 +1,160 @@
+"""
+     This file is part of Gutenberg Graphalyzer
+     Gutenberg Graphalyzer is free software: you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     Gutenberg Graphalyzer is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU General Public License for more details.
+
+     You should have received a copy of the GNU General Public License
+     along with Gutenberg Graphalyzer.  If not, see <http://www.gnu.org/licenses/>.
+
+On disk cache of parsed bigram graphs.
+
+The bigram graph of a text never changes for the same contents and parse
+options, so tokenizing it again after a metric changes is wasted work.
+GraphCache keeps each graph as a BigramGraph.save_npz archive named after
+the SHA1 of the text plus a hash of the parse options. The cache is
+bounded in size; when it grows past its limit the least recently used
+archives are removed. Reading an archive refreshes its mtime, which is
+what recency is measured by.
+"""
+
+import hashlib
+import os
+import tempfile
+
+from bigramgraph import BigramGraph
+import manifest
+
+# Default size limit of a cache directory
+DEFAULT_CACHE_SIZE = 10 * (1 << 30)
+
+CACHE_SUFFIX = ".npz"
+
+
+"""
+A size bounded directory of cached graphs. With auto_evict every put
+checks the size limit; pool workers turn it off and leave eviction to
+the parent process.
+"""
+class GraphCache(object):
+
+    def __init__(self, directory, max_bytes=DEFAULT_CACHE_SIZE, auto_evict=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.auto_evict = auto_evict
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    #END __init__
+
+    """
+    Cache key of a text: its content hash and the parse options.
+    """
+    def key(self, input_file, options, content_hash=None):
+        if content_hash is None:
+            content_hash = manifest.file_hash(input_file)
+
+        options_hash = hashlib.sha1(manifest.options_key(options).encode("utf-8")).hexdigest()
+
+        return "%s-%s" % (content_hash, options_hash[:16])
+    #END key
+
+    def path(self, key):
+        return os.path.join(self.directory, key + CACHE_SUFFIX)
+
+    """
+    Returns the cached graph for a key, or None on a miss. Unreadable
+    archives, e.g. left by a crash, count as misses and are removed.
+    """
+    def get(self, key):
+        path = self.path(key)
+
+        try:
+            graph = BigramGraph.load_npz(path)
+        except (IOError, OSError):
+            return None
+        except Exception:
+            self._remove(path)
+            return None
+        #END try
+
+        # Mark it as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        return graph
+    #END get
+
+    """
+    Stores a graph. The archive is written to a temporary file and renamed
+    in to place so concurrent readers never see a partial file.
+    """
+    def put(self, key, graph):
+        handle, temporary = tempfile.mkstemp(suffix=CACHE_SUFFIX, prefix=".tmp-", dir=self.directory)
+        os.close(handle)
+
+        try:
+            graph.save_npz(temporary)
+            os.rename(temporary, self.path(key))
+        except Exception:
+            self._remove(temporary)
+            raise
+        #END try
+
+        if self.auto_evict:
+            self.evict()
+    #END put
+
+    """
+    Removes the least recently used archives until the cache fits in
+    max_bytes. Returns the number of bytes removed.
+    """
+    def evict(self):
+        entries = []
+        total = 0
+
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(CACHE_SUFFIX) or entry.name.startswith(".tmp-"):
+                continue
+
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = total + stat.st_size
+        #END for
+
+        removed = 0
+        if total > self.max_bytes:
+            entries.sort()
+            for mtime, size, path in entries:
+                if total - removed <= self.max_bytes:
+                    break
+                if self._remove(path):
+                    removed = removed + size
+            #END for
+        #END if
+
+        return removed
+    #END evict
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            return False
+
+        return True
+    #END _remove
+
+#END GraphCache
@@ -14,314 +14,736 @@
 *     You should have received a copy of the GNU General Public License
 *     along with Gutenberg Graphalyzer.  If not, see <http://www.gnu.org/licenses/>.
 
-NOTE: There's currently a bug where if authors have the exact same first and last name, they won't be added as seperate author's to the database. Birth and death dates should be checked as well.
+Authors are told apart by their first and last name together with their
+birth and death dates, so two authors who share a name are kept separate.
 """
 import xml.etree.cElementTree as ET
 import sqlite3
-import glob
+import argparse
+import collections
+import json
+import mmap
+import multiprocessing
+import os
 import re
 
-# Given the rare usage of this script the parameters are hardcoded instead
-# of taken from the command line.
+# Defaults of the command line arguments
 CATALOG_FILE = "catalog.rdf"
 #CATALOG_FILE = "catalogsample.rdf"
 DATABASE_FILE = "catalog.db"
 TEXTS_DIR = "/u/nhusted/nobackup/TEXTS-UNIQUE"
 
-def main():
+# Loader processes. With more than one, or when the catalog is a directory
+# of per book RDF files (e.g. the rdf-files archive's cache/epub/*/pg*.rdf),
+# the records are parsed in parallel by load_rdf_parallel.
+JOBS = 1
 
-    file_list = glob.glob(TEXTS_DIR + "/*.txt") 
-    bookid_to_filename = {}
+# Text file variants of an etext, most preferred first: plain ASCII, then
+# -0 (UTF-8), then -8 (ISO-8859-1), the same rules as remove-dupliates.py
+TEXT_POSTFIXES = [".txt", "-0.txt", "-8.txt"]
 
-    # Clean up the file list and create a dictionary that associates
-    # ebook id's to their filenames. 
-    for i in range(0, len(file_list)):
-        t = file_list[i].split("/")
-        file_list[i] = t[len(t)-1]
+# Format version of the saved text index
+INDEX_VERSION = 1
 
-        id = file_list[i]
+# Records inserted between commits, so rows reach the database while the
+# rest of the catalog is still being parsed
+COMMIT_INTERVAL = 1000
 
-        for postfix in ["-0.txt", "-8.txt", ".txt"]:
-            id = id.replace(postfix, "")
+# Role suffix of a catalog author name, e.g. [Contributor]
+AUTHOR_ROLE = re.compile(r"\[\w*\]")
 
-        bookid_to_filename[id] = file_list[i]
+# Catalog records per task of a parallel load
+CHUNK_RECORDS = 500
 
-    # END for
+# Byte patterns iter_rdf_tasks finds the records of a catalog.rdf by
+RDF_ROOT = re.compile(br"<rdf:RDF\b[^>]*>")
+ETEXT_START = re.compile(br"<pgterms:etext\b")
+ETEXT_END = re.compile(br"</pgterms:etext>")
 
-    #print file_list
-    # Get a parsed list of etext files. They should only
-    # hae the specific etext number.
+# Year in the marc260 field of a per book RDF file
+COPYRIGHT_YEAR = re.compile(r"[Cc]opyright\D{0,10}(\d{4})")
+
+def main():
 
-    tree = ET.parse(CATALOG_FILE)
-    root = tree.getroot()
+    parser = argparse.ArgumentParser(description="Builds the catalog database of the etexts in a corpus directory from the Project Gutenberg RDF catalog.")
+    parser.add_argument('-c', '--catalog',
+            dest="CATALOG_FILE",
+            default=CATALOG_FILE,
+            help="catalog.rdf file, or a directory of per book RDF files (pg12345.rdf).")
+    parser.add_argument('-d', '--database',
+            dest="DATABASE_FILE",
+            default=DATABASE_FILE,
+            help="Catalog database to add the etexts to. It must already hold the tables of results/clean-catalog.db.")
+    parser.add_argument('-t', '--texts',
+            dest="TEXTS_DIR",
+            default=TEXTS_DIR,
+            help="Directory of the corpus text files. Only etexts found there are added.")
+    parser.add_argument('-j', '--jobs',
+            dest="JOBS",
+            type=int,
+            default=JOBS,
+            help="Processes parsing the RDF records. Directories of per book RDF files are always parsed in parallel.")
+    parser.add_argument('-x', '--index',
+            dest="INDEX_FILE",
+            default=None,
+            help="File the text directory index is saved to and read back from on later runs. Defaults to the database file with .index.json appended.")
+    parser.add_argument('-r', '--reindex',
+            dest="REINDEX",
+            default=False,
+            action="store_true",
+            help="Scan the text directory even if a saved index is up to date.")
+    parser.add_argument('--debug',
+            dest="DEBUG",
+            default=False,
+            action="store_true",
+            help="Print the parsed records instead of adding them to the database.")
+
+    args = parser.parse_args()
+    INDEX_FILE = args.INDEX_FILE
+    if(INDEX_FILE is None):
+        INDEX_FILE = args.DATABASE_FILE + ".index.json"
+
+    # Get a dictionary that associates ebook id's to their filenames.
+    bookid_to_filename = load_text_index(args.TEXTS_DIR, INDEX_FILE, args.REINDEX)
 
     # Parse the RDF files keeping in mind the list of etexts
-    # to minimize the information in the database
-    #parse_single_book_rdf(root, file_list)
-    parse_catalog_rdf(root, bookid_to_filename, debug=False)
+    # to minimize the information in the database. The catalog is
+    # streamed, so it is never held in memory as a whole.
+    if(os.path.isdir(args.CATALOG_FILE)):
+        rdf_files = []
+        for directory, dirnames, filenames in os.walk(args.CATALOG_FILE):
+            rdf_files.extend(os.path.join(directory, name) for name in filenames if name.endswith(".rdf"))
+        load_rdf_parallel(sorted(rdf_files), bookid_to_filename, args.JOBS, args.DATABASE_FILE)
+    elif(args.JOBS > 1 and not args.DEBUG):
+        load_rdf_parallel([args.CATALOG_FILE], bookid_to_filename, args.JOBS, args.DATABASE_FILE)
+    else:
+        parse_catalog_rdf(args.CATALOG_FILE, bookid_to_filename, args.DEBUG, args.DATABASE_FILE)
+    #END IF
 
 #END
 
 """
-Created to parse the large catalog.rdf files from project gutenberg. They
-contain "etext" and "file" tags for major tags. There are a few others, but
-they did not look of interest (e.g. Description). Parsing the RDF
-file also adds the final information to the database if debugging is off. 
+Indexes a corpus directory in one os.scandir pass. Returns a dictionary
+from etext ID to filename. When an etext has several variants the one
+first in TEXT_POSTFIXES is kept, like remove-dupliates.py would.
 """
-def parse_catalog_rdf(tree_root, ebook_list, debug=False):
+def index_texts(texts_dir):
 
-    # Setup the sqlite connection here so the cursor can be passed
-    # around to the various parse/insertion functions
-    db_conn = sqlite3.connect(DATABASE_FILE)
+    bookid_to_filename = {}
+    ranks = {}
 
-    for child in tree_root:
-        if(child.tag == "{http://www.gutenberg.org/rdfterms/}etext"):
+    for entry in os.scandir(texts_dir):
+        name = entry.name
+        if not name.endswith(".txt"):
+            continue
 
-            # We're skipping non-english texts because the eventual corpus targets
-            # only english literature for now.
-            language = child.find("{http://purl.org/dc/elements/1.1/}language/{http://purl.org/dc/terms/}ISO639-2/{http://www.w3.org/1999/02/22-rdf-syntax-ns#}value")
+        # The ID is the name without the longest matching postfix
+        for rank in (1, 2, 0):
+            if name.endswith(TEXT_POSTFIXES[rank]):
+                break
+        #END for
+        id = name[:-len(TEXT_POSTFIXES[rank])]
 
-            # Sometimes the language field doesn't exist
-            if (language is not None and language.text != "en"):
-                print("Not English... skipping...")
-                continue
-            #END if
-
-            # Information for DB
-            etextID = ""
-            title = ""
-            author = []
-            lccsubjects = []
-            lcshsubjects = []
-            publisher = ""
-            downloads = ""
-            copyright = ""
-            filename = ""
-            
-            # This is the etext ID
-            etextID = child.get("{http://www.w3.org/1999/02/22-rdf-syntax-ns#}ID")
-            # The etext portion needs to be parsed off
-            etextID = etextID.replace("etext", "")
-
-            # Find the proper filename based on the etextID. 
-            filename = ebook_list.get(etextID, "")
-
-            # If we haven't found the filename by this point, skip the rest of this loop
-            # because we don't want to add the information to the database
-            if(filename == ""):
-                continue
+        if rank < ranks.get(id, len(TEXT_POSTFIXES)):
+            ranks[id] = rank
+            bookid_to_filename[id] = name
+        #END if
+    #END for
 
-            # Some books are missing the title field. One example had an empty friendly title.
-            title_tag = child.find("{http://purl.org/dc/elements/1.1/}title")
-            if(title_tag is not None):
-                title = title_tag.text
-            #END IF
+    return bookid_to_filename
+
+#END FUNCTION
+
+"""
+Returns the index of a corpus directory, read from index_file when it was
+saved for the same directory and the directory has not changed since.
+Adding, removing or renaming a file changes the directory's mtime, so a
+single stat tells whether the index is stale; otherwise the directory is
+scanned with index_texts and the index saved.
+"""
+def load_text_index(texts_dir, index_file, reindex=False):
+
+    texts_dir = os.path.abspath(texts_dir)
+    mtime = os.stat(texts_dir).st_mtime
+
+    if(not reindex and os.path.exists(index_file)):
+        try:
+            with open(index_file) as input:
+                saved = json.load(input)
+
+            if(saved.get("version") == INDEX_VERSION and saved.get("texts_dir") == texts_dir and
+                    saved.get("mtime") == mtime):
+                return saved["index"]
+        except (IOError, ValueError, KeyError):
+            pass
+        #END try
+    #END if
+
+    bookid_to_filename = index_texts(texts_dir)
+
+    # Written to a temporary file first so an interrupted run never
+    # leaves a truncated index behind
+    temporary = index_file + ".tmp"
+    with open(temporary, 'w') as output:
+        json.dump({"version": INDEX_VERSION, "texts_dir": texts_dir, "mtime": mtime,
+            "index": bookid_to_filename}, output)
+    os.replace(temporary, index_file)
+
+    return bookid_to_filename
+
+#END FUNCTION
+
+"""
+Streams the top level elements of an RDF file with iterparse, yielding
+each one as soon as its closing tag is read. Once the caller is done with
+an element the root is cleared, which drops it and everything parsed
+before it, so memory stays flat however large the file is.
+"""
+def iter_rdf_records(rdf_file):
+
+    root = None
+    depth = 0
+
+    for event, elem in ET.iterparse(rdf_file, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            depth = depth + 1
+            continue
+        #END if
+
+        depth = depth - 1
+        if depth == 1:
+            yield elem
+            root.clear()
+        #END if
+    #END for
 
-            # Authors can be either single names under creator or multiple names in a list of
-            # contributors.
-            creator = child.find("{http://purl.org/dc/elements/1.1/}creator")
-            contributors = child.findall("{http://purl.org/dc/elements/1.1/}contributor/{http://www.w3.org/1999/02/22-rdf-syntax-ns#}Bag/{http://www.w3.org/1999/02/22-rdf-syntax-ns#}li")
-            for contributor in contributors:
-                author.append(contributor.text)
+#END FUNCTION
 
-            if (creator != None):
-                author.append(creator.text)
-            #End if
+# Namespaces of the catalog.rdf format
+DC = "{http://purl.org/dc/elements/1.1/}"
+DCTERMS = "{http://purl.org/dc/terms/}"
+RDF = "{http://www.w3.org/1999/02/22-rdf-syntax-ns#}"
+XSD = "{http://www.w3.org/2001/XMLSchema#}"
+PGTERMS = "{http://www.gutenberg.org/rdfterms/}"
 
-            publisher_name = child.find("{http://purl.org/dc/elements/1.1/}publisher")
-            #publisher =  publisher_name.text.encode("utf-8")
-            publisher =  publisher_name.text
+# Namespaces of the per book RDF files, e.g. pg12345.rdf
+PGTERMS_2009 = "{http://www.gutenberg.org/2009/pgterms/}"
+DCAM = "{http://purl.org/dc/dcam/}"
+MARCREL = "{http://id.loc.gov/vocabulary/relators}"
 
-            downloads = child.find("{http://www.gutenberg.org/rdfterms/}downloads/{http://www.w3.org/2001/XMLSchema#}nonNegativeInteger/{http://www.w3.org/1999/02/22-rdf-syntax-ns#}value").text
+"""
+Created to parse the large catalog.rdf files from project gutenberg. They
+contain "etext" and "file" tags for major tags. There are a few others, but
+they did not look of interest (e.g. Description). Parsing the RDF
+file also adds the final information to the database if debugging is off. 
+The catalog is read with iter_rdf_records, so every record is added as
+soon as it has been parsed and is freed right after.
+"""
+def parse_catalog_rdf(catalog_file, ebook_list, debug=False, database=None):
 
+    # Setup the sqlite connection here so the cursor can be passed
+    # around to the various parse/insertion functions
+    db_conn = sqlite3.connect(database or DATABASE_FILE)
+    writer = CatalogWriter(db_conn)
 
-            # The full path for the LCSH elements is actually:
-            #{http://purl.org/dc/terms/}subject
-            #   {http://www.w3.org/1999/02/22-rdf-syntax-ns#}Bag
-            #      {http://www.w3.org/1999/02/22-rdf-syntax-ns#}li
-            #          {http://purl.org/dc/terms/}LCSH
-            for subject in child.findall(".//{http://purl.org/dc/terms/}LCSH/{http://www.w3.org/1999/02/22-rdf-syntax-ns#}value"):
-                #subjects.append(subject.text.encode("utf-8"))
-                lcshsubjects.append(subject.text)
-            for subject in child.findall(".//{http://purl.org/dc/terms/}LCC/{http://www.w3.org/1999/02/22-rdf-syntax-ns#}value"):
-                #subjects.append(subject.text.encode("utf-8"))
-                lccsubjects.append(subject.text)
+    for child in iter_rdf_records(catalog_file):
+        if(child.tag == PGTERMS + "etext"):
+            record = parse_etext(child, ebook_list)
+            if(record is None):
+                continue
 
             # Print out information if we're debugging otherwise we add it to the database
             if(debug == True):
-                print(etextID)
-                print(filename)
-                print(downloads)
-                print(title)
-                for name in author:
-                    print(name)
-                print(publisher)
-                for subject in lcshsubjects:
-                    print(subject)
-                for subject in lccsubjects:
-                    print(subject)
-                print("---------------")
+                print_record(record)
             else:
                 # Add all relevant information to the database
-                # The order of these three functions is IMPORTANT due to foreign key 
-                # requirements. Must always be add_ebook_to_db first.
-                add_ebook_to_db(db_conn, etextID, title, publisher, copyright, downloads, filename)
-                add_author_to_db(db_conn, etextID, author)
-                add_subject_to_db(db_conn, etextID, lccsubjects, lcshsubjects)
+                writer.add(*record)
             #END IF
         else:
             print(("Unparsed tag: %s" % child.tag))
         #END IF
     #END FOR
-    db_conn.commit()
+    writer.flush()
     db_conn.close()
 
 #END FUNCTION
 
+"""
+Extracts the fields of one catalog.rdf etext element. Returns the tuple
+CatalogWriter.add takes, (etextID, title, publisher, copyright,
+downloads, filename, authors, lccsubjects, lcshsubjects), or None for
+texts that are not English or not in ebook_list.
+"""
+def parse_etext(child, ebook_list):
+
+    # We're skipping non-english texts because the eventual corpus targets
+    # only english literature for now.
+    language = child.find(DC + "language/" + DCTERMS + "ISO639-2/" + RDF + "value")
+
+    # Sometimes the language field doesn't exist
+    if (language is not None and language.text != "en"):
+        print("Not English... skipping...")
+        return None
+    #END if
+
+    # Information for DB
+    etextID = ""
+    title = ""
+    author = []
+    lccsubjects = []
+    lcshsubjects = []
+    publisher = ""
+    downloads = ""
+    copyright = ""
+    filename = ""
+
+    # This is the etext ID
+    etextID = child.get(RDF + "ID")
+    # The etext portion needs to be parsed off
+    etextID = etextID.replace("etext", "")
+
+    # Find the proper filename based on the etextID. 
+    filename = ebook_list.get(etextID, "")
+
+    # If we haven't found the filename by this point, skip the rest of this
+    # record because we don't want to add the information to the database
+    if(filename == ""):
+        return None
+
+    # Some books are missing the title field. One example had an empty friendly title.
+    title_tag = child.find(DC + "title")
+    if(title_tag is not None):
+        title = title_tag.text
+    #END IF
+
+    # Authors can be either single names under creator or multiple names in a list of
+    # contributors.
+    creator = child.find(DC + "creator")
+    contributors = child.findall(DC + "contributor/" + RDF + "Bag/" + RDF + "li")
+    for contributor in contributors:
+        author.append(contributor.text)
+
+    if (creator != None):
+        author.append(creator.text)
+    #End if
+
+    publisher_name = child.find(DC + "publisher")
+    #publisher =  publisher_name.text.encode("utf-8")
+    publisher =  publisher_name.text
+
+    downloads = child.find(PGTERMS + "downloads/" + XSD + "nonNegativeInteger/" + RDF + "value").text
+
+
+    # The full path for the LCSH elements is actually:
+    #{http://purl.org/dc/terms/}subject
+    #   {http://www.w3.org/1999/02/22-rdf-syntax-ns#}Bag
+    #      {http://www.w3.org/1999/02/22-rdf-syntax-ns#}li
+    #          {http://purl.org/dc/terms/}LCSH
+    for subject in child.findall(".//" + DCTERMS + "LCSH/" + RDF + "value"):
+        #subjects.append(subject.text.encode("utf-8"))
+        lcshsubjects.append(subject.text)
+    for subject in child.findall(".//" + DCTERMS + "LCC/" + RDF + "value"):
+        #subjects.append(subject.text.encode("utf-8"))
+        lccsubjects.append(subject.text)
+
+    return (etextID, title, publisher, copyright, downloads, filename, author, lccsubjects, lcshsubjects)
+
+#END FUNCTION
+
+def print_record(record):
+
+    etextID, title, publisher, copyright, downloads, filename, author, lccsubjects, lcshsubjects = record
+
+    print(etextID)
+    print(filename)
+    print(downloads)
+    print(title)
+    for name in author:
+        print(name)
+    print(publisher)
+    for subject in lcshsubjects:
+        print(subject)
+    for subject in lccsubjects:
+        print(subject)
+    print("---------------")
+
+#END FUNCTION
+
 """
 Parses the single book RDF files. They contain far more information than the
 catalog equivalents. In this case detailed information about authors, file
-types, and the etexts themselves.
+types, and the etexts themselves. Returns the records of the English
+ebooks in ebook_list in the same form as parse_etext.
+
+Authors are separate agent elements that the ebook refers to from its
+creator and marcrel (illustrator, editor, ...) elements. Their names are
+rebuilt in the catalog's "Last, First, birth-death" form so both formats
+go through parse_author_name. The copyright year is the first year
+following "Copyright" in the marc260 field.
 """
-#def parse_single_book_rdf(tree_root, ebook_list):
-#    #for ebook in root.findall("{http://www.gutenberg.org/2009/pgterms/}ebook"):
-#    for child in tree_root:
-#
-##        print child.tag
-##        print child.attrib
-#
-#        # We iterate through the children and switch over an ebook or agent
-#        # because this means we only loop over all entries once instead of
-#        # with the findall which potentially means we scan the document twice.
-#        # Only used with single book rdf texts
-#        if(child.tag == "{http://www.gutenberg.org/2009/pgterms/}ebook"):
-#            # Get the ebook number
-##            print child.attrib['{http://www.w3.org/1999/02/22-rdf-syntax-ns#}about']
-#
-#            # Get specific ebook information
-#            for title in child.findall("{http://purl.org/dc/terms/}title"):
-##                print title.text
-#
-#            # Get Copyright information
-#            for marc260 in child.findall("{http://www.gutenberg.org/2009/pgterms/}marc260"):
-##                print marc260.text
-#
-#
-##            print "###"
-#        elif(child.tag == "{http://www.gutenberg.org/2009/pgterms/}agent"):
-#
-#            for author_name in child.findall("{http://www.gutenberg.org/2009/pgterms/}name"):
-##                print author_name.text
-#
-#        else: # Any other tags we don't care about
-#            continue
-# END
-def add_ebook_to_db(dbc, ebookID, title, publisher, copyright, downloads, filename):
-
-        dbc.execute("INSERT INTO ebooks VALUES (?,?,?,?,?)", (ebookID, title, copyright, downloads, filename))
+def parse_single_book_rdf(tree_root, ebook_list):
+
+    # We iterate through the children and switch over an ebook or agent
+    # because this means we only loop over all entries once instead of
+    # with the findall which potentially means we scan the document twice.
+    ebooks = []
+    agents = {}
+    for child in tree_root.iter():
+        if(child.tag == PGTERMS_2009 + "ebook"):
+            ebooks.append(child)
+        elif(child.tag == PGTERMS_2009 + "agent"):
+            agents[child.get(RDF + "about")] = agent_name(child)
+        #END IF
+    #END FOR
+
+    records = []
+    for child in ebooks:
+        # Sometimes the language field doesn't exist
+        language = child.findtext(DCTERMS + "language")
+        if (language is not None and not language.strip()):
+            language = child.findtext(DCTERMS + "language/" + RDF + "Description/" + RDF + "value")
+        if (language is not None and language.strip() != "en"):
+            print("Not English... skipping...")
+            continue
+        #END if
+
+        # Get the ebook number, e.g. rdf:about="ebooks/12345"
+        etextID = child.get(RDF + "about", "").split("/")[-1]
+        filename = ebook_list.get(etextID, "")
+        if(filename == ""):
+            continue
+
+        title = child.findtext(DCTERMS + "title", "")
+        publisher = child.findtext(DCTERMS + "publisher", "")
+        downloads = child.findtext(PGTERMS_2009 + "downloads", "")
+
+        # Get Copyright information
+        copyright = ""
+        year = COPYRIGHT_YEAR.search(child.findtext(PGTERMS_2009 + "marc260", ""))
+        if(year is not None):
+            copyright = year.group(1)
+
+        author = []
+        for role in child:
+            if(role.tag != DCTERMS + "creator" and not role.tag.startswith(MARCREL)):
+                continue
+
+            about = role.get(RDF + "resource")
+            if(about is None):
+                agent = role.find(PGTERMS_2009 + "agent")
+                about = agent.get(RDF + "about") if agent is not None else None
+            #END IF
+
+            if(about in agents):
+                author.append(agents[about])
+        #END FOR
+
+        lccsubjects = []
+        lcshsubjects = []
+        for subject in child.findall(DCTERMS + "subject/" + RDF + "Description"):
+            member = subject.find(DCAM + "memberOf")
+            value = subject.findtext(RDF + "value")
+            if(member is None or value is None):
+                continue
+
+            scheme = member.get(RDF + "resource", "")
+            if(scheme == "http://purl.org/dc/terms/LCC"):
+                lccsubjects.append(value)
+            elif(scheme == "http://purl.org/dc/terms/LCSH"):
+                lcshsubjects.append(value)
+        #END FOR
+
+        records.append((etextID, title, publisher, copyright, downloads, filename,
+            author, lccsubjects, lcshsubjects))
+    #END FOR
+
+    return records
 
 #END FUNCTION
+
 """
-The name field from the catalogue will have the author's birth and death
-date. To safe space both the author is added to author details, if the
-author doesn't currently exist, and then added to bookauthors.
+Name of a per book RDF agent in the catalog's "Last, First, birth-death"
+form.
 """
-def add_author_to_db(dbc, ebookID, author_list):
-
-    for author in author_list:
-        # Place holder in case the author's aren't provided    
-        first = ""
-        last = ""
-        birth = ""
-        death = ""
-       
-        # We need to clean up the extra informationin the field
-        pattern = re.compile("\[\w*\]")
-        author = author.strip()
-        author = pattern.sub("", author)
-
-        # This splits it in to last name, firstname, and birth/death
-        parts = author.split(",")
-
-        if (len(parts) == 0):
-            first = "Unknown"
-            last = "Unknown"
-        #END IF
+def agent_name(agent):
 
-        for i in range(0,len(parts)):
-            # It's possible for there not to be a '-' and that an author's birth/death is just
-            # given as a century. If that's the case, we set it as empty
-            if("-" in parts[i]):
-                life = parts[i].split('-')
-                birth = life[0].strip()
-                death = life[1].strip()
-            else:
-                # If it's the 0th element, it's a last name
-                if (i == 0):
-                    last = parts[i].strip()
-                elif (i == 1): # If it's the 1st element, its a first name
-                    first = parts[i].strip()
-                else: # any other element is a title and we'll ignore it for now
+    name = agent.findtext(PGTERMS_2009 + "name", "")
+    birth = agent.findtext(PGTERMS_2009 + "birthdate")
+    death = agent.findtext(PGTERMS_2009 + "deathdate")
+
+    if(birth is not None or death is not None):
+        name = "%s, %s-%s" % (name, birth or "", death or "")
+
+    return name
+
+#END FUNCTION
+
+"""
+Splits the RDF inputs in to work for the loader processes. A catalog.rdf
+is scanned for the byte offsets of its etext records without parsing it
+and cut in to chunks of records_per_chunk records; every chunk is sent
+with the file's header, the XML declaration, entities and the rdf:RDF
+start tag, so a worker can parse it on its own. Any other file is taken
+to be a per book RDF file and is one task.
+"""
+def iter_rdf_tasks(rdf_files, records_per_chunk=CHUNK_RECORDS):
+
+    for rdf_file in rdf_files:
+        with open(rdf_file, 'rb') as input:
+            if input.seek(0, 2) == 0:
+                continue
+
+            data = mmap.mmap(input.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                root = RDF_ROOT.search(data)
+                first = ETEXT_START.search(data)
+                if(root is None or first is None):
+                    yield ("book", rdf_file)
                     continue
+                #END if
+
+                header = data[:root.end()]
+                start = first.start()
+                count = 0
+                for match in ETEXT_END.finditer(data, start):
+                    count = count + 1
+                    if(count == records_per_chunk):
+                        yield ("catalog", header + data[start:match.end()] + b"</rdf:RDF>")
+                        start = match.end()
+                        count = 0
+                    #END if
+                #END for
+
+                if(count > 0):
+                    yield ("catalog", header + data[start:match.end()] + b"</rdf:RDF>")
+            finally:
+                data.close()
+            #END try
+        #END with
+    #END for
+
+#END FUNCTION
+
+# ebook_list of a loader process, set by rdf_worker_init
+WORKER_EBOOK_LIST = None
+
+def rdf_worker_init(ebook_list):
+    global WORKER_EBOOK_LIST
+    WORKER_EBOOK_LIST = ebook_list
+
+"""
+Parses one task from iter_rdf_tasks and returns its records.
+"""
+def rdf_worker(task):
+
+    kind, payload = task
+    records = []
+
+    if(kind == "catalog"):
+        for child in ET.fromstring(payload):
+            if(child.tag == PGTERMS + "etext"):
+                record = parse_etext(child, WORKER_EBOOK_LIST)
+                if(record is not None):
+                    records.append(record)
             #END IF
         #END FOR
+    else:
+        records = parse_single_book_rdf(ET.parse(payload).getroot(), WORKER_EBOOK_LIST)
+    #END IF
 
+    return records
 
-        # Add the author to the author's database if they're not already there
-        r = dbc.execute("SELECT authorID FROM authordetails WHERE first=? AND last=?", (first, last,))
-        id = r.fetchone()
+#END FUNCTION
 
-        # Add the author to the list of ebook ids and authors
-        if (id is None):
-            dbc.execute("INSERT INTO authordetails(first, last, birth, death) VALUES(?, ?, ?, ?)", (first, last, birth, death,))
-            r = dbc.execute("SELECT authorID FROM authordetails WHERE first=? AND last=?", (first, last,))
-            id = r.fetchone()
-        #END IF
+"""
+Loads catalog.rdf files and per book RDF files with a pool of jobs
+processes. The workers parse the records and extract their fields, the
+parent process is the only database writer. Chunks are handed back in
+order, so the database is the same as a serial parse_catalog_rdf run.
+"""
+def load_rdf_parallel(rdf_files, ebook_list, jobs=None, database=None):
+
+    db_conn = sqlite3.connect(database or DATABASE_FILE)
+    writer = CatalogWriter(db_conn)
+
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+
+    # Pool.imap would read every chunk of the catalog ahead, so at most a
+    # few tasks per worker are in flight and results are taken in order
+    pending = collections.deque()
+    pool = multiprocessing.Pool(jobs, initializer=rdf_worker_init, initargs=(ebook_list,))
+    try:
+        for task in iter_rdf_tasks(rdf_files):
+            pending.append(pool.apply_async(rdf_worker, (task,)))
+            if(len(pending) >= 2 * jobs):
+                for record in pending.popleft().get():
+                    writer.add(*record)
+        #END for
+
+        while pending:
+            for record in pending.popleft().get():
+                writer.add(*record)
+        #END while
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    #END try
+
+    writer.flush()
+    db_conn.close()
+
+#END FUNCTION
 
-        dbc.execute("INSERT INTO bookauthors VALUES(?,?)", (ebookID, id[0],))
+"""
+Splits a catalog author name, e.g. "Fortune, Timothy Thomas, 1856-1928
+[Contributor]", in to (first, last, birth, death). Missing parts are
+empty strings.
+"""
+def parse_author_name(author):
+
+    # Place holder in case the author's aren't provided    
+    first = ""
+    last = ""
+    birth = ""
+    death = ""
+
+    # We need to clean up the extra informationin the field
+    author = author.strip()
+    author = AUTHOR_ROLE.sub("", author)
+
+    # This splits it in to last name, firstname, and birth/death
+    parts = author.split(",")
+
+    if (len(parts) == 0):
+        first = "Unknown"
+        last = "Unknown"
+    #END IF
+
+    for i in range(0,len(parts)):
+        # It's possible for there not to be a '-' and that an author's birth/death is just
+        # given as a century. If that's the case, we set it as empty
+        if("-" in parts[i]):
+            life = parts[i].split('-')
+            birth = life[0].strip()
+            death = life[1].strip()
+        else:
+            # If it's the 0th element, it's a last name
+            if (i == 0):
+                last = parts[i].strip()
+            elif (i == 1): # If it's the 1st element, its a first name
+                first = parts[i].strip()
+            else: # any other element is a title and we'll ignore it for now
+                continue
+        #END IF
     #END FOR
 
-    return
+    return (first, last, birth, death)
+
+#END FUNCTION
 
 """
-The subject is added to subjectdetails, if it does not already exist,
-and booksubjects at the same time to conserve space. 
-"""
-def add_subject_to_db(dbc, ebookID, lccsubject_list, lcshsubject_list):
+Writes parsed catalog records to the database.
 
-    for subject in lccsubject_list:
+Author and subject IDs are looked up in dictionaries seeded from the
+existing tables, so a known author or subject costs no query and a new
+one a single INSERT whose ID is the cursor's lastrowid. The ebooks,
+bookauthors, lccmap and lcshmap rows are queued and written with
+executemany every COMMIT_INTERVAL records, one transaction per batch.
+"""
+class CatalogWriter(object):
+
+    def __init__(self, dbc):
+        self.dbc = dbc
+
+        # (first, last, birth, death) -> authorID and subject -> subjectID.
+        # If a table already holds duplicates the first ID is used.
+        self.authors = {}
+        for row in dbc.execute("SELECT authorID, first, last, birth, death FROM authordetails ORDER BY authorID"):
+            self.authors.setdefault(tuple(row[1:]), row[0])
+
+        self.lccsubjects = {}
+        self.lcshsubjects = {}
+        for table, ids in [("lccsubjects", self.lccsubjects), ("lcshsubjects", self.lcshsubjects)]:
+            for subjectID, subject in dbc.execute("SELECT subjectID, subject FROM %s ORDER BY subjectID" % table):
+                ids.setdefault(subject, subjectID)
+        #END for
+
+        self.ebooks = []
+        self.bookauthors = []
+        self.lccmap = []
+        self.lcshmap = []
+    #END __init__
+
+    """
+    Queues one ebook with its authors, as the raw catalog names, and its
+    LCC and LCSH subjects.
+    """
+    def add(self, ebookID, title, publisher, copyright, downloads, filename,
+            author_list, lccsubject_list, lcshsubject_list):
+
+        self.ebooks.append((ebookID, title, copyright, downloads, filename))
+
+        for author in author_list:
+            self.bookauthors.append((ebookID, self.author_id(parse_author_name(author))))
+
+        for subject in lccsubject_list:
+            self.lccmap.append((ebookID, self.subject_id("lccsubjects", self.lccsubjects, subject)))
+
+        for subject in lcshsubject_list:
+            self.lcshmap.append((ebookID, self.subject_id("lcshsubjects", self.lcshsubjects, subject)))
+
+        if (len(self.ebooks) >= COMMIT_INTERVAL):
+            self.flush()
+    #END add
+
+    """
+    Returns the ID of an author, adding them to authordetails first if they
+    are new.
+    """
+    def author_id(self, name):
+        id = self.authors.get(name)
 
-        # Need to obtain the subject ID if it exists.
-        r = dbc.execute("SELECT subjectID FROM lccsubjects WHERE subject=?", (subject,))
-        id = r.fetchone()
-        
         if (id is None):
-            # If it doesn't exist we need to Insert the subject, get its id, then add it to the booksubjects
-            dbc.execute("INSERT INTO lccsubjects(subject) VALUES (?)", (subject,))
-            r = dbc.execute("SELECT subjectID FROM lccsubjects WHERE subject=?", (subject,))
-            id = r.fetchone()
-        # END IF
-        
-        dbc.execute("INSERT INTO lccmap VALUES(?,?)", (ebookID, id[0],))
-    #END FOR
-    
-    for subject in lcshsubject_list:
+            id = self.dbc.execute("INSERT INTO authordetails(first, last, birth, death) VALUES(?, ?, ?, ?)", name).lastrowid
+            self.authors[name] = id
+        #END IF
+
+        return id
+    #END author_id
+
+    def subject_id(self, table, ids, subject):
+        id = ids.get(subject)
 
-        # Need to obtain the subject ID if it exists.
-        r = dbc.execute("SELECT subjectID FROM lcshsubjects WHERE subject=?", (subject,))
-        id = r.fetchone()
-        
         if (id is None):
-            # If it doesn't exist we need to Insert the subject, get its id, then add it to the booksubjects
-            dbc.execute("INSERT INTO lcshsubjects(subject) VALUES (?)", (subject,))
-            r = dbc.execute("SELECT subjectID FROM lcshsubjects WHERE subject=?", (subject,))
-            id = r.fetchone()
-        # END IF
-        
-        dbc.execute("INSERT INTO lcshmap VALUES(?,?)", (ebookID, id[0],))
-    #END FOR
+            id = self.dbc.execute("INSERT INTO %s(subject) VALUES (?)" % table, (subject,)).lastrowid
+            ids[subject] = id
+        #END IF
 
-#END FUNCTION
+        return id
+    #END subject_id
+
+    """
+    Writes the queued rows and commits. The ebooks go first because the
+    other tables reference them.
+    """
+    def flush(self):
+        self.dbc.executemany("INSERT INTO ebooks VALUES (?,?,?,?,?)", self.ebooks)
+        self.dbc.executemany("INSERT INTO bookauthors VALUES(?,?)", self.bookauthors)
+        self.dbc.executemany("INSERT INTO lccmap VALUES(?,?)", self.lccmap)
+        self.dbc.executemany("INSERT INTO lcshmap VALUES(?,?)", self.lcshmap)
+        self.dbc.commit()
+
+        self.ebooks = []
+        self.bookauthors = []
+        self.lccmap = []
+        self.lcshmap = []
+    #END flush
+
+#END CatalogWriter
 
 if __name__ == "__main__":
     main()
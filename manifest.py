@@ -0,0 +1,161 @@
+"""
+     This file is part of Gutenberg Graphalyzer
+     Gutenberg Graphalyzer is free software: you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     Gutenberg Graphalyzer is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU General Public License for more details.
+
+     You should have received a copy of the GNU General Public License
+     along with Gutenberg Graphalyzer.  If not, see <http://www.gnu.org/licenses/>.
+
+Run manifest for resumable batch runs.
+
+Every text a batch run finishes gets a row in the runmanifest table of the
+output database: its path, etext ID, size, mtime, content hash, the
+analyzer VERSION, the parse options and whether it succeeded. The rows are
+written in the same transaction as the experiment rows, so a text is only
+marked done once its results are on disk. A later run skips every text
+whose manifest row is done for the same VERSION and options and whose
+contents have not changed.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+MANIFEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runmanifest(
+    path TEXT PRIMARY KEY,  -- Path of the text as given to the batch run
+    etextID INTEGER,
+    size INTEGER,           -- File size in bytes
+    mtime REAL,             -- Modification time of the file
+    hash TEXT,              -- SHA1 of the file contents
+    versionnumber INTEGER,  -- graphalyzer.py VERSION used for the run
+    options TEXT,           -- Parse options as sorted JSON
+    status TEXT,            -- 'done' or 'failed'
+    error TEXT,             -- Error message of failed texts
+    completed REAL          -- Time the row was written
+);
+"""
+
+MANIFEST_COLUMNS = ["path", "etextID", "size", "mtime", "hash", "versionnumber",
+        "options", "status", "error", "completed"]
+
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# Files are hashed in blocks of this many bytes
+HASH_BLOCK_SIZE = 1 << 20
+
+
+"""
+SHA1 of a file's contents.
+"""
+def file_hash(path):
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as input:
+        block = input.read(HASH_BLOCK_SIZE)
+        while block:
+            digest.update(block)
+            block = input.read(HASH_BLOCK_SIZE)
+    #END with
+
+    return digest.hexdigest()
+
+#END file_hash
+
+"""
+Canonical string form of a parse options dictionary.
+"""
+def options_key(options):
+
+    return json.dumps(options, sort_keys=True)
+
+#END options_key
+
+"""
+Builds a manifest row for a text. The content hash is computed here
+unless it is passed in.
+"""
+def file_entry(path, etextid, version, options, status, error=None, content_hash=None):
+
+    stat = os.stat(path)
+    if content_hash is None:
+        content_hash = file_hash(path)
+
+    return (path, etextid, stat.st_size, stat.st_mtime, content_hash, version,
+            options_key(options), status, error, time.time())
+
+#END file_entry
+
+def create_schema(dbconn):
+
+    dbconn.executescript(MANIFEST_SCHEMA)
+
+"""
+Writes manifest rows with an open connection. Committing is left to the
+caller so the rows can share a transaction with the experiment rows.
+"""
+def record(dbconn, entries):
+
+    dbconn.executemany("INSERT OR REPLACE INTO runmanifest(%s) VALUES (%s)" % (
+            ", ".join(MANIFEST_COLUMNS), ", ".join(["?"] * len(MANIFEST_COLUMNS))), entries)
+
+#END record
+
+
+"""
+The manifest of an output database as it was when the run started.
+"""
+class RunManifest(object):
+
+    def __init__(self, database):
+        self.database = database
+        self.entries = {}
+
+        dbconn = sqlite3.connect(database)
+        create_schema(dbconn)
+        for row in dbconn.execute("SELECT %s FROM runmanifest" % ", ".join(MANIFEST_COLUMNS)):
+            self.entries[row[0]] = dict(zip(MANIFEST_COLUMNS, row))
+        dbconn.close()
+    #END __init__
+
+    """
+    True if the text has a done entry for this version and these options
+    and its contents have not changed since. Size and mtime are checked
+    first; the file is only hashed when one of them differs.
+    """
+    def is_current(self, path, version, options):
+        entry = self.entries.get(path)
+
+        if entry is None or entry["status"] != STATUS_DONE:
+            return False
+
+        if entry["versionnumber"] != version or entry["options"] != options_key(options):
+            return False
+
+        stat = os.stat(path)
+        if stat.st_size == entry["size"] and stat.st_mtime == entry["mtime"]:
+            return True
+
+        return stat.st_size == entry["size"] and file_hash(path) == entry["hash"]
+    #END is_current
+
+    """
+    Filters a list of texts down to the new, changed and failed ones.
+    """
+    def pending(self, file_list, version, options):
+
+        return [path for path in file_list if not self.is_current(path, version, options)]
+
+    #END pending
+
+#END RunManifest
@@ -0,0 +1,181 @@
+"""
+     This file is part of Gutenberg Graphalyzer
+     Gutenberg Graphalyzer is free software: you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     Gutenberg Graphalyzer is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU General Public License for more details.
+
+     You should have received a copy of the GNU General Public License
+     along with Gutenberg Graphalyzer.  If not, see <http://www.gnu.org/licenses/>.
+
+Vectorized Bonchev and Buck complexity metrics.
+
+Every kernel works on plain NumPy arrays taken from a BigramGraph: the out
+degree of every node, the weighted out strength (summed bigram counts) of
+every node and, for degree assortativity, the edge list. compute_metrics
+builds those arrays once and returns every value main() reports.
+"""
+
+import math
+import numpy as np
+
+import profiler
+
+# Order of the metrics as they are stored in the experiments table
+METRIC_NAMES = ["da", "ivd", "ivdnorm", "si", "sinorm", "nec", "aec"]
+
+# Columns of the optional distance based metrics computed by distances.py,
+# with the confidence interval half widths of sampled estimates and the
+# number of BFS sources they used
+DISTANCE_METRIC_NAMES = ["bcomplex", "avgdist", "ad", "bcomplex_ci", "avgdist_ci", "ad_ci", "distsamples"]
+
+
+"""
+\sum{i}{x_i log_2 x_i} over the positive entries of x.
+"""
+def xlogx_sum(x):
+
+    x = np.asarray(x, dtype=np.float64)
+    x = x[x > 0]
+
+    return float(np.dot(x, np.log2(x)))
+
+#END xlogx_sum
+
+"""
+Vertex degree magnitude-based information content.
+
+I_{vd} = \sum{V}{i=1}{a_i log_2 a_i}
+"""
+def vector_degree_mag_info(out_degree):
+
+    return xlogx_sum(out_degree)
+
+#END vector_degree_mag_info
+
+"""
+Shannon graph entropy, Bonchev and Buck equation 15.
+
+H(W) = W log_2 W - \sum{V}{i=1}{w_i log_2 w_i}
+"""
+def shannon_graph_entropy(out_strength):
+
+    total_edge_weight = float(np.sum(out_strength))
+
+    if total_edge_weight <= 0:
+        return 0
+
+    return (total_edge_weight * math.log(total_edge_weight, 2)) - xlogx_sum(out_strength)
+
+#END shannon_graph_entropy
+
+"""
+Average Edge Complexity, E_a = E / V. NaN for a graph without nodes.
+"""
+def average_edge_complexity(num_nodes, num_edges):
+
+    if num_nodes == 0:
+        return float("nan")
+
+    return num_edges / num_nodes
+
+#END average_edge_complexity
+
+"""
+Normalized Edge Complexity, E_n = E / V^2 when the graph has self loops
+and E / V(V - 1) otherwise. NaN when that is zero, i.e. for an empty
+body or a single word without a self loop.
+"""
+def normalized_edge_complexity(num_nodes, num_edges, num_selfloops):
+
+    if num_nodes == 0 or (num_nodes == 1 and num_selfloops == 0):
+        return float("nan")
+
+    if num_selfloops > 0:
+        return num_edges / (num_nodes * num_nodes)
+
+    return num_edges / (num_nodes * (num_nodes - 1.0))
+
+#END normalized_edge_complexity
+
+"""
+Average number of out edges per node.
+"""
+def average_adjacency(out_degree):
+
+    if len(out_degree) == 0:
+        return float("nan")
+
+    return float(np.sum(out_degree)) / len(out_degree)
+
+#END average_adjacency
+
+"""
+Degree assortativity. Pearson correlation, over every edge, between the
+out degree of the source and the in degree of the target. Matches the
+networkx degree_assortativity_coefficient defaults for directed graphs.
+"""
+def degree_assortativity(src, dst, out_degree, in_degree):
+
+    # Undefined for a graph without edges, like networkx
+    if len(src) == 0:
+        return float("nan")
+
+    x = out_degree[src].astype(np.float64)
+    y = in_degree[dst].astype(np.float64)
+
+    x = x - x.mean()
+    y = y - y.mean()
+
+    # Zero variance, e.g. a single edge, also leaves it undefined
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return float(np.dot(x, y) / np.sqrt(np.dot(x, x) * np.dot(y, y)))
+
+#END degree_assortativity
+
+"""
+Computes every metric reported by graphalyzer.py for a BigramGraph and
+returns them in a dictionary keyed by the experiments column names. The
+values a graph is too small for, e.g. every per node value of an empty
+body, are NaN rather than errors, so such texts still get a row.
+"""
+def compute_metrics(graph):
+
+    num_nodes = graph.number_of_nodes()
+
+    # The three arrays every metric is derived from
+    with profiler.stage("edges"):
+        src, dst, weight = graph.edges()
+        out_degree = np.bincount(src, minlength=num_nodes)
+        in_degree = np.bincount(dst, minlength=num_nodes)
+        out_strength = np.bincount(src, weights=weight, minlength=num_nodes)
+    #END with
+    num_edges = len(src)
+
+    with profiler.stage("da"):
+        da = degree_assortativity(src, dst, out_degree, in_degree)
+    with profiler.stage("ivd"):
+        ivd = vector_degree_mag_info(out_degree)
+    with profiler.stage("si"):
+        si = shannon_graph_entropy(out_strength)
+    with profiler.stage("nec"):
+        nec = normalized_edge_complexity(num_nodes, num_edges, int(np.count_nonzero(src == dst)))
+    with profiler.stage("aec"):
+        aec = average_edge_complexity(num_nodes, num_edges)
+
+    return {
+        "da": da,
+        "ivd": ivd,
+        "ivdnorm": ivd / num_nodes if num_nodes > 0 else float("nan"),
+        "si": si,
+        "sinorm": si / num_nodes if num_nodes > 0 else float("nan"),
+        "nec": nec,
+        "aec": aec,
+    }
+
+#END compute_metrics
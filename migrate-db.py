@@ -0,0 +1,147 @@
+#!/usr/bin/python3
+"""
+*     This file is part of Gutenberg Graphalyzer
+*     Gutenberg Graphalyzer is free software: you can redistribute it and/or modify
+*     it under the terms of the GNU General Public License as published by
+*     the Free Software Foundation, either version 3 of the License, or
+*     (at your option) any later version.
+*
+*     Gutenberg Graphalyzer is distributed in the hope that it will be useful,
+*     but WITHOUT ANY WARRANTY; without even the implied warranty of
+*     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+*     GNU General Public License for more details.
+*
+*     You should have received a copy of the GNU General Public License
+*     along with Gutenberg Graphalyzer.  If not, see <http://www.gnu.org/licenses/>.
+
+Prepares a catalog/experiment database for analysis. result-analysis.r
+and analysis.py join experiments, bookauthors, authordetails and ebooks
+on every query and filter authors by the year they were born; this script
+adds what those queries need:
+
+    - indexes on the join columns of bookauthors, lccmap, lcshmap and
+      experiments,
+    - integer birth_year and death_year columns in authordetails, parsed
+      once from the birth and death text, with an index on birth_year,
+    - the bookdecades table, one row per book and birth decade of one of
+      its authors, i.e. the per decade join result stored ahead of time.
+
+Every step can be repeated, so run it again after make-db-py3.py or a
+batch run added rows; the year columns and bookdecades are refreshed.
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+
+from analysis import author_column, columns
+
+# Default database, the one result-analysis.r reads
+DATABASE_FILE = "results/catalog.db"
+
+# (index name, table, columns)
+INDEXES = [
+    ("bookauthors_etextID", "bookauthors", "etextID"),
+    ("bookauthors_authorID", "bookauthors", "%(author)s, etextID"),
+    ("lccmap_etextID", "lccmap", "etextID"),
+    ("lccmap_subjectID", "lccmap", "subjectID, etextID"),
+    ("lcshmap_etextID", "lcshmap", "etextID"),
+    ("lcshmap_subjectID", "lcshmap", "subjectID, etextID"),
+    ("experiments_etextID", "experiments", "etextID"),
+    ("authordetails_birth_year", "authordetails", "birth_year"),
+]
+
+BOOKDECADES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bookdecades(
+    etextID INTEGER,
+    decade INTEGER,     -- Birth year of one of the book's authors rounded down to ten years
+    PRIMARY KEY(decade, etextID)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS bookdecades_etextID ON bookdecades(etextID);
+"""
+
+# Years are the leading digits of the text, e.g. '1856' or '1856?'. Fields
+# without any, such as '' or 'c. 1700', are NULL rather than CAST's 0.
+YEAR_SQL = "CASE WHEN CAST(%(field)s AS INTEGER) > 0 THEN CAST(%(field)s AS INTEGER) END"
+
+"""
+Adds the birth_year and death_year columns if they are missing and fills
+them from birth and death.
+"""
+def add_year_columns(dbconn):
+
+    existing = columns(dbconn, "authordetails")
+    for name in ["birth_year", "death_year"]:
+        if name not in existing:
+            dbconn.execute("ALTER TABLE authordetails ADD COLUMN %s INTEGER" % name)
+    #END for
+
+    dbconn.execute("UPDATE authordetails SET birth_year = %s, death_year = %s" %
+            (YEAR_SQL % {"field": "birth"}, YEAR_SQL % {"field": "death"}))
+
+#END add_year_columns
+
+"""
+Creates the indexes of INDEXES whose tables exist.
+"""
+def add_indexes(dbconn):
+
+    tables = set(row[0] for row in dbconn.execute("SELECT name FROM sqlite_master WHERE type='table'"))
+    author = author_column(dbconn)
+
+    for name, table, index_columns in INDEXES:
+        if table in tables:
+            dbconn.execute("CREATE INDEX IF NOT EXISTS %s ON %s(%s)" %
+                    (name, table, index_columns % {"author": author}))
+    #END for
+
+#END add_indexes
+
+"""
+Rebuilds bookdecades from bookauthors and authordetails.
+"""
+def build_bookdecades(dbconn):
+
+    dbconn.executescript(BOOKDECADES_SCHEMA)
+    dbconn.execute("DELETE FROM bookdecades")
+    dbconn.execute("""INSERT INTO bookdecades(etextID, decade)
+            SELECT DISTINCT ba.etextID, (ad.birth_year / 10) * 10
+            FROM bookauthors ba, authordetails ad
+            WHERE ad.authorID = ba.%s AND ad.birth_year IS NOT NULL""" % author_column(dbconn))
+
+#END build_bookdecades
+
+def migrate(database):
+
+    dbconn = sqlite3.connect(database)
+
+    for step in [add_year_columns, add_indexes, build_bookdecades]:
+        start = time.time()
+        step(dbconn)
+        dbconn.commit()
+        sys.stderr.write("%s: %.2fs\n" % (step.__name__, time.time() - start))
+    #END for
+
+    # Table statistics for the query planner
+    dbconn.execute("ANALYZE")
+    dbconn.commit()
+    dbconn.close()
+
+#END migrate
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Adds the indexes, author year columns and bookdecades table the analysis queries use.")
+    parser.add_argument('-d', '--database',
+            dest="DATABASE_FILE",
+            default=DATABASE_FILE,
+            help="Database holding the catalog and experiments tables.")
+
+    args = parser.parse_args()
+    migrate(args.DATABASE_FILE)
+
+#END main
+
+if __name__ == "__main__":
+    main()
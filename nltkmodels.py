@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+"""
+     This file is part of Gutenberg Graphalyzer
+     Gutenberg Graphalyzer is free software: you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     Gutenberg Graphalyzer is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU General Public License for more details.
+
+     You should have received a copy of the GNU General Public License
+     along with Gutenberg Graphalyzer.  If not, see <http://www.gnu.org/licenses/>.
+
+Provisioning of the NLTK Punkt models the NLTK tokenizer needs.
+
+Parsing never downloads anything. The models live in one local directory,
+$GRAPHALYZER_NLTK_DATA or nltk_data/ next to this file, laid out like any
+nltk_data directory. Install them there once per host, or once on a
+shared drive:
+
+    nltkmodels.py --install                   # downloads, needs the network once
+    nltkmodels.py --install --from DIR        # copies from another nltk_data
+    nltkmodels.py                             # only checks them
+
+load_sentence_tokenizer then loads the tokenizer from that directory, and
+fails straight away with a LookupError naming the directory and the
+command above when the models are missing. graphalyzer.py loads it once
+per process.
+
+Newer NLTK releases read the Punkt parameters from punkt_tab, older ones
+from the punkt pickle; either is accepted.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+
+# Environment variable naming the model directory. graphalyzer.py
+# --models-dir sets it so pool workers see the same directory.
+MODEL_DIR_VARIABLE = "GRAPHALYZER_NLTK_DATA"
+
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nltk_data")
+
+# (NLTK package, model path in the data directory), newest format first
+MODELS = [
+    ("punkt_tab", os.path.join("tokenizers", "punkt_tab", "english")),
+    ("punkt", os.path.join("tokenizers", "punkt", "english.pickle")),
+]
+
+MISSING_MESSAGE = ("NLTK Punkt models not found in %s. Install them once with "
+        "'nltkmodels.py --install' (or '--install --from NLTK_DATA_DIR' without network access), "
+        "point %s at a directory holding them, or use the fast tokenizer (-F).")
+
+
+def model_dir():
+
+    return os.environ.get(MODEL_DIR_VARIABLE) or DEFAULT_MODEL_DIR
+
+#END model_dir
+
+"""
+Returns (package, path) of the Punkt model found in directory, or None.
+"""
+def find_models(directory=None):
+
+    directory = directory or model_dir()
+
+    for package, path in MODELS:
+        if os.path.exists(os.path.join(directory, path)):
+            return package, os.path.join(directory, path)
+    #END for
+
+    return None
+
+#END find_models
+
+"""
+Loads the English Punkt sentence tokenizer from directory, without any
+download attempt. The directory is also put first on nltk.data.path so
+word_tokenize, which splits sentences itself, finds the same model.
+"""
+def load_sentence_tokenizer(directory=None):
+
+    directory = directory or model_dir()
+
+    found = find_models(directory)
+    if found is None:
+        raise LookupError(MISSING_MESSAGE % (directory, MODEL_DIR_VARIABLE))
+
+    import nltk.data
+    if directory not in nltk.data.path:
+        nltk.data.path.insert(0, directory)
+
+    package, path = found
+    if package == "punkt_tab":
+        from nltk.tokenize import PunktTokenizer
+        return PunktTokenizer("english")
+    #END if
+
+    return nltk.data.load("file:" + path)
+
+#END load_sentence_tokenizer
+
+"""
+Puts the Punkt models in directory, copied from the nltk_data directory
+source or downloaded with nltk.download, and returns find_models' result.
+"""
+def install_models(directory=None, source=None):
+
+    directory = directory or model_dir()
+
+    if source is not None:
+        found = find_models(source)
+        if found is None:
+            raise LookupError("no NLTK Punkt models in %s" % source)
+
+        # The whole package directory, e.g. tokenizers/punkt_tab
+        package_dir = os.path.join("tokenizers", found[0])
+        if os.path.exists(os.path.join(directory, package_dir)):
+            shutil.rmtree(os.path.join(directory, package_dir))
+        shutil.copytree(os.path.join(source, package_dir), os.path.join(directory, package_dir))
+    else:
+        import nltk
+        for package, path in MODELS:
+            if nltk.download(package, download_dir=directory, quiet=True, raise_on_error=False):
+                break
+        #END for
+    #END if
+
+    found = find_models(directory)
+    if found is None:
+        raise LookupError(MISSING_MESSAGE % (directory, MODEL_DIR_VARIABLE))
+
+    return found
+
+#END install_models
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Check or install the NLTK Punkt models graphalyzer.py's NLTK tokenizer loads.")
+    parser.add_argument('-d', '--dir',
+            dest="MODEL_DIR",
+            default=None,
+            help="Model directory. Defaults to $%s or %s." % (MODEL_DIR_VARIABLE, DEFAULT_MODEL_DIR))
+    parser.add_argument('-i', '--install',
+            dest="INSTALL",
+            default=False,
+            action="store_true",
+            help="Install the models if they are missing.")
+    parser.add_argument('-f', '--from',
+            dest="SOURCE",
+            default=None,
+            help="With --install, copy the models from this nltk_data directory instead of downloading them.")
+
+    args = parser.parse_args()
+    directory = args.MODEL_DIR or model_dir()
+
+    found = find_models(directory)
+    if found is None and args.INSTALL:
+        found = install_models(directory, args.SOURCE)
+
+    if found is None:
+        sys.stderr.write(MISSING_MESSAGE % (directory, MODEL_DIR_VARIABLE) + "\n")
+        return 1
+    #END if
+
+    # Make sure the models load, not just that the files are there
+    load_sentence_tokenizer(directory)
+    print("%s: %s" % found)
+
+    return 0
+
+#END main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,519 @@
+"""
+     This file is part of Gutenberg Graphalyzer
+     Gutenberg Graphalyzer is free software: you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     Gutenberg Graphalyzer is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU General Public License for more details.
+
+     You should have received a copy of the GNU General Public License
+     along with Gutenberg Graphalyzer.  If not, see <http://www.gnu.org/licenses/>.
+
+Per stage timings of graphalyzer.py runs, enabled with --profile.
+
+The parse is a chain of generators (read, sentence tokenizer, word
+tokenizer) pulled by the graph building loop, so the stages interleave.
+StageProfiler keeps a stack of the running stages and charges wall and
+CPU time only to the innermost one: while the word tokenizer waits for the
+next sentence the time goes to the sentence tokenizer, so no time is
+counted twice. Time outside every stage only shows in the book's total.
+
+Code marks its stages with the module level stage() and iterate()
+helpers, which do nothing unless start() made a profiler active in this
+process. Stages are
+
+    model_load     -- loading the Punkt model
+    hash           -- hashing the file for the run manifest and cache
+    cache          -- graph cache lookups and stores
+    body_scan      -- finding the Project Gutenberg START and END markers
+    read           -- decoding the body in chunks
+    sent_tokenize  -- splitting the chunks in to sentences
+    word_tokenize  -- splitting and normalizing the words of a sentence
+    graph          -- adding the words and bigrams to the graph
+    edges          -- folding the pending bigrams in to the edge counts
+                      and the degree arrays the metrics use
+    da, ivd, si, nec, aec, distances -- the metrics
+    write_graph    -- saving the graph with -g
+    db_insert      -- handing the row to the database
+
+A record holds every stage's wall and CPU seconds, call count and the
+process peak RSS when the stage last finished, along with the book's
+token, vocabulary and edge counts. Records are written as JSON lines or
+to a timings table; Rollup sums them up for a batch run.
+"""
+
+import collections
+import contextlib
+import heapq
+import importlib
+import importlib.util
+import json
+import os
+import sqlite3
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+TIMINGS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS timings(
+    runID INTEGER PRIMARY KEY ASC,
+    versionnumber INTEGER, -- Version of the software used for the experiments
+    etextID INTEGER,
+    stage TEXT,            -- Stage name, or 'total' for the whole book
+    wall REAL,             -- Seconds
+    cpu REAL,              -- Seconds of CPU time of the process
+    calls INTEGER,
+    peakrss INTEGER,       -- Peak resident set size of the process in bytes
+    tokens INTEGER,
+    nodes INTEGER,
+    edges INTEGER
+);
+CREATE INDEX IF NOT EXISTS timings_etextID ON timings(etextID);
+"""
+
+TIMINGS_COLUMNS = ["versionnumber", "etextID", "stage", "wall", "cpu", "calls", "peakrss",
+        "tokens", "nodes", "edges"]
+
+# Books listed by the slowest books report
+DEFAULT_TOP = 10
+
+# Items of an iterated stage between peak RSS readings
+RSS_INTERVAL = 256
+
+# Profiler of the book being processed in this process, if any
+ACTIVE = None
+
+# Seconds taken by the modules imported through import_module or loaded
+# through lazy_import
+IMPORTS = collections.OrderedDict()
+
+
+"""
+Peak resident set size of this process in bytes, 0 where getrusage is
+not available. Linux reports ru_maxrss in kilobytes, macOS in bytes.
+"""
+def peak_rss():
+
+    if resource is None:
+        return 0
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+#END peak_rss
+
+"""
+Imports a module on first use and records how long that took, for the
+dependencies graphalyzer.py only loads on the code paths that need them.
+"""
+def import_module(name):
+
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    IMPORTS[name] = time.perf_counter() - start
+
+    return module
+
+#END import_module
+
+"""
+Module loader that records how long running the module took.
+"""
+class _TimedLoader(object):
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+    #END __init__
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        start = time.perf_counter()
+        self.loader.exec_module(module)
+        IMPORTS[self.name] = time.perf_counter() - start
+    #END exec_module
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+#END _TimedLoader
+
+"""
+Returns the module name without running it yet: importlib's LazyLoader
+runs it on the first attribute access, so a plain 'import name' anywhere
+afterwards is free until the module is actually used. The time of that
+first use is recorded like import_module's. Modules imported before are
+returned as they are.
+"""
+def lazy_import(name):
+
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(_TimedLoader(name, spec.loader))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+
+    return module
+
+#END lazy_import
+
+"""
+Seconds since this process started, from /proc on Linux, in clock ticks
+of usually 10ms. None elsewhere.
+"""
+def process_age():
+
+    try:
+        with open("/proc/self/stat") as stat:
+            # Fields after the command name, which may hold spaces
+            fields = stat.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as uptime:
+            now = float(uptime.read().split()[0])
+
+        return now - int(fields[19]) / float(os.sysconf("SC_CLK_TCK"))
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+
+#END process_age
+
+"""
+Writes where the time of a run went: interpreter start up before the
+first import of the script, its imports, the modules it imported lazily
+and everything else. start is time.perf_counter() before the imports and
+import_seconds how long they took.
+"""
+def startup_report(start, import_seconds, output=sys.stderr):
+
+    run = time.perf_counter() - start
+    age = process_age()
+
+    output.write("Startup profile:\n")
+    if age is not None:
+        output.write("%-24s %9.1f ms\n" % ("interpreter", max(age - run, 0) * 1000))
+    output.write("%-24s %9.1f ms\n" % ("imports", import_seconds * 1000))
+    for name, seconds in IMPORTS.items():
+        output.write("%-24s %9.1f ms\n" % ("  " + name + " (lazy)", seconds * 1000))
+    output.write("%-24s %9.1f ms\n" % ("run", (run - import_seconds) * 1000))
+    if age is not None:
+        output.write("%-24s %9.1f ms\n" % ("total", max(age, run) * 1000))
+
+#END startup_report
+
+"""
+Exclusive wall and CPU time of the stages of one book.
+"""
+class StageProfiler(object):
+
+    def __init__(self):
+        self.stages = collections.OrderedDict()
+        self.counts = {"tokens": 0, "nodes": 0, "edges": 0}
+
+        # [stage, wall, cpu] of every running stage, innermost last, with
+        # the clocks as of when it last started or resumed
+        self._stack = []
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+    #END __init__
+
+    def _stats(self, name):
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = {"wall": 0.0, "cpu": 0.0, "calls": 0, "peakrss": 0}
+        return stats
+    #END _stats
+
+    def _charge(self, wall, cpu):
+        if self._stack:
+            top = self._stack[-1]
+            stats = self._stats(top[0])
+            stats["wall"] = stats["wall"] + wall - top[1]
+            stats["cpu"] = stats["cpu"] + cpu - top[2]
+        #END if
+    #END _charge
+
+    def push(self, name):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        self._charge(wall, cpu)
+
+        self._stats(name)["calls"] = self._stats(name)["calls"] + 1
+        self._stack.append([name, wall, cpu])
+    #END push
+
+    def pop(self, measure_rss=True):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        self._charge(wall, cpu)
+
+        name = self._stack.pop()[0]
+        if measure_rss:
+            self.stages[name]["peakrss"] = peak_rss()
+
+        # The enclosing stage resumes now
+        if self._stack:
+            self._stack[-1][1] = wall
+            self._stack[-1][2] = cpu
+        #END if
+    #END pop
+
+    """
+    Wraps an iterator so the time spent producing every item is charged
+    to the stage name. Peak RSS is only taken every RSS_INTERVAL items and
+    at the end, since getrusage costs about as much as a short item.
+    """
+    def iterate(self, name, iterable):
+        iterator = iter(iterable)
+
+        while True:
+            self.push(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.pop()
+                return
+            except BaseException:
+                self.pop()
+                raise
+            #END try
+
+            self.pop(measure_rss=self.stages[name]["calls"] % RSS_INTERVAL == 1)
+            yield item
+        #END while
+    #END iterate
+
+    def count(self, **counts):
+        self.counts.update(counts)
+
+    """
+    The timings as a dictionary that json.dumps takes: etextID, file,
+    the totals and a stages dictionary of stage name to its timings.
+    """
+    def record(self, etextid, input_file=None):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+
+        record = collections.OrderedDict([("etextID", etextid), ("file", input_file),
+            ("wall", wall), ("cpu", cpu), ("peakrss", peak_rss())])
+        record.update(self.counts)
+        record["stages"] = collections.OrderedDict((name, dict(stats))
+                for name, stats in self.stages.items())
+
+        return record
+    #END record
+
+#END StageProfiler
+
+"""
+Makes a new profiler the active one of this process and returns it.
+"""
+def start():
+    global ACTIVE
+
+    ACTIVE = StageProfiler()
+    return ACTIVE
+
+#END start
+
+"""
+Stops profiling and returns the profiler that was active.
+"""
+def finish():
+    global ACTIVE
+
+    profile, ACTIVE = ACTIVE, None
+    return profile
+
+#END finish
+
+"""
+Context manager charging the time inside it to a stage of the active
+profiler. Does nothing when none is active.
+"""
+@contextlib.contextmanager
+def stage(name):
+
+    profile = ACTIVE
+    if profile is None:
+        yield
+        return
+    #END if
+
+    profile.push(name)
+    try:
+        yield
+    finally:
+        profile.pop()
+
+#END stage
+
+"""
+Returns iterable with its items charged to a stage of the active
+profiler, or iterable itself when none is active.
+"""
+def iterate(name, iterable):
+
+    if ACTIVE is None:
+        return iterable
+
+    return ACTIVE.iterate(name, iterable)
+
+#END iterate
+
+"""
+Sets the token, vocabulary and edge counts of the active profiler.
+"""
+def count(**counts):
+
+    if ACTIVE is not None:
+        ACTIVE.count(**counts)
+
+#END count
+
+"""
+Adds the time of a stage that ran outside the book's profiler, e.g. the
+database insert in the parent process of a batch run, to a record.
+"""
+def add_stage(record, name, wall, cpu):
+
+    stats = record["stages"].setdefault(name, {"wall": 0.0, "cpu": 0.0, "calls": 0, "peakrss": 0})
+    stats["wall"] = stats["wall"] + wall
+    stats["cpu"] = stats["cpu"] + cpu
+    stats["calls"] = stats["calls"] + 1
+    record["wall"] = record["wall"] + wall
+    record["cpu"] = record["cpu"] + cpu
+
+#END add_stage
+
+"""
+Writes timing records as JSON lines, or to the timings table when the
+path ends in .db or .sqlite. '-' writes JSON lines to stderr.
+"""
+class TimingLog(object):
+
+    def __init__(self, path, version=None):
+        self.version = version
+        self.dbconn = None
+        self.output = None
+
+        if path.endswith(".db") or path.endswith(".sqlite"):
+            self.dbconn = sqlite3.connect(path, timeout=60.0)
+            self.dbconn.executescript(TIMINGS_SCHEMA)
+        elif path == "-":
+            self.output = sys.stderr
+        else:
+            self.output = open(path, 'a')
+        #END if
+    #END __init__
+
+    def write(self, record):
+        if self.output is not None:
+            self.output.write(json.dumps(record) + "\n")
+            return
+        #END if
+
+        counts = [record["tokens"], record["nodes"], record["edges"]]
+        rows = [[self.version, record["etextID"], "total", record["wall"], record["cpu"], 1,
+            record["peakrss"]] + counts]
+        for name, stats in record["stages"].items():
+            rows.append([self.version, record["etextID"], name, stats["wall"], stats["cpu"],
+                stats["calls"], stats["peakrss"]] + counts)
+        #END for
+
+        self.dbconn.executemany("INSERT INTO timings(%s) VALUES (%s)" %
+                (", ".join(TIMINGS_COLUMNS), ", ".join("?" * len(TIMINGS_COLUMNS))), rows)
+    #END write
+
+    def close(self):
+        if self.dbconn is not None:
+            self.dbconn.commit()
+            self.dbconn.close()
+        elif self.output is not None and self.output is not sys.stderr:
+            self.output.close()
+        #END if
+    #END close
+
+#END TimingLog
+
+"""
+Corpus wide totals of a batch run: stage times summed over every book,
+throughput and the slowest books.
+"""
+class Rollup(object):
+
+    def __init__(self, top=DEFAULT_TOP):
+        self.top = top
+        self.books = 0
+        self.tokens = 0
+        self.peakrss = 0
+        self.stages = collections.OrderedDict()
+        self._slowest = []
+        self._start = time.perf_counter()
+    #END __init__
+
+    def add(self, record):
+        self.books = self.books + 1
+        self.tokens = self.tokens + record["tokens"]
+        self.peakrss = max(self.peakrss, record["peakrss"])
+
+        for name, stats in record["stages"].items():
+            total = self.stages.setdefault(name, [0.0, 0.0])
+            total[0] = total[0] + stats["wall"]
+            total[1] = total[1] + stats["cpu"]
+        #END for
+
+        # Min heap of the slowest books so far
+        entry = (record["wall"], self.books, record)
+        if len(self._slowest) < self.top:
+            heapq.heappush(self._slowest, entry)
+        elif entry[0] > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+    #END add
+
+    """
+    Writes the throughput, per stage totals and slowest books report.
+    """
+    def report(self, output=sys.stderr):
+        elapsed = time.perf_counter() - self._start
+        busy = sum(wall for wall, cpu in self.stages.values())
+
+        output.write("Profile: %d books, %d tokens in %.2fs: %.2f books/s, %.0f tokens/s. Peak RSS %.1f MB.\n" %
+                (self.books, self.tokens, elapsed, self.books / elapsed if elapsed > 0 else 0,
+                    self.tokens / elapsed if elapsed > 0 else 0, self.peakrss / float(1 << 20)))
+
+        output.write("%-14s %10s %10s %6s\n" % ("stage", "wall", "cpu", "share"))
+        for name, (wall, cpu) in sorted(self.stages.items(), key=lambda item: -item[1][0]):
+            output.write("%-14s %10.3f %10.3f %5.1f%%\n" % (name, wall, cpu,
+                100.0 * wall / busy if busy > 0 else 0))
+        #END for
+
+        if self._slowest:
+            output.write("Slowest books:\n")
+            output.write("%-12s %8s %10s %10s %-14s %s\n" % ("etextID", "wall", "tokens", "tokens/s", "top stage", "file"))
+        #END if
+
+        for wall, order, record in sorted(self._slowest, reverse=True):
+            top_stage = max(record["stages"].items(), key=lambda item: item[1]["wall"])[0] if record["stages"] else ""
+            output.write("%-12s %8.3f %10d %10.0f %-14s %s\n" % (record["etextID"], wall, record["tokens"],
+                record["tokens"] / wall if wall > 0 else 0, top_stage, record["file"]))
+        #END for
+    #END report
+
+#END Rollup
@@ -29,30 +29,33 @@ dbListTables(con)
 tbl = dbGetQuery(con, "SELECT * FROM experiments")
 print(names(tbl))
 
-avgivd = c()
-avgsi = c()
-
-sdivd = c()
-sdsi = c()
-
-counts = c()
+# Run migrate-db.py on the database first. It adds the indexes, the
+# authordetails birth_year and death_year columns and the bookdecades
+# table, one row per book and birth decade of one of its authors. All
+# decades are then loaded with a single query and summarized in R.
+decades = seq(20, 1971, 10)
+qry = sprintf("SELECT bd.decade, exp.* FROM bookdecades bd, experiments exp WHERE exp.etextID = bd.etextID AND bd.decade >= %d AND bd.decade <= %d", min(decades), max(decades))
+decadetbl = dbGetQuery(con, qry)
+
+# Applies f to column of every decade in decades, NA for empty decades
+per_decade <- function(tbl, column, f, decades) {
+  as.vector(tapply(tbl[[column]], factor(tbl$decade, levels = decades), f))
+}
 
-for(e in seq(20, 1971, 10)){
-  qry = sprintf("SELECT DISTINCT(ab.etextID), exp.* FROM experiments exp, authordetails ad, bookauthors ab, ebooks eb WHERE ad.authorID = ab.authorID AND ab.etextID = eb.etextID AND CAST(ad.birth AS INTEGER) >= %d AND CAST(ad.birth AS INTEGER) < %d AND exp.etextID = ab.etextID", e, e+10)
-  tbl = dbGetQuery(con, qry)
+# Number of distinct books in every decade
+decade_counts <- function(tbl, decades) {
+  counts = per_decade(tbl, "etextID", function(x) length(unique(x)), decades)
+  counts[is.na(counts)] = 0
+  counts
+}
 
-  avgivd = c(avgivd, mean(tbl$ivdnorm))
-  sdivd = c(sdivd, sd(tbl$ivdnorm))
-  
-  avgsi = c(avgsi, mean(tbl$sinorm))
-  sdsi = c(sdsi, sd(tbl$sinorm))
+avgivd = per_decade(decadetbl, "ivdnorm", mean, decades)
+sdivd = per_decade(decadetbl, "ivdnorm", sd, decades)
 
+avgsi = per_decade(decadetbl, "sinorm", mean, decades)
+sdsi = per_decade(decadetbl, "sinorm", sd, decades)
 
-  qry = sprintf("SELECT COUNT(DISTINCT(ab.etextID)), exp.* FROM experiments exp, authordetails ad, bookauthors ab, ebooks eb WHERE ad.authorID = ab.authorID AND ab.etextID = eb.etextID AND CAST(ad.birth AS INTEGER) >= %d AND CAST(ad.birth AS INTEGER) < %d AND exp.etextID = ab.etextID", e, e+10)
-  
-  tbl2 = dbGetQuery(con, qry)
-  counts = c(counts, tbl2[,1])
-}
+counts = decade_counts(decadetbl, decades)
 
 # Plot the book count #########################
 
@@ -67,44 +70,25 @@ legend("topleft", legend = c("sinorm", "ivdnorm"), col = c("black", "red"), lty
 
 # Zoom in to 1500-1971  #########################
 
-avgivd = c()
-avgsi = c()
-avgda = c()
-avgaec = c()
-avgnec = c()
-
-sdivd = c()
-sdsi = c()
-sdda = c()
-sdaec = c()
-sdnec = c()
+decades = seq(1500, 1971, 10)
+zoomtbl = decadetbl[decadetbl$decade >= 1500, ]
 
-counts = c()
+avgivd = per_decade(zoomtbl, "ivdnorm", mean, decades)
+sdivd = per_decade(zoomtbl, "ivdnorm", sd, decades)
 
-for(e in seq(1500, 1971, 10)){
-  qry = sprintf("SELECT DISTINCT(ab.etextID), exp.* FROM experiments exp, authordetails ad, bookauthors ab, ebooks eb WHERE ad.authorID = ab.authorID AND ab.etextID = eb.etextID AND CAST(ad.birth AS INTEGER) >= %d AND CAST(ad.birth AS INTEGER) < %d AND exp.etextID = ab.etextID", e, e+10)
-  tbl = dbGetQuery(con, qry)
+avgsi = per_decade(zoomtbl, "sinorm", mean, decades)
+sdsi = per_decade(zoomtbl, "sinorm", sd, decades)
 
-  avgivd = c(avgivd, mean(tbl$ivdnorm))
-  sdivd = c(sdivd, sd(tbl$ivdnorm))
-  
-  avgsi = c(avgsi, mean(tbl$sinorm))
-  sdsi = c(sdsi, sd(tbl$sinorm))
+avgda = per_decade(zoomtbl, "da", mean, decades)
+sdda = per_decade(zoomtbl, "da", sd, decades)
 
-  avgda = c(avgda, mean(tbl$da))
-  sdda = c(sdda, sd(tbl$da))
+avgaec = per_decade(zoomtbl, "aec", mean, decades)
+sdaec = per_decade(zoomtbl, "aec", sd, decades)
 
-  avgaec = c(avgaec, mean(tbl$aec))
-  sdaec = c(sdaec, sd(tbl$aec))
+avgnec = per_decade(zoomtbl, "nec", mean, decades)
+sdnec = per_decade(zoomtbl, "nec", sd, decades)
 
-  avgnec = c(avgnec, mean(tbl$nec))
-  sdnec = c(sdnec, sd(tbl$nec))
-  
-  qry = sprintf("SELECT COUNT(DISTINCT(ab.etextID)), exp.* FROM experiments exp, authordetails ad, bookauthors ab, ebooks eb WHERE ad.authorID = ab.authorID AND ab.etextID = eb.etextID AND CAST(ad.birth AS INTEGER) >= %d AND CAST(ad.birth AS INTEGER) < %d AND exp.etextID = ab.etextID", e, e+10)
-  
-  tbl2 = dbGetQuery(con, qry)
-  counts = c(counts, tbl2[,1])
-}
+counts = decade_counts(zoomtbl, decades)
 
 # Re-Plot Info Complexity and counts
 plot(counts~seq(1500, 1971, 10), type="l", xlab="Author Birth Year", ylab="Ebook Count", main = "Ebook Count Per Author Birth Decade (AD)")
@@ -150,7 +134,7 @@ for ( i in seq(1, length(authors))) {
 
 
   # Get the information for all books not by the author during their time period
-  qry = sprintf("SELECT exp.*, ad.* FROM experiments exp, authordetails ad, bookauthors ba, ebooks eb WHERE eb.etextID = ba.etextID AND ba.authorID = ad.authorID AND ad.authorID != %d AND ad.birth NOT NULL AND ad.death NOT NULL AND CAST (ad.birth AS INTEGER) >= %d AND CAST(ad.death AS INTEGER) <= %d AND CAST(ad.death AS INTEGER) > 0", authors[i], authorbirth, authordeath)
+  qry = sprintf("SELECT exp.*, ad.* FROM experiments exp, authordetails ad, bookauthors ba, ebooks eb WHERE eb.etextID = ba.etextID AND ba.authorID = ad.authorID AND ad.authorID != %d AND ad.birth_year >= %d AND ad.death_year <= %d AND ad.death_year > 0 AND exp.etextID = eb.etextID", authors[i], authorbirth, authordeath)
   periodtbl = dbGetQuery(con, qry)
 
   boxplot(authortbl$ivdnorm, periodtbl$ivdnorm, names = c(authorlast, "General"))
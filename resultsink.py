@@ -0,0 +1,249 @@
+"""
+     This file is part of Gutenberg Graphalyzer
+     Gutenberg Graphalyzer is free software: you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     Gutenberg Graphalyzer is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU General Public License for more details.
+
+     You should have received a copy of the GNU General Public License
+     along with Gutenberg Graphalyzer.  If not, see <http://www.gnu.org/licenses/>.
+
+Single writer for the experiments table.
+
+Any number of producer threads hand rows to a ResultSink. One writer
+thread owns the only sqlite connection and inserts the rows with
+executemany, a batch per transaction, with the database in WAL mode so
+readers never block the writer. Run manifest entries (see manifest.py)
+can ride along with a row so both land in the same transaction.
+"""
+
+import sqlite3
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from metrics import METRIC_NAMES, DISTANCE_METRIC_NAMES
+import manifest
+
+# Column order of every row handed to the sink
+EXPERIMENT_COLUMNS = ["versionnumber", "etextID"] + METRIC_NAMES + DISTANCE_METRIC_NAMES
+
+EXPERIMENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiments(
+    runID INTEGER PRIMARY KEY ASC,
+    versionnumber INTEGER, -- Version of the software used for the experiments
+    etextID INTEGER,
+    da REAL,
+    ivd REAL,
+    ivdnorm REAL,
+    si REAL,
+    sinorm REAL,
+    nec REAL,
+    aec REAL,
+    -- Only with the distance metrics: Complexity Index B, the average
+    -- shortest path length and A/D, the confidence interval half widths of
+    -- sampled estimates and the number of BFS sources
+    %s,
+    FOREIGN KEY(etextID) REFERENCES ebooks(etextID)
+);
+CREATE INDEX IF NOT EXISTS experiments_etextID ON experiments(etextID);
+CREATE INDEX IF NOT EXISTS experiments_versionnumber ON experiments(versionnumber);
+""" % ",\n    ".join("%s REAL" % name for name in DISTANCE_METRIC_NAMES)
+
+# Rows per transaction and the longest a row may wait before it is written
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_FLUSH_INTERVAL = 5.0
+
+# Marks the end of the row stream on the queue
+_CLOSE = object()
+
+
+"""
+Opens a connection for a writer: WAL journaling, relaxed syncing (WAL
+stays consistent after a crash) and a busy timeout so other writers
+wait instead of failing with 'database is locked'.
+"""
+def connect(database, timeout=60.0):
+
+    dbconn = sqlite3.connect(database, timeout=timeout)
+    dbconn.execute("PRAGMA journal_mode=WAL")
+    dbconn.execute("PRAGMA synchronous=NORMAL")
+
+    return dbconn
+
+#END connect
+
+"""
+Creates the experiments table and its indexes if they are missing. Tables
+created before the distance metrics, or some of them, existed get the
+missing columns added.
+"""
+def create_schema(dbconn):
+
+    dbconn.executescript(EXPERIMENTS_SCHEMA)
+
+    columns = [row[1] for row in dbconn.execute("PRAGMA table_info(experiments)")]
+    for name in DISTANCE_METRIC_NAMES:
+        if name not in columns:
+            dbconn.execute("ALTER TABLE experiments ADD COLUMN %s REAL" % name)
+    #END for
+    dbconn.commit()
+
+#END create_schema
+
+
+"""
+Buffers experiment rows from any number of threads and writes them from
+a single background thread. Rows are tuples in EXPERIMENT_COLUMNS order.
+With track_manifest the runmanifest table is created as well and manifest
+entries are accepted alongside the rows.
+"""
+class ResultSink(object):
+
+    def __init__(self, database, batch_size=DEFAULT_BATCH_SIZE,
+            flush_interval=DEFAULT_FLUSH_INTERVAL, timeout=60.0, track_manifest=False):
+        self.database = database
+        self.track_manifest = track_manifest
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.rows_written = 0
+
+        # Seconds the writer spent in transactions
+        self.write_time = 0.0
+
+        self._queue = queue.Queue(maxsize=batch_size * 4)
+        self._error = None
+        self._closed = False
+
+        # Make sure the table exists before any producer starts
+        dbconn = connect(database, timeout)
+        create_schema(dbconn)
+        if track_manifest:
+            manifest.create_schema(dbconn)
+        dbconn.close()
+
+        self._thread = threading.Thread(target=self._run, name="ResultSink")
+        self._thread.daemon = True
+        self._thread.start()
+    #END __init__
+
+    """
+    Queues one row, optionally with the manifest entry of its text. Blocks
+    if the writer has fallen far behind.
+    """
+    def add(self, row, entry=None):
+        self._put(tuple(row), entry)
+    #END add
+
+    """
+    Queues a manifest entry without an experiment row, e.g. for a text
+    that failed to parse.
+    """
+    def add_entry(self, entry):
+        self._put(None, entry)
+    #END add_entry
+
+    def _put(self, row, entry):
+        if self._closed:
+            raise ValueError("ResultSink is closed")
+
+        if entry is not None and not self.track_manifest:
+            raise ValueError("ResultSink was created without track_manifest")
+
+        self._check()
+        self._queue.put((row, entry))
+    #END _put
+
+    """
+    Waits for every queued row to be written and stops the writer.
+    """
+    def close(self):
+        if self._closed:
+            return
+
+        self._closed = True
+        self._queue.put(_CLOSE)
+        self._thread.join()
+        self._check()
+    #END close
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+    """
+    Writer thread. Collects rows until the batch is full, the flush
+    interval passes or the sink is closed, then writes the batch.
+    """
+    def _run(self):
+        insert = "INSERT INTO experiments(%s) VALUES (%s)" % (
+                ", ".join(EXPERIMENT_COLUMNS), ", ".join(["?"] * len(EXPERIMENT_COLUMNS)))
+
+        dbconn = None
+        batch = []
+        closing = False
+
+        try:
+            dbconn = connect(self.database, self.timeout)
+
+            while not closing:
+                deadline = time.time() + self.flush_interval
+
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get(timeout=max(deadline - time.time(), 0.001))
+                    except queue.Empty:
+                        break
+
+                    if item is _CLOSE:
+                        closing = True
+                        break
+
+                    batch.append(item)
+                #END while
+
+                if batch:
+                    rows = [row for row, entry in batch if row is not None]
+                    entries = [entry for row, entry in batch if entry is not None]
+
+                    start = time.time()
+                    with dbconn:
+                        dbconn.executemany(insert, rows)
+                        if entries:
+                            manifest.record(dbconn, entries)
+                    #END with
+                    self.write_time = self.write_time + time.time() - start
+
+                    self.rows_written = self.rows_written + len(rows)
+                    batch = []
+                #END if
+            #END while
+        except Exception as e:
+            self._error = e
+
+            # Keep draining so producers blocked on a full queue wake up
+            while not closing:
+                closing = self._queue.get() is _CLOSE
+        finally:
+            if dbconn is not None:
+                dbconn.close()
+        #END try
+    #END _run
+
+#END ResultSink
@@ -7,9 +7,11 @@ PATH_TO_GRAPHALYZER="./"
 #total=$(ls -l $TEXT_FILES | wc -l)
 THREAD_COUNT=32
 
-counter=0
+# A single batch run starts the worker pool once instead of one python
+# process per text.
+python $PATH_TO_GRAPHALYZER/graphalyzer.py batch $TEXT_FILES -o $DB_FILE -j $THREAD_COUNT
 
-find $TEXT_FILES/ -name '*.txt' -print | xargs -I CMD --max-procs=$THREAD_COUNT python $PATH_TO_GRAPHALYZER/graphalyzer.py -i CMD -o $DB_FILE
+#find $TEXT_FILES/ -name '*.txt' -print | xargs -I CMD --max-procs=$THREAD_COUNT python $PATH_TO_GRAPHALYZER/graphalyzer.py -i CMD -o $DB_FILE
 
 #for file in $TEXT_FILES
 #do
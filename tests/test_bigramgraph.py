@@ -0,0 +1,114 @@
+"""
+Tests of the spilling graph builder of bigramgraph.py against the in
+memory one.
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bigramgraph import BigramGraph
+
+
+def random_tokens(seed, words=300, count=20000):
+
+    random = np.random.RandomState(seed)
+
+    # Zipf like word frequencies, so there are both hapaxes and recurring
+    # bigrams
+    ids = np.minimum(random.zipf(1.3, size=count + 1), words) - 1
+    return ["w%d" % word for word in ids.tolist()]
+
+#END random_tokens
+
+def build(tokens, prune_hapax=False, **kwargs):
+
+    graph = BigramGraph(**kwargs)
+    previous = -1
+    for token in tokens:
+        word_id = graph.add_node(token)
+        if previous != -1:
+            graph.add_edge(previous, word_id)
+        previous = word_id
+    #END for
+    graph.finish(prune_hapax)
+
+    return graph
+
+#END build
+
+def edge_counts(graph):
+
+    src, dst, weight = graph.edges()
+    return dict(((graph.words[s], graph.words[d]), w) for s, d, w in zip(src.tolist(), dst.tolist(), weight.tolist()))
+
+#END edge_counts
+
+class SpillTest(unittest.TestCase):
+
+    def setUp(self):
+        self.spill_dir = tempfile.TemporaryDirectory()
+        self.tokens = random_tokens(1)
+        self.expected = build(self.tokens)
+    #END setUp
+
+    def tearDown(self):
+        self.spill_dir.cleanup()
+
+    def test_spilled_runs_merge_to_the_same_graph(self):
+        graph = build(self.tokens, flush_size=100, max_edges=50, spill_dir=self.spill_dir.name)
+
+        self.assertEqual(graph.words, self.expected.words)
+        for got, expected in zip(graph.csr(), self.expected.csr()):
+            self.assertTrue(np.array_equal(got, expected))
+
+        # The runs are removed once merged
+        self.assertEqual(os.listdir(self.spill_dir.name), [])
+    #END test_spilled_runs_merge_to_the_same_graph
+
+    def test_prune_hapax(self):
+        kept = dict((edge, count) for edge, count in edge_counts(self.expected).items() if count > 1)
+
+        for kwargs in [{}, {"flush_size": 100, "max_edges": 50, "spill_dir": self.spill_dir.name}]:
+            graph = build(self.tokens, prune_hapax=True, **kwargs)
+            self.assertEqual(edge_counts(graph), kept)
+
+            # Pruning keeps every word
+            self.assertEqual(graph.number_of_nodes(), self.expected.number_of_nodes())
+        #END for
+    #END test_prune_hapax
+
+    def test_add_graph(self):
+        other_tokens = random_tokens(2)
+        other = build(other_tokens)
+
+        expected = edge_counts(self.expected)
+        for edge, count in edge_counts(other).items():
+            expected[edge] = expected.get(edge, 0) + count
+        #END for
+
+        for max_edges in [None, 50]:
+            graph = BigramGraph(max_edges=max_edges, spill_dir=self.spill_dir.name)
+            graph.add_graph(self.expected)
+            graph.add_graph(other)
+            self.assertEqual(edge_counts(graph), expected)
+        #END for
+    #END test_add_graph
+
+    def test_save_and_load(self):
+        path = self.expected.save_npz(os.path.join(self.spill_dir.name, "graph"), compressed=False)
+        graph = BigramGraph.load_npz(path)
+
+        self.assertEqual(graph.words, self.expected.words)
+        self.assertEqual(edge_counts(graph), edge_counts(self.expected))
+    #END test_save_and_load
+
+#END SpillTest
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+Tests of the bit parallel distance metrics of distances.py against
+networkx's shortest paths.
+"""
+
+import math
+import os
+import sys
+import unittest
+
+import networkx as nx
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import distances
+from bigramgraph import BigramGraph
+
+
+def random_graph(seed, words=200, count=600):
+
+    random = np.random.RandomState(seed)
+
+    graph = BigramGraph()
+    for word in range(words):
+        graph.add_node("w%d" % word)
+
+    # Sparse enough that many pairs are unreachable, with some self loops
+    for src, dst in zip(random.randint(0, words, count).tolist(), random.randint(0, words, count).tolist()):
+        graph.add_edge(src, dst)
+    graph.finish()
+
+    return graph
+
+#END random_graph
+
+"""
+The distance metrics with unreachable pairs ignored, from networkx.
+"""
+def networkx_metrics(graph):
+
+    nx_graph = graph.to_networkx()
+    out_degree = dict(zip(graph.words, graph.out_degree().tolist()))
+
+    bcomplex = 0.0
+    total_distance = 0
+    total_pairs = 0
+    for word, lengths in nx.all_pairs_shortest_path_length(nx_graph):
+        degree = sum(lengths.values())
+        if degree > 0:
+            bcomplex = bcomplex + float(out_degree[word]) / degree
+        total_distance = total_distance + degree
+        total_pairs = total_pairs + len(lengths) - 1
+    #END for
+
+    return bcomplex, float(total_distance) / total_pairs
+
+#END networkx_metrics
+
+class DistanceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = random_graph(1)
+        self.bcomplex, self.avgdist = networkx_metrics(self.graph)
+    #END setUp
+
+    def test_distance_metrics(self):
+        results = distances.distance_metrics(self.graph)
+
+        self.assertAlmostEqual(results["bcomplex"], self.bcomplex)
+        self.assertAlmostEqual(results["avgdist"], self.avgdist)
+        self.assertEqual(results["distsamples"], self.graph.number_of_nodes())
+        self.assertEqual(results["bcomplex_ci"], 0.0)
+    #END test_distance_metrics
+
+    def test_distance_degree_penalty(self):
+        nx_graph = self.graph.to_networkx()
+        num_nodes = self.graph.number_of_nodes()
+        degrees = distances.distance_degrees(self.graph, unreachable=num_nodes)
+
+        for i, word in enumerate(self.graph.words):
+            lengths = nx.single_source_shortest_path_length(nx_graph, word)
+            self.assertEqual(degrees[i], sum(lengths.values()) + (num_nodes - len(lengths)) * num_nodes)
+        #END for
+
+        with self.assertRaises(ValueError):
+            distances.distance_degrees(self.graph, unreachable=distances.UNREACHABLE_RAISE)
+    #END test_distance_degree_penalty
+
+    def test_sampling_without_budget_is_exact(self):
+        results = distances.sampled_distance_metrics(self.graph)
+
+        self.assertAlmostEqual(results["bcomplex"], self.bcomplex)
+        self.assertAlmostEqual(results["avgdist"], self.avgdist)
+        self.assertEqual(results["distsamples"], self.graph.number_of_nodes())
+        self.assertEqual(results["bcomplex_ci"], 0.0)
+    #END test_sampling_without_budget_is_exact
+
+    def test_sample_budget_counts_every_source(self):
+        for samples in [10, 100, 150]:
+            results = distances.sampled_distance_metrics(self.graph, samples=samples)
+
+            self.assertEqual(results["distsamples"], samples)
+            self.assertGreater(results["bcomplex_ci"], 0.0)
+        #END for
+    #END test_sample_budget_counts_every_source
+
+    def test_time_budget(self):
+        results = distances.sampled_distance_metrics(self.graph, time_budget=0.0)
+
+        # The first block of the tail and of the rest
+        self.assertLessEqual(results["distsamples"], 2 * distances.BLOCK_SIZE)
+        self.assertFalse(math.isnan(results["bcomplex"]))
+    #END test_time_budget
+
+#END DistanceTest
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+Tests of the run manifest batch runs resume from.
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import manifest
+
+OPTIONS = {"tokenizer": "fast", "gutenberg": True, "distances": False, "unreachable": "ignore"}
+
+
+class ResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.directory.name, "results.db")
+
+        self.texts = []
+        for name in ["1.txt", "2.txt", "3.txt"]:
+            path = os.path.join(self.directory.name, name)
+            with open(path, "w") as output:
+                output.write("The text of %s." % name)
+            self.texts.append(path)
+        #END for
+    #END setUp
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def record(self, entries):
+        dbconn = sqlite3.connect(self.database)
+        manifest.create_schema(dbconn)
+        manifest.record(dbconn, entries)
+        dbconn.commit()
+        dbconn.close()
+    #END record
+
+    def pending(self, version=1.0, options=OPTIONS):
+        return manifest.RunManifest(self.database).pending(self.texts, version, options)
+
+    def test_new_database(self):
+        self.assertEqual(self.pending(), self.texts)
+
+    def test_resume(self):
+        first, second, third = self.texts
+        self.record([manifest.file_entry(first, "1", 1.0, OPTIONS, manifest.STATUS_DONE),
+                manifest.file_entry(second, "2", 1.0, OPTIONS, manifest.STATUS_FAILED, "ValueError: bad")])
+
+        # Failed and new texts are processed again, done ones are not
+        self.assertEqual(self.pending(), [second, third])
+    #END test_resume
+
+    def test_version_and_options(self):
+        self.record([manifest.file_entry(path, str(i), 1.0, OPTIONS, manifest.STATUS_DONE)
+                for i, path in enumerate(self.texts)])
+
+        self.assertEqual(self.pending(), [])
+        self.assertEqual(self.pending(version=2.0), self.texts)
+        self.assertEqual(self.pending(options=dict(OPTIONS, tokenizer="nltk")), self.texts)
+    #END test_version_and_options
+
+    def test_changed_contents(self):
+        self.record([manifest.file_entry(path, str(i), 1.0, OPTIONS, manifest.STATUS_DONE)
+                for i, path in enumerate(self.texts)])
+
+        # Same contents with a new mtime is still done; new contents are not
+        later = time.time() + 10
+        os.utime(self.texts[0], (later, later))
+        with open(self.texts[1], "w") as output:
+            output.write("The new text of 2.txt")
+
+        self.assertEqual(self.pending(), [self.texts[1]])
+    #END test_changed_contents
+
+#END ResumeTest
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+"""
+Tests of the metrics of graphs too small for some of them.
+"""
+
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+from bigramgraph import BigramGraph
+
+
+class SmallGraphTest(unittest.TestCase):
+
+    def test_no_words(self):
+        results = metrics.compute_metrics(BigramGraph())
+
+        self.assertEqual(results["ivd"], 0.0)
+        self.assertEqual(results["si"], 0)
+        for name in ["da", "ivdnorm", "sinorm", "nec", "aec"]:
+            self.assertTrue(math.isnan(results[name]), name)
+    #END test_no_words
+
+    def test_one_word(self):
+        graph = BigramGraph()
+        graph.add_node("alone")
+        results = metrics.compute_metrics(graph)
+
+        self.assertEqual(results["ivdnorm"], 0.0)
+        self.assertEqual(results["aec"], 0.0)
+        self.assertTrue(math.isnan(results["nec"]))
+        self.assertTrue(math.isnan(results["da"]))
+    #END test_one_word
+
+    def test_one_word_self_loop(self):
+        graph = BigramGraph()
+        word = graph.add_node("again")
+        graph.add_edge(word, word, 2)
+        results = metrics.compute_metrics(graph)
+
+        self.assertEqual(results["nec"], 1.0)
+        self.assertEqual(results["aec"], 1.0)
+        self.assertEqual(results["si"], 0.0)
+    #END test_one_word_self_loop
+
+#END SmallGraphTest
+
+if __name__ == "__main__":
+    unittest.main()
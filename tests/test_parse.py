@@ -0,0 +1,74 @@
+"""
+Regression tests of the bigram graphs graphalyzer.py builds.
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import graphalyzer
+import nltkmodels
+import trajectory
+
+# Underscore only tokens strip to the empty word
+UNDERSCORE_TEXT = """*** START OF THIS PROJECT GUTENBERG EBOOK
+The cat _ sat on the mat. The __ dog sat on the _ cat.
+*** END OF THIS PROJECT GUTENBERG EBOOK
+"""
+
+# Bigrams of UNDERSCORE_TEXT as the original networkx parser counted
+# them: the empty word is a node and ends a bigram but never starts one
+UNDERSCORE_EDGES = sorted([("cat", ""), ("dog", "sat"), ("on", "the"), ("sat", "on"),
+        ("the", ""), ("the", "cat"), ("the", "mat")])
+
+
+def edge_words(graph):
+
+    src, dst, weight = graph.edges()
+    return sorted((graph.words[s], graph.words[d]) for s, d in zip(src.tolist(), dst.tolist()))
+
+#END edge_words
+
+class UnderscoreWordTest(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".txt")
+        with os.fdopen(handle, "w") as output:
+            output.write(UNDERSCORE_TEXT)
+    #END setUp
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def check_tokenizer(self, tokenizer):
+        graph = graphalyzer.nltk_parse(self.path, tokenizer=tokenizer)
+
+        self.assertEqual(edge_words(graph), UNDERSCORE_EDGES)
+        self.assertEqual(sorted(graph.words), ["", "cat", "dog", "mat", "on", "sat", "the"])
+
+        # The incremental trajectory counts the same bigrams
+        points = list(trajectory.trajectory(graphalyzer.parse_sentences(self.path, tokenizer), every=100))
+        self.assertEqual(points[-1][5], len(UNDERSCORE_EDGES))
+    #END check_tokenizer
+
+    def test_fast_tokenizer(self):
+        self.check_tokenizer("fast")
+
+    @unittest.skipIf(nltkmodels.find_models() is None, "NLTK Punkt models are not installed")
+    def test_nltk_tokenizer(self):
+        self.check_tokenizer("nltk")
+
+    def test_regexp_parse(self):
+        graph = graphalyzer.regexp_parse(self.path)
+
+        self.assertIn("", graph.words)
+        self.assertNotIn("", [src for src, dst in edge_words(graph)])
+    #END test_regexp_parse
+
+#END UnderscoreWordTest
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+Tests of the streaming text pipeline of textpipeline.py: the Project
+Gutenberg body scan and sentences cut across chunk boundaries.
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nltkmodels
+import textpipeline
+
+TEST_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "testfiles", "test.txt")
+
+HEADER = b"The Project Gutenberg EBook of Nothing\r\n\r\n*** START OF THIS PROJECT GUTENBERG EBOOK NOTHING ***\r\n"
+BODY = b"First line of the body.\r\nSecond line.\r\n"
+FOOTER = b"*** END OF THIS PROJECT GUTENBERG EBOOK NOTHING ***\r\nLicense text.\r\n"
+
+
+def chunks_of(text, size):
+
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+#END chunks_of
+
+class FindBodyTest(unittest.TestCase):
+
+    def test_markers(self):
+        data = HEADER + BODY + FOOTER
+        start, end, found = textpipeline.find_body(data)
+
+        self.assertTrue(found)
+        self.assertEqual(start, len(HEADER))
+
+        # The END marker line is kept
+        self.assertEqual(data[start:end], BODY + FOOTER.split(b"\n")[0] + b"\n")
+    #END test_markers
+
+    def test_missing_markers(self):
+        self.assertEqual(textpipeline.find_body(BODY), (0, len(BODY), False))
+        self.assertEqual(textpipeline.find_body(HEADER + BODY), (len(HEADER), len(HEADER + BODY), False))
+        self.assertEqual(textpipeline.find_body(BODY + FOOTER)[:2], (0, len(BODY + FOOTER.split(b"\n")[0]) + 1))
+    #END test_missing_markers
+
+    def test_read_body_chunks(self):
+        handle, path = tempfile.mkstemp(suffix=".txt")
+        try:
+            with os.fdopen(handle, "wb") as output:
+                output.write(HEADER + BODY + FOOTER)
+
+            # A chunk size of 1 cuts every CRLF in two
+            text = "".join(textpipeline.read_body_chunks(path, chunk_size=1, encoding="utf-8"))
+            self.assertEqual(text, (BODY + FOOTER.split(b"\n")[0] + b"\n").decode("utf-8").replace("\r\n", "\n"))
+        finally:
+            os.remove(path)
+    #END test_read_body_chunks
+
+#END FindBodyTest
+
+class ChunkBoundaryTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(TEST_FILE, encoding="utf-8", errors="replace") as input:
+            self.text = input.read()
+    #END setUp
+
+    def check_tokenizer(self, tokenizer):
+        expected = list(textpipeline.stream_sentences([self.text], tokenizer))
+
+        # Chunk sizes that cut words, sentences and runs of whitespace
+        for size in [7, 100, 1000, 4096]:
+            self.assertEqual(list(textpipeline.stream_sentences(chunks_of(self.text, size), tokenizer)), expected)
+        #END for
+    #END check_tokenizer
+
+    def test_fast_tokenizer(self):
+        self.check_tokenizer(textpipeline.FastSentenceTokenizer())
+
+    @unittest.skipIf(nltkmodels.find_models() is None, "NLTK Punkt models are not installed")
+    def test_nltk_tokenizer(self):
+        self.check_tokenizer(nltkmodels.load_sentence_tokenizer())
+
+    def test_max_sentence_size(self):
+        text = "word " * 1000 + "end."
+        sentences = list(textpipeline.stream_sentences(chunks_of(text, 64), textpipeline.FastSentenceTokenizer(),
+                max_sentence_size=256))
+
+        # The run on sentence is cut, but no word is lost or split
+        self.assertGreater(len(sentences), 1)
+        self.assertEqual(" ".join(sentences).split(), text.split())
+    #END test_max_sentence_size
+
+#END ChunkBoundaryTest
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+Tests of the incremental metrics of trajectory.py against graphs built
+from scratch.
+"""
+
+import collections
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+import trajectory
+from bigramgraph import BigramGraph
+
+
+def random_sentences(seed, count=200, words=60):
+
+    random = np.random.RandomState(seed)
+
+    sentences = []
+    for i in range(count):
+        length = random.randint(1, 12)
+        ids = np.minimum(random.zipf(1.5, size=length), words) - 1
+        sentences.append(["" if word == 0 else "w%d" % word for word in ids.tolist()])
+    #END for
+
+    return sentences
+
+#END random_sentences
+
+"""
+The graph of sentences as graphalyzer.nltk_parse builds it.
+"""
+def build(sentences):
+
+    graph = BigramGraph()
+    for word_list in sentences:
+        previous = -1
+        for word in word_list:
+            word_id = graph.add_node(word)
+            if previous != -1:
+                graph.add_edge(previous, word_id)
+            previous = word_id if word != "" else -1
+        #END for
+    #END for
+    graph.finish()
+
+    return graph
+
+#END build
+
+class IncrementalMetricsTest(unittest.TestCase):
+
+    def assertMetricsEqual(self, got, expected):
+        for name in ["da", "ivd", "ivdnorm", "si", "sinorm", "nec", "aec"]:
+            if np.isnan(expected[name]):
+                self.assertTrue(np.isnan(got[name]), name)
+            else:
+                self.assertAlmostEqual(got[name], expected[name], places=6, msg=name)
+        #END for
+    #END assertMetricsEqual
+
+    def test_sliding_window(self):
+        sentences = random_sentences(1)
+        window = 25
+
+        incremental = trajectory.IncrementalMetrics()
+        added = collections.deque()
+        for i, word_list in enumerate(sentences):
+            added.append(incremental.add_sentence(word_list))
+            if len(added) > window:
+                incremental.remove_sentence(added.popleft())
+
+            if i % 10 == 0:
+                first = max(0, i + 1 - window)
+                graph = build(sentences[first:i + 1])
+                self.assertEqual(incremental.edges, graph.number_of_edges())
+                self.assertMetricsEqual(incremental.metrics(assortativity=True), metrics.compute_metrics(graph))
+            #END if
+        #END for
+    #END test_sliding_window
+
+    def test_reset(self):
+        sentences = random_sentences(2)
+
+        incremental = trajectory.IncrementalMetrics()
+        for word_list in sentences[:50]:
+            incremental.add_sentence(word_list)
+        incremental.reset()
+        for word_list in sentences[50:]:
+            incremental.add_sentence(word_list)
+
+        self.assertMetricsEqual(incremental.metrics(assortativity=True), metrics.compute_metrics(build(sentences[50:])))
+    #END test_reset
+
+    def test_empty_window(self):
+        results = trajectory.IncrementalMetrics().metrics()
+
+        self.assertEqual(results["ivd"], 0.0)
+        self.assertTrue(np.isnan(results["ivdnorm"]))
+    #END test_empty_window
+
+#END IncrementalMetricsTest
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,304 @@
+"""
+     This file is part of Gutenberg Graphalyzer
+     Gutenberg Graphalyzer is free software: you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     Gutenberg Graphalyzer is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU General Public License for more details.
+
+     You should have received a copy of the GNU General Public License
+     along with Gutenberg Graphalyzer.  If not, see <http://www.gnu.org/licenses/>.
+
+Streaming text pipeline used by nltk_parse.
+
+The file is memory mapped and the Project Gutenberg START and END markers
+are found with a bytes level search, so only the body is decoded. The
+body is read in fixed size chunks, split in to sentences
+incrementally with the Punkt sentence tokenizer and turned in to one word
+list per sentence. Every stage is a generator, so only the current chunk
+and the sentence that straddles the chunk boundary are held in memory.
+
+Two tokenizers are available. The NLTK one uses Punkt for sentences and
+word_tokenize for words. The fast one below does the same job with a few
+compiled regular expressions; tokenizer-agreement.py measures how far its
+output drifts from NLTK's.
+"""
+
+import codecs
+import locale
+import mmap
+import re
+import sys
+
+import profiler
+
+# Project Gutenberg header and footer markers
+START_MARKER = re.compile(br"\*\*\*\s{0,1}START OF")
+END_MARKER = re.compile(br"\*\*\*\s{0,1}END\s*OF")
+
+# Characters read from the text per chunk
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+# A sentence longer than this is cut at the chunk boundary rather than
+# buffered, which bounds memory on texts with no sentence breaks.
+MAX_SENTENCE_SIZE = 1 << 20
+
+
+"""
+Finds the body of a Project Gutenberg text in a bytes like object such as
+an mmap. Returns (start, end) offsets: the body starts on the line after
+the START marker and ends with the line holding the END marker, which is
+kept so the sentence holding it can still be dropped like before. A
+missing START marker starts the body at 0 and a missing END marker ends
+it at the end of the file; found is False if either was missing.
+"""
+def find_body(data):
+
+    start = 0
+    end = len(data)
+    found = True
+
+    match = START_MARKER.search(data)
+    if match is not None:
+        newline = data.find(b"\n", match.end())
+        start = end if newline == -1 else newline + 1
+    else:
+        found = False
+    #END if
+
+    match = END_MARKER.search(data, start)
+    if match is not None:
+        newline = data.find(b"\n", match.end())
+        end = end if newline == -1 else newline + 1
+    else:
+        found = False
+    #END if
+
+    return start, end, found
+
+#END find_body
+
+"""
+Yields the body of a text file in chunks of about chunk_size characters.
+
+The file is memory mapped and, when gutenberg is set, cut to the body
+with find_body, so header and license boilerplate are never decoded.
+Bytes are decoded with the locale encoding, like open() does, with
+undecodable bytes replaced; the replacement character is not ASCII so
+words holding it are dropped by the tokenizers. CRLF line endings are
+turned in to LF the same way text mode files do.
+"""
+def read_body_chunks(input_file, gutenberg=True, chunk_size=DEFAULT_CHUNK_SIZE,
+        encoding=None):
+
+    if encoding is None:
+        encoding = locale.getpreferredencoding(False)
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+
+    with open(input_file, 'rb') as input:
+        # mmap refuses empty files
+        if input.seek(0, 2) == 0:
+            return
+
+        data = mmap.mmap(input.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start, end = 0, len(data)
+            if gutenberg:
+                with profiler.stage("body_scan"):
+                    start, end, found = find_body(data)
+                if not found:
+                    sys.stderr.write("%s: missing Project Gutenberg START or END marker, "
+                            "using the rest of the file\n" % input_file)
+            #END if
+
+            carry = ""
+            for position in range(start, end, chunk_size):
+                text = carry + decoder.decode(data[position:min(position + chunk_size, end)])
+
+                # A CR at the end may be the first half of a CRLF
+                carry = ""
+                if text.endswith("\r"):
+                    text, carry = text[:-1], "\r"
+
+                if text:
+                    yield text.replace("\r\n", "\n")
+            #END for
+
+            text = carry + decoder.decode(b"", final=True)
+            if text:
+                yield text.replace("\r\n", "\n")
+        finally:
+            data.close()
+        #END try
+    #END with
+
+#END read_body_chunks
+
+"""
+Splits a stream of text chunks in to sentences.
+
+Every chunk is cut at its last whitespace so no word is split, appended
+to the unfinished tail of the previous one and the buffer is run through
+the sentence tokenizer. All sentences but the last are final and yielded;
+the last may continue in the next chunk so it stays in the buffer. Punkt
+only looks one token past a sentence break, so the breaks are the same as
+when the whole text is tokenized at once.
+"""
+def stream_sentences(chunks, tokenizer, max_sentence_size=MAX_SENTENCE_SIZE):
+
+    buffer = ""
+    carry = ""
+
+    for chunk in chunks:
+        chunk = carry + chunk
+
+        cut = max(chunk.rfind(" "), chunk.rfind("\n")) + 1
+        if cut == 0:
+            if len(chunk) <= max_sentence_size:
+                carry = chunk
+                continue
+            cut = len(chunk)
+        #END if
+
+        buffer = buffer + chunk[:cut]
+        carry = chunk[cut:]
+
+        spans = list(tokenizer.span_tokenize(buffer))
+        if len(spans) == 0:
+            continue
+
+        for start, end in spans[:-1]:
+            yield buffer[start:end]
+        #END for
+
+        # Keep the unfinished sentence unless it has grown too large
+        if len(buffer) - spans[-1][0] > max_sentence_size:
+            yield buffer[spans[-1][0]:spans[-1][1]]
+            buffer = ""
+        else:
+            buffer = buffer[spans[-1][0]:]
+        #END if
+    #END for
+
+    buffer = buffer + carry
+    for start, end in tokenizer.span_tokenize(buffer):
+        yield buffer[start:end]
+    #END for
+
+#END stream_sentences
+
+"""
+Turns a stream of sentences in to one word list per sentence. Stops at
+the first sentence the end regexp matches, e.g. Project Gutenberg's
+'*** END OF' footer marker.
+"""
+def stream_sentence_words(sentences, word_tokenizer, end_regexp=None):
+
+    for sentence in sentences:
+        if end_regexp is not None and end_regexp.search(sentence) != None:
+            return
+
+        yield word_tokenizer(sentence)
+    #END for
+
+#END stream_sentence_words
+
+"""
+Abbreviations whose period never ends a sentence and stays part of the
+word, like Punkt and word_tokenize do for the common English titles.
+"""
+ABBREVIATIONS = frozenset(["mr", "mrs", "ms", "dr", "st", "messrs", "mme", "mlle",
+        "jr", "sr", "prof", "rev", "capt", "col", "gen", "lt", "sgt", "hon", "esq"])
+
+# Sentence terminators, any closing quotes or brackets and the whitespace
+# before the next sentence, which must not start with a lower case letter.
+_SENTENCE_BREAK = re.compile(r"""[.!?]+["')\]]*\s+(?=["'(\[_]*[^\sa-z])""")
+
+"""
+One pass word tokenizer over a lowercased sentence. The alternatives, in
+order: word_tokenize's split words (can|not, gon|na, ...), plain ASCII
+words, which is most of the text and is checked early, the stem before
+n't, n't itself, the clitics 's 'm 'd 'll 're 've, abbreviations with their
+period and finally words, which may contain single hyphens, periods,
+commas, slashes and apostrophes between word characters (well-known,
+1,000.5, 3/4, o'clock).
+"""
+_WORD_TOKEN = re.compile(r"""
+      \b(?:can(?=not\b)|gon(?=na\b)|got(?=ta\b)|wan(?=na\b)|gim(?=me\b)|lem(?=me\b))
+    | [a-z0-9]+(?![\w'.,/-])
+    | \w+(?=n't\b)
+    | n't\b
+    | '(?:s|m|d|ll|re|ve)\b
+    | \b(?:%s)\.
+    | \w+(?:[-.,/]\w+|'(?!(?:s|m|d|ll|re|ve)\b)\w+)*
+    """ % "|".join(sorted(ABBREVIATIONS)), re.VERBOSE)
+
+_NON_ASCII = re.compile(r"[^\x00-\x7f]")
+
+
+"""
+Regular expression sentence splitter with the span_tokenize interface of
+the Punkt tokenizer, so stream_sentences works with either. A break is a
+run of . ! or ? followed by whitespace and anything but a lower case
+letter, unless the period belongs to a known abbreviation or a single
+initial.
+"""
+class FastSentenceTokenizer(object):
+
+    def span_tokenize(self, text):
+        start = 0
+
+        for match in _SENTENCE_BREAK.finditer(text):
+            if text[match.start()] == ".":
+                # The sentence's first word has no whitespace before it
+                # within the sentence
+                space = max(start - 1, text.rfind(" ", start, match.start()),
+                        text.rfind("\n", start, match.start()), text.rfind("\t", start, match.start()))
+                last_word = text[space + 1:match.start()]
+                last_word = last_word.lstrip("\"'([_").lower()
+
+                if last_word in ABBREVIATIONS or (len(last_word) == 1 and last_word.isalpha()):
+                    continue
+            #END if
+
+            end = match.start() + len(match.group().rstrip())
+            if end > start:
+                yield start, end
+
+            start = match.end()
+        #END for
+
+        end = len(text.rstrip())
+        if end > start:
+            yield start, end
+    #END span_tokenize
+
+#END FastSentenceTokenizer
+
+"""
+Tokenizes and normalizes one sentence in a single pass: lowercase, words
+matched by _WORD_TOKEN, '_' stripped and non-ASCII tokens dropped. Every
+token _WORD_TOKEN matches holds a word character, so the punctuation only
+filter of the NLTK path can never apply here. The strip and ASCII passes
+only run when the sentence has an '_' or a non-ASCII character at all.
+Produces the same normalized words as nltk_words in graphalyzer.py for the
+vast majority of text.
+"""
+def fast_words(sentence):
+
+    sentence = sentence.lower()
+    words = _WORD_TOKEN.findall(sentence)
+
+    if "_" in sentence:
+        words = [word.strip("_") for word in words]
+
+    if _NON_ASCII.search(sentence) is not None:
+        words = [word for word in words if _NON_ASCII.search(word) is None]
+
+    return words
+
+#END fast_words
@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+"""
+*     This file is part of Gutenberg Graphalyzer
+*     Gutenberg Graphalyzer is free software: you can redistribute it and/or modify
+*     it under the terms of the GNU General Public License as published by
+*     the Free Software Foundation, either version 3 of the License, or
+*     (at your option) any later version.
+*
+*     Gutenberg Graphalyzer is distributed in the hope that it will be useful,
+*     but WITHOUT ANY WARRANTY; without even the implied warranty of
+*     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+*     GNU General Public License for more details.
+*
+*     You should have received a copy of the GNU General Public License
+*     along with Gutenberg Graphalyzer.  If not, see <http://www.gnu.org/licenses/>.
+
+Compares the fast regular expression tokenizer (graphalyzer.py --fast)
+with the NLTK tokenizer. For every text it reports the throughput of both
+and how far the fast tokenizer's token and bigram counts diverge from the
+NLTK ones. Divergence is the share of the total count that differs:
+
+    \sum{x}{|n_x - f_x|} / (\sum{x}{n_x} + \sum{x}{f_x})
+
+0 means identical counts, 1 means nothing in common. Run it with one or
+more text files; the default is every .txt file in testfiles/.
+"""
+
+import argparse
+import collections
+import glob
+import os
+import time
+
+import graphalyzer
+
+
+"""
+Runs one tokenizer over a text and returns the token counts, the bigram
+counts (within sentences, like the graph) and the seconds it took.
+"""
+def tokenize(input_file, tokenizer):
+
+    tokens = collections.Counter()
+    bigrams = collections.Counter()
+
+    start = time.time()
+    sentences = list(graphalyzer.parse_sentences(input_file, tokenizer))
+    elapsed = time.time() - start
+
+    for word_list in sentences:
+        tokens.update(word_list)
+        bigrams.update(zip(word_list, word_list[1:]))
+    #END for
+
+    return tokens, bigrams, elapsed
+
+#END tokenize
+
+def divergence(reference, other):
+
+    total = sum(reference.values()) + sum(other.values())
+    if total == 0:
+        return 0.0
+
+    keys = set(reference) | set(other)
+    return sum(abs(reference[k] - other[k]) for k in keys) / float(total)
+
+#END divergence
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Compare the fast and NLTK tokenizers.")
+    parser.add_argument('files',
+            nargs='*',
+            help="Texts to compare. Defaults to testfiles/*.txt.")
+    parser.add_argument('-t', '--top',
+            dest="TOP",
+            type=int,
+            default=10,
+            help="Number of most divergent tokens to list for each text.")
+
+    args = parser.parse_args()
+    files = args.files
+    if not files:
+        files = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "testfiles", "*.txt")))
+
+    # Load the NLTK models up front so they are not part of the timings
+    try:
+        graphalyzer.load_tokenizer_models()
+    except LookupError as error:
+        parser.error(str(error))
+
+    all_nltk = [collections.Counter(), collections.Counter()]
+    all_fast = [collections.Counter(), collections.Counter()]
+    nltk_time = 0.0
+    fast_time = 0.0
+
+    print("%-30s %10s %12s %12s %8s %8s %8s" % ("text", "tokens", "nltk tok/s", "fast tok/s",
+        "speedup", "tok div", "bi div"))
+
+    for input_file in files:
+        n_tokens, n_bigrams, n_time = tokenize(input_file, "nltk")
+        f_tokens, f_bigrams, f_time = tokenize(input_file, "fast")
+
+        count = sum(n_tokens.values())
+        print("%-30s %10d %12.0f %12.0f %7.1fx %8.4f %8.4f" % (os.path.basename(input_file), count,
+            count / max(n_time, 1e-9), count / max(f_time, 1e-9), n_time / max(f_time, 1e-9),
+            divergence(n_tokens, f_tokens), divergence(n_bigrams, f_bigrams)))
+
+        if args.TOP > 0:
+            keys = set(n_tokens) | set(f_tokens)
+            worst = sorted(keys, key=lambda k: -abs(n_tokens[k] - f_tokens[k]))[:args.TOP]
+            for k in worst:
+                if n_tokens[k] != f_tokens[k]:
+                    print("    %-24r nltk %6d  fast %6d" % (k, n_tokens[k], f_tokens[k]))
+        #END if
+
+        all_nltk[0].update(n_tokens)
+        all_nltk[1].update(n_bigrams)
+        all_fast[0].update(f_tokens)
+        all_fast[1].update(f_bigrams)
+        nltk_time = nltk_time + n_time
+        fast_time = fast_time + f_time
+    #END for
+
+    count = sum(all_nltk[0].values())
+    print("%-30s %10d %12.0f %12.0f %7.1fx %8.4f %8.4f" % ("TOTAL", count,
+        count / max(nltk_time, 1e-9), count / max(fast_time, 1e-9), nltk_time / max(fast_time, 1e-9),
+        divergence(all_nltk[0], all_fast[0]), divergence(all_nltk[1], all_fast[1])))
+
+#END main
+
+if __name__ == "__main__":
+    main()
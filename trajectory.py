@@ -0,0 +1,379 @@
+"""
+     This file is part of Gutenberg Graphalyzer
+     Gutenberg Graphalyzer is free software: you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation, either version 3 of the License, or
+     (at your option) any later version.
+
+     Gutenberg Graphalyzer is distributed in the hope that it will be useful,
+     but WITHOUT ANY WARRANTY; without even the implied warranty of
+     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+     GNU General Public License for more details.
+
+     You should have received a copy of the GNU General Public License
+     along with Gutenberg Graphalyzer.  If not, see <http://www.gnu.org/licenses/>.
+
+Metric trajectories over the course of a single book.
+
+IncrementalMetrics keeps the bigram counts of a window of text together
+with the running sums the metrics are made of:
+
+    Ivd = \sum{i}{a_i log_2 a_i}       a_i, the out degree of word i
+    SI  = W log_2 W - \sum{i}{w_i log_2 w_i}
+                                       w_i, the bigrams starting at word i
+                                       W, every bigram
+    NEC, AEC                           node, edge and self loop counts
+
+Adding or removing one bigram changes one a_i, one w_i and W by at most
+one, so every sum is updated in O(1) by taking out the old term and
+putting in the new one. A checkpoint then costs O(1) as well, and the
+trajectory of a whole book about as much as parsing it once. Degree
+assortativity is a correlation over every edge whose terms all change
+when a degree does, so it is only computed on request, from the edge
+table, at O(E) per checkpoint.
+
+trajectory() drives it from the sentences of graphalyzer.parse_sentences:
+cumulatively from the start of the book, over a sliding window of the
+last N sentences or over each chapter on its own. graphalyzer.py
+trajectory is the command line front end.
+"""
+
+import collections
+import math
+import numpy as np
+
+import metrics
+
+# A sentence starting with one of these words opens a new chapter
+CHAPTER_WORDS = frozenset(["chapter"])
+
+TRAJECTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trajectories(
+    runID INTEGER PRIMARY KEY ASC,
+    versionnumber INTEGER, -- Version of the software used for the experiments
+    etextID INTEGER,
+    mode TEXT,             -- cumulative, window or chapter
+    point INTEGER,         -- Index of the checkpoint in the book
+    sentences INTEGER,     -- Sentences read up to the checkpoint
+    tokens INTEGER,        -- Words read up to the checkpoint
+    nodes INTEGER,
+    edges INTEGER,
+    %s
+);
+CREATE INDEX IF NOT EXISTS trajectories_etextID ON trajectories(etextID, mode, point);
+""" % ",\n    ".join("%s REAL" % name for name in metrics.METRIC_NAMES)
+
+TRAJECTORY_COLUMNS = ["versionnumber", "etextID", "mode", "point", "sentences", "tokens",
+        "nodes", "edges"] + metrics.METRIC_NAMES
+
+# Packed edge keys, as in bigramgraph.py
+KEY_SHIFT = 32
+KEY_MASK = (1 << KEY_SHIFT) - 1
+
+
+"""
+Bigram graph of a window of text with its metric sums maintained under
+insertion and removal. Words are interned to IDs like BigramGraph does;
+a word is a node while at least one of its occurrences is in the window.
+"""
+class IncrementalMetrics(object):
+
+    def __init__(self):
+        self.word_to_id = {}
+        self.words = []
+
+        # Per word: occurrences in the window, out degree, in degree and
+        # out strength (bigrams starting at the word)
+        self._tokens = []
+        self._out_degree = []
+        self._in_degree = []
+        self._out_strength = []
+
+        # Packed bigram key to its count in the window
+        self._edges = {}
+
+        self.nodes = 0
+        self.edges = 0
+        self.selfloops = 0
+        self.weight = 0
+
+        # \sum a_i log_2 a_i and \sum w_i log_2 w_i
+        self._ivd = 0.0
+        self._strength_info = 0.0
+
+        # k log_2 k for every k up to the largest count seen
+        self._xlogx = [0.0, 0.0]
+    #END __init__
+
+    def _grow_xlogx(self, k):
+        table = self._xlogx
+        for i in range(len(table), max(k + 1, 2 * len(table))):
+            table.append(i * math.log2(i))
+    #END _grow_xlogx
+
+    """
+    Interns a word and returns its ID.
+    """
+    def word_id(self, word):
+        word_id = self.word_to_id.get(word)
+
+        if word_id is None:
+            word_id = len(self.words)
+            self.word_to_id[word] = word_id
+            self.words.append(word)
+            self._tokens.append(0)
+            self._out_degree.append(0)
+            self._in_degree.append(0)
+            self._out_strength.append(0)
+        #END if
+
+        return word_id
+    #END word_id
+
+    def add_token(self, word_id):
+        if self._tokens[word_id] == 0:
+            self.nodes = self.nodes + 1
+        self._tokens[word_id] = self._tokens[word_id] + 1
+    #END add_token
+
+    def remove_token(self, word_id):
+        self._tokens[word_id] = self._tokens[word_id] - 1
+        if self._tokens[word_id] == 0:
+            self.nodes = self.nodes - 1
+    #END remove_token
+
+    """
+    Counts one more src -> dst bigram.
+    """
+    def add_bigram(self, src, dst):
+        key = (src << KEY_SHIFT) | dst
+        count = self._edges.get(key, 0)
+        self._edges[key] = count + 1
+
+        xlogx = self._xlogx
+        if count == 0:
+            self.edges = self.edges + 1
+            if src == dst:
+                self.selfloops = self.selfloops + 1
+
+            degree = self._out_degree[src]
+            if degree + 1 >= len(xlogx):
+                self._grow_xlogx(degree + 1)
+            self._ivd = self._ivd + xlogx[degree + 1] - xlogx[degree]
+            self._out_degree[src] = degree + 1
+            self._in_degree[dst] = self._in_degree[dst] + 1
+        #END if
+
+        strength = self._out_strength[src]
+        if strength + 1 >= len(xlogx):
+            self._grow_xlogx(strength + 1)
+        self._strength_info = self._strength_info + xlogx[strength + 1] - xlogx[strength]
+        self._out_strength[src] = strength + 1
+        self.weight = self.weight + 1
+    #END add_bigram
+
+    """
+    Takes back one src -> dst bigram added before.
+    """
+    def remove_bigram(self, src, dst):
+        key = (src << KEY_SHIFT) | dst
+        count = self._edges[key]
+
+        xlogx = self._xlogx
+        if count == 1:
+            del self._edges[key]
+            self.edges = self.edges - 1
+            if src == dst:
+                self.selfloops = self.selfloops - 1
+
+            degree = self._out_degree[src]
+            self._ivd = self._ivd + xlogx[degree - 1] - xlogx[degree]
+            self._out_degree[src] = degree - 1
+            self._in_degree[dst] = self._in_degree[dst] - 1
+        else:
+            self._edges[key] = count - 1
+        #END if
+
+        strength = self._out_strength[src]
+        self._strength_info = self._strength_info + xlogx[strength - 1] - xlogx[strength]
+        self._out_strength[src] = strength - 1
+        self.weight = self.weight - 1
+    #END remove_bigram
+
+    """
+    Adds the words of a sentence and the bigrams between them, like
+    graphalyzer.nltk_parse does: no bigram starts at an empty word.
+    Returns the word IDs, which is what remove_sentence takes.
+    """
+    def add_sentence(self, word_list):
+        ids = [self.word_id(word) for word in word_list]
+
+        previous = -1
+        for word_id in ids:
+            self.add_token(word_id)
+            if previous != -1:
+                self.add_bigram(previous, word_id)
+            previous = word_id if self.words[word_id] != "" else -1
+        #END for
+
+        return ids
+    #END add_sentence
+
+    def remove_sentence(self, ids):
+        previous = -1
+        for word_id in ids:
+            self.remove_token(word_id)
+            if previous != -1:
+                self.remove_bigram(previous, word_id)
+            previous = word_id if self.words[word_id] != "" else -1
+        #END for
+    #END remove_sentence
+
+    """
+    Degree assortativity of the window, from every edge. O(E).
+    """
+    def degree_assortativity(self):
+        keys = np.fromiter(self._edges.keys(), dtype=np.int64, count=len(self._edges))
+
+        return metrics.degree_assortativity(keys >> KEY_SHIFT, keys & KEY_MASK,
+                np.array(self._out_degree, dtype=np.int64), np.array(self._in_degree, dtype=np.int64))
+    #END degree_assortativity
+
+    """
+    The metrics of the window in a dictionary keyed like
+    metrics.compute_metrics. da is NaN unless assortativity is set, and
+    the per node values are NaN for an empty window.
+    """
+    def metrics(self, assortativity=False):
+        nan = float("nan")
+
+        weight = self.weight
+        si = weight * math.log2(weight) - self._strength_info if weight > 0 else 0.0
+
+        results = {
+            "da": self.degree_assortativity() if assortativity else nan,
+            "ivd": self._ivd,
+            "ivdnorm": nan,
+            "si": si,
+            "sinorm": nan,
+            "nec": nan,
+            "aec": nan,
+        }
+
+        if self.nodes > 0:
+            results["ivdnorm"] = self._ivd / self.nodes
+            results["sinorm"] = si / self.nodes
+            results["aec"] = metrics.average_edge_complexity(self.nodes, self.edges)
+            if self.nodes > 1 or self.selfloops > 0:
+                results["nec"] = metrics.normalized_edge_complexity(self.nodes, self.edges, self.selfloops)
+        #END if
+
+        return results
+    #END metrics
+
+    """
+    Empties the window but keeps the vocabulary.
+    """
+    def reset(self):
+        for i in range(len(self.words)):
+            self._tokens[i] = 0
+            self._out_degree[i] = 0
+            self._in_degree[i] = 0
+            self._out_strength[i] = 0
+        #END for
+
+        self._edges = {}
+        self.nodes = self.edges = self.selfloops = self.weight = 0
+        self._ivd = self._strength_info = 0.0
+    #END reset
+
+#END IncrementalMetrics
+
+def is_chapter_heading(word_list):
+
+    return len(word_list) > 0 and word_list[0] in CHAPTER_WORDS
+
+#END is_chapter_heading
+
+"""
+Yields (mode, point, sentences, tokens, nodes, edges, results) for every
+checkpoint of a book given its sentences as word lists.
+
+    every     -- checkpoint after every this many sentences
+    window    -- only the last this many sentences are in the graph;
+                 otherwise it holds everything read so far
+    chapters  -- checkpoint at the end of every chapter, with the graph
+                 of that chapter alone; every and window do not apply
+
+The last sentence always ends a checkpoint, so the last point of a
+cumulative trajectory has the metrics of the whole book.
+"""
+def trajectory(sentences, every=None, window=None, chapters=False, assortativity=False):
+
+    if chapters and (every is not None or window is not None):
+        raise ValueError("chapter trajectories take neither every nor window")
+    if not chapters and every is None:
+        raise ValueError("every is needed unless the trajectory is per chapter")
+    if (every is not None and every < 1) or (window is not None and window < 1):
+        raise ValueError("every and window must be positive")
+
+    mode = "chapter" if chapters else ("window" if window is not None else "cumulative")
+
+    return _points(sentences, mode, every, window, chapters, assortativity)
+
+#END trajectory
+
+def _points(sentences, mode, every, window, chapters, assortativity):
+
+    state = IncrementalMetrics()
+    recent = collections.deque()
+    point = 0
+    read = 0
+    tokens = 0
+    pending = False
+
+    for word_list in sentences:
+        if chapters and pending and is_chapter_heading(word_list):
+            yield (mode, point, read, tokens, state.nodes, state.edges, state.metrics(assortativity))
+            point = point + 1
+            state.reset()
+            pending = False
+        #END if
+
+        ids = state.add_sentence(word_list)
+        read = read + 1
+        tokens = tokens + len(ids)
+        pending = True
+
+        if window is not None:
+            recent.append(ids)
+            if len(recent) > window:
+                state.remove_sentence(recent.popleft())
+        #END if
+
+        if every is not None and read % every == 0:
+            yield (mode, point, read, tokens, state.nodes, state.edges, state.metrics(assortativity))
+            point = point + 1
+            pending = False
+        #END if
+    #END for
+
+    if pending:
+        yield (mode, point, read, tokens, state.nodes, state.edges, state.metrics(assortativity))
+
+#END _points
+
+def create_schema(dbconn):
+
+    dbconn.executescript(TRAJECTORY_SCHEMA)
+    dbconn.commit()
+
+#END create_schema
+
+def store_trajectory(dbconn, rows):
+
+    dbconn.executemany("INSERT INTO trajectories(%s) VALUES (%s)" %
+            (", ".join(TRAJECTORY_COLUMNS), ", ".join("?" * len(TRAJECTORY_COLUMNS))), rows)
+    dbconn.commit()
+
+#END store_trajectory